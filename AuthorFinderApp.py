@@ -1,15 +1,21 @@
-from typing import List
+from typing import List, Tuple
+from collections import namedtuple
 
 from ChatGPTClient import ChatGPTClient, TimeWindow
-from BooleanSearchClient import BooleanSearchClient
+from BooleanSearchClient import BooleanSearchClient, ProbeResult
+from RateLimiter import RateLimiter
+from BooleanStringValidator import InvalidBooleanStringError
 from JsonIO import BooleanStringJsonIO, SIVectorQueryMappingJsonIO, SiBooleanStringMappingJsonIO, VectorQueryJsonIO
 from VectorSearchClient import VectorSearchClient
+from AuthorRanker import AuthorRanker
 from UserInputClient import UserInputClient, UserResponse
 from WebScrapper import WebScapper, WebInfo
-from DBClient import DBClient, SearchEngine
+from DBClient import DBClient, QuerySource, SearchEngine
 from ProjectSecrets import Secrets
 from Config import Config
 
+SearchResult = namedtuple('SearchResult', ('n_results', 'n_authors'))
+
 class AuthorFinderApp():
     """
     This app is to help finding authors for special issues
@@ -26,6 +32,8 @@ class AuthorFinderApp():
         self.siid_boolean_string_mapping_json_io = SiBooleanStringMappingJsonIO()
         self.vector_query_json_io = VectorQueryJsonIO()
         self.vector_query_json_io_mapping_json_io = SIVectorQueryMappingJsonIO()
+        self.dbClient = DBClient.shared(Config.DB_FILENAME)
+        self.authorRanker = AuthorRanker()
         self.quiet = False
 
     def start(self, landing_page_url: str, 
@@ -45,12 +53,114 @@ class AuthorFinderApp():
         self.quiet = quiet
         if not self.quiet: 
             print(f"Finding author for url: {landing_page_url}")
-        web_info: WebInfo = self.scrapper.extract(landing_page_url)
+        web_info: WebInfo = self.scrape(landing_page_url)
 
         if use == "BooleanSearch":
             self._boolean_search(web_info, landing_page_url, ask_before_retrieval, n_top_entries)
         if use == "VectorSearch":
             self._vector_search(web_info, landing_page_url, ask_before_retrieval, n_top_entries)
+
+    def scrape(self, landing_page_url: str) -> WebInfo:
+        return self.scrapper.extract(landing_page_url)
+
+    def generate_boolean_string(self, web_info: WebInfo, landing_page_url: str, feedback: str|None = None) -> str:
+        """
+        :param feedback: reason the previous boolean string was rejected, passed on to the LLM
+        """
+        boolean_string = self.chatGPT.boolean_string_from(web_info, feedback=feedback)
+        self.siid_boolean_string_mapping_json_io.write(landing_page_url, boolean_string)
+        self.dbClient.add_boolean_string(boolean_string, QuerySource.chatGPT)
+        return boolean_string
+
+    def validate_boolean_string(self, boolean_string: str, n_top_entries: int = Config.BOOLEAN_SEARCH_PAGE_SIZE,
+                                asjc_codes: Tuple[str, ...]|None = None,
+                                priority: int = RateLimiter.INTERACTIVE) -> ProbeResult:
+        """
+        check the boolean string locally then probe scopus with it; raise InvalidBooleanStringError
+        (a RuntimeError) with the reason if it is rejected.
+        The probe also holds the total count and the first page, for retrieve_boolean_entries
+        :param asjc_codes: ASJC codes of the journal the boolean string was generated with
+        :param priority: of the scopus requests, see RateLimiter
+        """
+        probe = self.booleanSearchClient.probe(boolean_string,
+                                               page_size=min(Config.BOOLEAN_SEARCH_PAGE_SIZE, n_top_entries),
+                                               asjc_codes=asjc_codes,
+                                               priority=priority)
+        if probe.is_invalid:
+            raise InvalidBooleanStringError(boolean_string, probe.reason)
+        return probe
+
+    def generate_valid_boolean_string(self, web_info: WebInfo, landing_page_url: str,
+                                      n_top_entries: int = 20_000) -> Tuple[str, ProbeResult]:
+        """
+        generate and validate a boolean string, regenerating it with the reason of the
+        rejection up to Config.BOOLEAN_STRING_MAX_ATTEMPTS times.
+        Raise the InvalidBooleanStringError of the last attempt if none is valid
+        """
+        feedback = None
+        for attempt in range(Config.BOOLEAN_STRING_MAX_ATTEMPTS):
+            boolean_string = self.generate_boolean_string(web_info, landing_page_url, feedback=feedback)
+            try:
+                return boolean_string, self.validate_boolean_string(boolean_string, n_top_entries, web_info.asjc_codes)
+            except InvalidBooleanStringError as e:
+                if attempt == Config.BOOLEAN_STRING_MAX_ATTEMPTS - 1:
+                    raise
+                if not self.quiet:
+                    print(f"Boolean string rejected ({e.reason}), asking ChatGPT again ...")
+                feedback = e.reason
+
+    def retrieve_boolean_entries(self, boolean_string: str, n_top_entries: int, probe: ProbeResult|None = None,
+                                 priority: int = RateLimiter.INTERACTIVE) -> SearchResult:
+        self.booleanSearchClient.retrieve_top_entries(boolean_string,
+                                                      n_top_entries=n_top_entries,
+                                                      dbClient=self.dbClient,
+                                                      probe=probe,
+                                                      priority=priority)
+        n_results = self.boolean_string_json_io.get_total_results(boolean_string)
+        n_authors = len(self.boolean_string_json_io.get_author_index(boolean_string))
+        return SearchResult(n_results=n_results, n_authors=n_authors)
+
+    def get_interrupted_boolean_strings(self) -> List[str]:
+        return self.boolean_string_json_io.get_checkpointed_boolean_strings()
+
+    def resume_boolean_entries(self, boolean_string: str) -> SearchResult:
+        """
+        finish a retrieval of retrieve_boolean_entries that was interrupted, from its last checkpoint
+        """
+        if not self.booleanSearchClient.resume_top_entries(boolean_string, dbClient=self.dbClient):
+            raise RuntimeError(f"no checkpoint to resume from for the boolean string:\n{boolean_string}")
+        n_results = self.boolean_string_json_io.get_total_results(boolean_string)
+        n_authors = len(self.boolean_string_json_io.get_author_index(boolean_string))
+        return SearchResult(n_results=n_results, n_authors=n_authors)
+
+    def shortlist_authors(self, query: str, use: SearchEngine = SearchEngine.BooleanSearch,
+                          top_k: int = Config.AUTHOR_RANKING_TOP_K) -> str:
+        """
+        rank the authors of the retrieved entries and save the top_k of them as a csv.
+        Return the filepath of the shortlist
+        """
+        json_io = self.boolean_string_json_io if use == SearchEngine.BooleanSearch else self.vector_query_json_io
+        ranked_authors = self.authorRanker.top_k(json_io.get_author_index(query), top_k)
+        filepath = f"{Config.SHORTLIST_OUTPUT_FOLDER}/{json_io._filename_from(query)}.csv"
+        self.authorRanker.write_shortlist(filepath, ranked_authors)
+        return filepath
+
+    def generate_query_string(self, web_info: WebInfo, landing_page_url: str) -> str:
+        query_keywords: List[str] = self.chatGPT.keywords_from(web_info)
+        query_string = ", ".join(query_keywords)
+        self.vector_query_json_io_mapping_json_io.write(landing_page_url, query_string)
+        self.dbClient.add_query_string(query_string)
+        return query_string
+
+    def retrieve_vector_entries(self, query_string: str, n_top_entries: int) -> SearchResult:
+        n_results = self.vectorSearchClient.retrieve_top_entries(query_string, n_top_entries=n_top_entries)
+        qid = self.dbClient.get_latest_qid(query_string, use=SearchEngine.VectorSearch)
+        if qid == 0:
+            qid = self.dbClient.add_query_string(query_string)
+        entries = self.vector_query_json_io.read(query_string).get('entries', [])
+        self.dbClient.add_entries(qid, entries, use=SearchEngine.VectorSearch)
+        n_authors = len(self.vector_query_json_io.get_author_index(query_string))
+        return SearchResult(n_results=n_results, n_authors=n_authors)
         
     def _boolean_search(self, web_info: WebInfo, 
                         landing_page_url: str,
@@ -65,23 +175,20 @@ class AuthorFinderApp():
           If false, it will use the generated query to fetch top n results. 
         :param top_n_results: number of top results user what to retrieve. Default 2000
         """
-        # init boolean string
-        boolean_string = self.chatGPT.boolean_string_from(web_info)
-        self.siid_boolean_string_mapping_json_io.write(landing_page_url, boolean_string)
-        if not self.quiet: 
-            print("ChatGPT conceived a boolean string for you ...")
-        
-        # validate boolean string. If invalid, exit
-        if self.booleanSearchClient.is_invalid_input(boolean_string):
+        # init and validate boolean string. If still invalid, exit
+        try:
+            boolean_string, probe = self.generate_valid_boolean_string(web_info, landing_page_url, n_top_entries)
+            if not self.quiet: 
+                print("ChatGPT conceived a boolean string for you ...")
+        except RuntimeError:
             if not self.quiet: 
                 print("ChatGPT cannot give a valid boolean string. exit process")
-            raise RuntimeError(f"the generated Boolean string is invalid:\n{boolean_string}")
+            raise
         
         # if user what to decide if we want to proceed with the query and store all the result
         user_response: UserResponse = UserResponse(accepted=False)
         if ask_before_retrieval:
-            n_result = self.booleanSearchClient.num_results(boolean_string)
-            user_response = self.userInput.are_you_happy_with(boolean_string, n_result, use=SearchEngine.BooleanSearch)
+            user_response = self.userInput.are_you_happy_with(boolean_string, probe.total_results, use=SearchEngine.BooleanSearch)
         if (ask_before_retrieval) and (not user_response.accepted):
             if not self.quiet: 
                 print("You are not happy with the boolean. exit process")
@@ -93,18 +200,17 @@ class AuthorFinderApp():
         # retrieve entries
         if not self.quiet: 
             print("Retrieving results for you ...")
-        self.booleanSearchClient.retrieve_top_entries(boolean_string,
-                                                      n_top_entries=n_top_entries,
-                                                      dbClient=None)
+        search_result = self.retrieve_boolean_entries(boolean_string, n_top_entries, probe=probe)
         
         # display result
         filename = self.boolean_string_json_io._filename_from(boolean_string)
         if not self.quiet: 
             print(f"Saved to {Config.BOOLEAN_STRING_OUTPUT_FOLDER}/{filename}.")
-        n_results = self.boolean_string_json_io.get_total_results(boolean_string)
-        n_authors = len(self.boolean_string_json_io.get_auids(boolean_string))
         if not self.quiet: 
-            print(f"Got {n_results} results, {n_authors} authors.")
+            print(f"Got {search_result.n_results} results, {search_result.n_authors} authors.")
+        shortlist_filepath = self.shortlist_authors(boolean_string, use=SearchEngine.BooleanSearch)
+        if not self.quiet: 
+            print(f"Shortlisted the top {Config.AUTHOR_RANKING_TOP_K} authors to {shortlist_filepath}.")
 
 
     def _vector_search(self, web_info: WebInfo, 
@@ -120,16 +226,14 @@ class AuthorFinderApp():
         :param top_n_results: number of top results user what to retrieve. Default 500
         """
         # init vector search keywords
-        query_keywords: List[str] = self.chatGPT.keywords_from(web_info)
-        query_string = ", ".join(query_keywords)
-        self.vector_query_json_io_mapping_json_io.write(landing_page_url, query_string)
+        query_string = self.generate_query_string(web_info, landing_page_url)
         if not self.quiet: 
             print("ChatGPT conceived a query string for you ...")
 
         # if user what to decide if we want to proceed with the query and store all the result
         user_response: UserResponse = UserResponse(accepted=False)
         if ask_before_retrieval:
-            n_result = self.vectorSearchClient.num_results(query_string)
+            n_result = self.vectorSearchClient.num_results(query_string, max_results=n_top_entries)
             user_response = self.userInput.are_you_happy_with(query_string, n_result, use=SearchEngine.VectorSearch)
         if (ask_before_retrieval) and (not user_response.accepted):
             if not self.quiet: 
@@ -142,16 +246,17 @@ class AuthorFinderApp():
         # retrieve entries
         if not self.quiet: 
             print("Retrieving results for you ...")
-        self.vectorSearchClient.retrieve_top_entries(query_string, n_top_entries=n_top_entries)
+        search_result = self.retrieve_vector_entries(query_string, n_top_entries)
         
         # display result
         filename = self.vector_query_json_io._filename_from(query_string)
         if not self.quiet: 
             print(f"Saved to {Config.BOOLEAN_STRING_OUTPUT_FOLDER}/{filename}.")
-        n_results = self.vector_query_json_io.get_total_results(query_string)
-        n_authors = len(self.vector_query_json_io.get_auids(query_string))
         if not self.quiet: 
-            print(f"Got {n_results} results, {n_authors} authors.")
+            print(f"Got {search_result.n_results} results, {search_result.n_authors} authors.")
+        shortlist_filepath = self.shortlist_authors(query_string, use=SearchEngine.VectorSearch)
+        if not self.quiet: 
+            print(f"Shortlisted the top {Config.AUTHOR_RANKING_TOP_K} authors to {shortlist_filepath}.")
 
 
 ######################################################################################
@@ -0,0 +1,114 @@
+import os
+import threading
+from dataclasses import dataclass, fields
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+
+@dataclass
+class AuthorIndex:
+    """
+    Columnar index of the authors of the entries retrieved for one query, one row per author,
+    sorted by auid. Each column is saved as its own .npy file, so a saved index can be
+    memory-mapped and ranked with vectorized numpy operations without re-reading the entries.
+    """
+    auid: np.ndarray  # str
+    n_papers: np.ndarray  # int32, papers of the author among the entries
+    total_citations: np.ndarray  # int64, summed citedby_count of those papers
+    latest_year: np.ndarray  # int16, most recent publication year, 0 if unknown
+    name: np.ndarray  # str, "surname, firstname"
+    max_relevance: np.ndarray  # float32, best relevance of those papers, 0 for boolean search
+
+    def __len__(self) -> int:
+        return len(self.auid)
+
+    def row(self, auid: str) -> Dict[str, Any]|None:
+        i = int(np.searchsorted(self.auid, auid))
+        if (i == len(self)) or (self.auid[i] != auid):
+            return None
+        return { field.name: getattr(self, field.name)[i].item() for field in fields(self) }
+
+    def save(self, folder: str) -> None:
+        os.makedirs(folder, exist_ok=True)
+        for field in fields(self):
+            filepath = f"{folder}/{field.name}.npy"
+            tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_filepath, 'wb') as fp:
+                np.save(fp, getattr(self, field.name))
+            os.replace(tmp_filepath, filepath)
+
+    @classmethod
+    def exists(cls, folder: str) -> bool:
+        return all(os.path.exists(f"{folder}/{field.name}.npy") for field in fields(cls))
+
+    @classmethod
+    def load(cls, folder: str, mmap: bool = True) -> 'AuthorIndex':
+        mmap_mode = 'r' if mmap else None
+        return cls(**{ field.name: np.load(f"{folder}/{field.name}.npy", mmap_mode=mmap_mode) for field in fields(cls) })
+
+
+class AuthorIndexBuilder:
+    """
+    accumulate the authors of the normalized entries of one query, page by page, into an AuthorIndex
+    """
+    def __init__(self) -> None:
+        self._rows: Dict[str, List[Any]] = {}  # auid -> [n_papers, total_citations, latest_year, name, max_relevance]
+
+    def add(self, entries: Iterable[Dict[str, Any]]) -> None:
+        for entry in entries:
+            citations = self._int_from(entry.get('citedby_count'))
+            year = self._year_from(entry)
+            relevance = float(entry.get('relevance') or 0)
+            for author in entry.get('authors') or []:
+                auid = author.get('auid')
+                if auid is None:
+                    continue
+                row = self._rows.get(auid)
+                if row is None:
+                    self._rows[auid] = [1, citations, year, self._name_from(author), relevance]
+                    continue
+                row[0] += 1
+                row[1] += citations
+                row[2] = max(row[2], year)
+                row[3] = row[3] or self._name_from(author)
+                row[4] = max(row[4], relevance)
+
+    def build(self) -> AuthorIndex:
+        auids = sorted(self._rows)
+        rows = [self._rows[auid] for auid in auids]
+        return AuthorIndex(auid=np.array(auids, dtype=str),
+                           n_papers=np.array([row[0] for row in rows], dtype=np.int32),
+                           total_citations=np.array([row[1] for row in rows], dtype=np.int64),
+                           latest_year=np.array([row[2] for row in rows], dtype=np.int16),
+                           name=np.array([row[3] for row in rows], dtype=str),
+                           max_relevance=np.array([row[4] for row in rows], dtype=np.float32))
+
+    def _name_from(self, author: Dict[str, Any]) -> str:
+        names = [author.get('surname'), author.get('firstname')]
+        return ', '.join(name for name in names if name)
+
+    def _year_from(self, entry: Dict[str, Any]) -> int:
+        # boolean search entries have cover_date 'YYYY-MM-DD', vector search ones pub_year
+        year = entry.get('pub_year') or (entry.get('cover_date') or '')[:4]
+        return self._int_from(year)
+
+    def _int_from(self, value: Any) -> int:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return 0
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    builder = AuthorIndexBuilder()
+    builder.add([{'eid': '1', 'citedby_count': '10', 'cover_date': '2021-03-01',
+                  'authors': [{'auid': 'a1', 'surname': 'Smith', 'firstname': 'J.'}, {'auid': 'a2'}]},
+                 {'eid': '2', 'citedby_count': '3', 'cover_date': '2023-01-01',
+                  'authors': [{'auid': 'a1', 'surname': 'Smith', 'firstname': 'J.'}]}])
+    builder.build().save("cache/test_author_index")
+    author_index = AuthorIndex.load("cache/test_author_index")
+    print(len(author_index), author_index.row('a1'))
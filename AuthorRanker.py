@@ -0,0 +1,111 @@
+import csv
+import os
+from collections import namedtuple
+from datetime import date
+from typing import Dict, List
+
+import numpy as np
+
+from AuthorIndex import AuthorIndex
+from Config import Config
+
+RankedAuthor = namedtuple('RankedAuthor', ('rank', 'auid', 'name', 'score', 'n_papers', 'total_citations', 'latest_year', 'max_relevance'))
+
+class AuthorRanker:
+    """
+    Score the authors of an AuthorIndex and shortlist the best ones for the special issue.
+    The score is a weighted sum of features scaled to [0, 1]:
+    - citations: log of the total citations of the author's papers, over the best author's
+    - recency: how recent the latest paper is, 0 if older than recency_years
+    - relevance: best vector search relevance of the author's papers, over the best author's.
+      Always 0 for boolean search results, which leaves the order of the others unchanged
+    - papers: log of the number of papers among the results, over the best author's
+    All columns are scored at once, so it stays well under a second for 100k authors.
+    Authors of many result sets can be scored in one call too, each set scaled against
+    its own best author, by giving the set of each row as groups.
+    """
+    def __init__(self,
+                 weights: Dict[str, float] = Config.AUTHOR_RANKING_WEIGHTS,
+                 recency_years: int = Config.AUTHOR_RANKING_RECENCY_YEARS) -> None:
+        self.weights = weights
+        self.recency_years = recency_years
+
+    def scores(self, author_index: AuthorIndex, groups: np.ndarray|None = None) -> np.ndarray:
+        """
+        :param groups: optional result set of each row, as integer codes from 0
+        """
+        features = {
+            'citations': self._scaled(np.log1p(np.asarray(author_index.total_citations, dtype=np.float64)), groups),
+            'recency': self._recency(np.asarray(author_index.latest_year, dtype=np.float64)),
+            'relevance': self._scaled(np.asarray(author_index.max_relevance, dtype=np.float64), groups),
+            'papers': self._scaled(np.log1p(np.asarray(author_index.n_papers, dtype=np.float64)), groups),
+        }
+        scores = np.zeros(len(author_index), dtype=np.float64)
+        for feature, weight in self.weights.items():
+            scores += weight * features[feature]
+        return scores
+
+    def top_k(self, author_index: AuthorIndex, k: int = Config.AUTHOR_RANKING_TOP_K) -> List[RankedAuthor]:
+        scores = self.scores(author_index)
+        k = min(k, len(scores))
+        if k == 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return [RankedAuthor(rank=rank,
+                             auid=str(author_index.auid[i]),
+                             name=str(author_index.name[i]),
+                             score=round(float(scores[i]), 4),
+                             n_papers=int(author_index.n_papers[i]),
+                             total_citations=int(author_index.total_citations[i]),
+                             latest_year=int(author_index.latest_year[i]),
+                             max_relevance=float(author_index.max_relevance[i]))
+                for rank, i in enumerate(top, start=1)]
+
+    def write_shortlist(self, filepath: str, ranked_authors: List[RankedAuthor]) -> None:
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        with open(filepath, 'w', newline='') as fp:
+            writer = csv.writer(fp)
+            writer.writerow(RankedAuthor._fields)
+            writer.writerows(ranked_authors)
+
+    def _scaled(self, values: np.ndarray, groups: np.ndarray|None = None) -> np.ndarray:
+        if groups is None:
+            max_values = np.full_like(values, values.max(initial=0.0))
+        else:
+            max_per_group = np.zeros(int(groups.max(initial=-1)) + 1, dtype=values.dtype)
+            np.maximum.at(max_per_group, groups, values)
+            max_values = max_per_group[groups]
+        scaled = np.zeros_like(values)
+        np.divide(values, max_values, out=scaled, where=(max_values > 0))
+        return scaled
+
+    def _recency(self, latest_years: np.ndarray) -> np.ndarray:
+        oldest_year = date.today().year - self.recency_years
+        recency = np.clip((latest_years - oldest_year) / self.recency_years, 0.0, 1.0)
+        recency[latest_years == 0] = 0.0  # unknown year
+        return recency
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    import time
+    from AuthorIndex import AuthorIndexBuilder
+
+    rng = np.random.default_rng(0)
+    entries = [{'eid': str(i),
+                'citedby_count': str(rng.integers(0, 500)),
+                'cover_date': f"{rng.integers(2010, 2025)}-01-01",
+                'authors': [{'auid': str(auid), 'surname': f"S{auid}"} for auid in rng.integers(0, 60_000, 5)]}
+               for i in range(20_000)]
+    builder = AuthorIndexBuilder()
+    builder.add(entries)
+    author_index = builder.build()
+    started_at = time.perf_counter()
+    ranked_authors = AuthorRanker().top_k(author_index, 10)
+    print(f"ranked {len(author_index)} authors in {time.perf_counter() - started_at:.3f}s")
+    for ranked_author in ranked_authors:
+        print(ranked_author)
@@ -0,0 +1,155 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Dict, List, Tuple
+
+from AuthorFinderApp import AuthorFinderApp, SearchResult
+from BooleanSearchClient import ProbeResult
+from RateLimiter import RateLimiter
+from BooleanStringValidator import InvalidBooleanStringError
+from DBClient import SearchEngine
+from WebScrapper import WebInfo
+from Config import Config
+
+
+@dataclass
+class BatchResult:
+    """Outcome of one landing page url in a batch run"""
+    url: str
+    use: SearchEngine
+    query: str = None
+    n_results: int = 0
+    n_authors: int = 0
+    shortlist_filepath: str = None
+    error: str = None
+    timings: Dict[str, float] = field(default_factory=dict)  # seconds spent per stage
+
+    @property
+    def succeeded(self) -> bool:
+        return self.error is None
+
+
+class AsyncBatchRunner:
+    """
+    Run scrape -> LLM -> validate -> retrieve -> rank for many urls at once on asyncio.
+    All urls are in flight together; each stage has its own concurrency limit so
+    that the scraper, Azure OpenAI and Scopus are never hit by more than
+    scraper_concurrency, chatgpt_concurrency and scopus_concurrency requests.
+    The blocking clients of the app run on a thread pool sized to those limits.
+    """
+    def __init__(self, app: AuthorFinderApp,
+                 scraper_concurrency: int = Config.BATCH_SCRAPER_CONCURRENCY,
+                 chatgpt_concurrency: int = Config.BATCH_CHATGPT_CONCURRENCY,
+                 scopus_concurrency: int = Config.BATCH_SCOPUS_CONCURRENCY) -> None:
+        self.app = app
+        self.scraper_concurrency = scraper_concurrency
+        self.chatgpt_concurrency = chatgpt_concurrency
+        self.scopus_concurrency = scopus_concurrency
+
+    def run(self, urls: List[str],
+            use: SearchEngine = SearchEngine.BooleanSearch,
+            n_top_entries: int = 20_000) -> List[BatchResult]:
+        """
+        blocking entry point. Return one BatchResult per url, in the order of urls
+        """
+        results = asyncio.run(self.run_async(urls, use=use, n_top_entries=n_top_entries))
+        self.app.dbClient.flush()
+        return results
+
+    async def run_async(self, urls: List[str],
+                        use: SearchEngine = SearchEngine.BooleanSearch,
+                        n_top_entries: int = 20_000) -> List[BatchResult]:
+        self._scraper = asyncio.Semaphore(self.scraper_concurrency)
+        self._chatgpt = asyncio.Semaphore(self.chatgpt_concurrency)
+        self._scopus = asyncio.Semaphore(self.scopus_concurrency)
+        max_workers = self.scraper_concurrency + self.chatgpt_concurrency + self.scopus_concurrency
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            self._executor = executor
+            return await asyncio.gather(*[self._run_one(url, use, n_top_entries) for url in urls])
+
+    async def scrape(self, landing_page_url: str) -> WebInfo:
+        async with self._scraper:
+            return await self._in_thread(self.app.scrape, landing_page_url)
+
+    async def generate_boolean_string(self, web_info: WebInfo, landing_page_url: str, feedback: str|None = None) -> str:
+        async with self._chatgpt:
+            return await self._in_thread(self.app.generate_boolean_string, web_info, landing_page_url, feedback)
+
+    async def generate_query_string(self, web_info: WebInfo, landing_page_url: str) -> str:
+        async with self._chatgpt:
+            return await self._in_thread(self.app.generate_query_string, web_info, landing_page_url)
+
+    async def validate_boolean_string(self, boolean_string: str, n_top_entries: int, asjc_codes: Tuple[str, ...]|None = None) -> ProbeResult:
+        async with self._scopus:
+            # interactive searches of the same process go first
+            return await self._in_thread(self.app.validate_boolean_string, boolean_string, n_top_entries, asjc_codes, RateLimiter.BATCH)
+
+    async def retrieve_boolean_entries(self, boolean_string: str, n_top_entries: int, probe: ProbeResult) -> SearchResult:
+        async with self._scopus:
+            return await self._in_thread(self.app.retrieve_boolean_entries, boolean_string, n_top_entries, probe, RateLimiter.BATCH)
+
+    async def retrieve_vector_entries(self, query_string: str, n_top_entries: int) -> SearchResult:
+        async with self._scopus:
+            return await self._in_thread(self.app.retrieve_vector_entries, query_string, n_top_entries)
+
+    async def shortlist_authors(self, query: str, use: SearchEngine) -> str:
+        return await self._in_thread(self.app.shortlist_authors, query, use)
+
+    async def _run_one(self, url: str, use: SearchEngine, n_top_entries: int) -> BatchResult:
+        result = BatchResult(url=url, use=use)
+        started_at = time.perf_counter()
+        try:
+            web_info = await self._timed(result, 'scrape', self.scrape(url))
+            if use == SearchEngine.BooleanSearch:
+                probe = await self._generate_valid_boolean_string(result, web_info, url, n_top_entries)
+                search_result = await self._timed(result, 'retrieve', self.retrieve_boolean_entries(result.query, n_top_entries, probe))
+            else:
+                result.query = await self._timed(result, 'generate', self.generate_query_string(web_info, url))
+                search_result = await self._timed(result, 'retrieve', self.retrieve_vector_entries(result.query, n_top_entries))
+            result.n_results = search_result.n_results
+            result.n_authors = search_result.n_authors
+            result.shortlist_filepath = await self._timed(result, 'rank', self.shortlist_authors(result.query, use))
+        except Exception as e:
+            result.error = str(e) or e.__class__.__name__
+        result.timings['total'] = time.perf_counter() - started_at
+        return result
+
+    async def _generate_valid_boolean_string(self, result: BatchResult, web_info: WebInfo,
+                                             url: str, n_top_entries: int) -> ProbeResult:
+        """
+        same as AuthorFinderApp.generate_valid_boolean_string, with each stage under its own limit
+        """
+        feedback = None
+        for attempt in range(Config.BOOLEAN_STRING_MAX_ATTEMPTS):
+            result.query = await self._timed(result, 'generate', self.generate_boolean_string(web_info, url, feedback))
+            try:
+                return await self._timed(result, 'validate', self.validate_boolean_string(result.query, n_top_entries, web_info.asjc_codes))
+            except InvalidBooleanStringError as e:
+                if attempt == Config.BOOLEAN_STRING_MAX_ATTEMPTS - 1:
+                    raise
+                feedback = e.reason
+
+    async def _timed(self, result: BatchResult, stage: str, coroutine):
+        started_at = time.perf_counter()
+        try:
+            return await coroutine
+        finally:
+            result.timings[stage] = time.perf_counter() - started_at
+
+    async def _in_thread(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+
+######################################################################################
+# Test
+######################################################################################
+
+if __name__ == "__main__":
+    urls = ['https://www.sciencedirect.com/journal/food-and-humanity/about/call-for-papers#sensory-and-consumer-evaluation-of-plant-based-animal-food-analogues',
+            'https://www.sciencedirect.com/journal/applied-energy/about/call-for-papers#thermoacoustics-combustion-and-energy-conversion-systems']
+    runner = AsyncBatchRunner(AuthorFinderApp())
+    results = runner.run(urls, use=SearchEngine.BooleanSearch, n_top_entries=20)
+    for result in results:
+        print(result)
@@ -0,0 +1,393 @@
+import re
+from abc import ABC, abstractmethod
+from collections import namedtuple
+from dataclasses import dataclass, replace
+from typing import Iterator, List, Tuple
+
+
+Token = namedtuple('Token', ('kind', 'value', 'position'))
+
+class BooleanStringParseError(RuntimeError):
+    """
+    the boolean string is not valid scopus boolean syntax, or uses an operator we don't support.
+    position is the index in the boolean string where parsing stopped
+    """
+    def __init__(self, reason: str, position: int, boolean_string: str) -> None:
+        self.reason = reason
+        self.position = position
+        self.boolean_string = boolean_string
+        snippet = boolean_string[max(0, position - 20):position + 20]
+        super().__init__(f"{reason} at position {position}: ...{snippet}...")
+
+
+##############################################################
+# AST
+##############################################################
+
+class Node(ABC):
+    """
+    node of a parsed boolean string.
+    to_string() writes it back in the syntax of the boolean strings we generate;
+    to_query() writes it as a query for the scopus search api, see BooleanString.to_boolean_query
+    """
+    @abstractmethod
+    def to_string(self) -> str:
+        ...
+
+    @abstractmethod
+    def to_query(self) -> str:
+        ...
+
+    def canonical(self) -> 'Node':
+        """
+        the same query in one stable form: AND/OR flattened, children deduplicated
+        and sorted, terms lowercased with their whitespace normalized
+        """
+        return self
+
+    def walk(self) -> Iterator['Node']:
+        """
+        this node and all its descendants, depth first
+        """
+        yield self
+
+    def __str__(self) -> str:
+        return self.to_string()
+
+@dataclass(frozen=True)
+class Term(Node):
+    """a word, a few words, a "quoted phrase" or an {exact phrase}"""
+    text: str
+    quote: str = ''  # '"', '{' or '' for bare words
+
+    def to_string(self) -> str:
+        if self.quote == '"':
+            return f'"{self.text}"'
+        if self.quote == '{':
+            return f'{{{self.text}}}'
+        return self.text
+
+    def to_query(self) -> str:
+        return self.to_string()
+
+    def canonical(self) -> 'Term':
+        return replace(self, text=" ".join(self.text.lower().split()))
+
+@dataclass(frozen=True)
+class Field(Node):
+    """FIELD ( expression ), e.g. TITLE-ABS-KEY ( "health care" ) or SUBJTERMS ( 2700 OR 2713 )"""
+    name: str
+    child: Node
+
+    def to_string(self) -> str:
+        return f"{self.name} ( {self.child.to_string()} )"
+
+    def to_query(self) -> str:
+        return f"{self.name} ( {self.child.to_query()} )"
+
+    def canonical(self) -> 'Field':
+        return replace(self, child=self.child.canonical())
+
+    def walk(self) -> Iterator[Node]:
+        yield self
+        yield from self.child.walk()
+
+@dataclass(frozen=True)
+class Compare(Node):
+    """FIELD op value, e.g. PUBYEAR > 2017 or PUBYEAR IS 2020"""
+    name: str
+    op: str
+    value: str
+
+    def to_string(self) -> str:
+        return f"{self.name} {self.op} {self.value}"
+
+    def to_query(self) -> str:
+        return self.to_string()
+
+    def canonical(self) -> 'Compare':
+        if self.op == '=':
+            return replace(self, op='IS')
+        return self
+
+@dataclass(frozen=True)
+class LimitTo(Node):
+    """LIMIT-TO ( FIELD , value ), the refinement syntax of the scopus web ui"""
+    name: str
+    value: Term
+
+    def to_string(self) -> str:
+        return f"LIMIT-TO ( {self.name} , {self.value.to_string()} )"
+
+    def to_query(self) -> str:
+        """
+        the search api has no LIMIT-TO. PUBYEAR becomes PUBYEAR IS year, SUBJAREA and EXACT*
+        keep their quotes, and the other fields take their value unquoted
+        """
+        if self.name == 'PUBYEAR':
+            return f"PUBYEAR IS {self.value.text}"
+        if self.name == 'SUBJAREA' or self.name.startswith('EXACT'):
+            return f'{self.name} ( "{self.value.text}" )'
+        return f"{self.name} ( {self.value.text} )"
+
+    def canonical(self) -> 'LimitTo':
+        return replace(self, value=self.value.canonical())
+
+    def walk(self) -> Iterator[Node]:
+        yield self
+        yield self.value
+
+@dataclass(frozen=True)
+class BooleanOperation(Node):
+    children: Tuple[Node, ...]
+    OPERATOR = ''
+
+    def to_string(self) -> str:
+        return f" {self.OPERATOR} ".join(self._wrapped(child.to_string(), child) for child in self.children)
+
+    def to_query(self) -> str:
+        return f" {self.OPERATOR} ".join(self._wrapped(child.to_query(), child) for child in self.children)
+
+    def canonical(self) -> Node:
+        children = []
+        for child in self.children:
+            child = child.canonical()
+            if type(child) is type(self):
+                children.extend(child.children)
+            else:
+                children.append(child)
+        children = sorted(set(children), key=lambda child: child.to_string())
+        if len(children) == 1:
+            return children[0]
+        return replace(self, children=tuple(children))
+
+    def walk(self) -> Iterator[Node]:
+        yield self
+        for child in self.children:
+            yield from child.walk()
+
+    def _wrapped(self, text: str, child: Node) -> str:
+        # scopus binds OR tighter than AND, so nested operations are always parenthesized
+        if isinstance(child, BooleanOperation):
+            return f"( {text} )"
+        return text
+
+@dataclass(frozen=True)
+class And(BooleanOperation):
+    OPERATOR = 'AND'
+
+@dataclass(frozen=True)
+class Or(BooleanOperation):
+    OPERATOR = 'OR'
+
+
+##############################################################
+# Parser
+##############################################################
+
+class BooleanQueryParser:
+    """
+    Single pass tokenizer and recursive descent parser of scopus boolean strings:
+      expression := or_expression ( [AND] or_expression )*      AND may be implicit, as in scopus
+      or_expression := primary ( OR primary )*                  OR binds tighter than AND in scopus
+      primary := ( expression ) | FIELD ( expression ) | FIELD op value
+               | LIMIT-TO ( FIELD , value ) | "phrase" | {phrase} | word+
+    Operators are case insensitive, as in scopus, and written back in upper case.
+    Terms must be inside a FIELD ( ... ) group: a bare term outside any field is rejected
+    rather than searched in all fields. Field codes must be in supported_fields.
+    Scopus operators we don't support (NOT, W/n, PRE/n, unknown field codes)
+    raise a BooleanStringParseError.
+    """
+    SUPPORTED_FIELDS = { 'TITLE-ABS-KEY', 'PUBYEAR', 'SUBJAREA', 'LANGUAGE', 'SUBJTERMS',
+                         'EXACTKEYWORD', 'OA', 'SRCTYPE', 'DOCTYPE', 'AFFILCOUNTRY' }
+    COMPARE_OPERATORS = { '>', '<', '=', 'IS' }
+    TOKEN_PATTERN = re.compile(r'''
+        (?P<lparen>\() | (?P<rparen>\)) | (?P<comma>,)
+        | (?P<phrase>"[^"]*"|\{[^}]*\})
+        | (?P<compare>[<>=])
+        | (?P<word>[^\s(),"{}<>=]+)
+        | (?P<unterminated>["{])
+        | (?P<space>\s+)
+        ''', re.VERBOSE)
+    FIELD_CODE_PATTERN = re.compile(r'^[A-Z][A-Z0-9]*(?:-[A-Z0-9]+)*$')
+    UNSUPPORTED_OPERATOR_PATTERN = re.compile(r'^(?:NOT|(?:W|PRE)/\d+)$', re.IGNORECASE)
+    BOOLEAN_OPERATORS = ('AND', 'OR')
+
+    def __init__(self, supported_fields=SUPPORTED_FIELDS) -> None:
+        self.supported_fields = set(supported_fields)
+
+    def parse(self, boolean_string: str) -> Node:
+        self._boolean_string = boolean_string
+        self._tokens = self.tokenize(boolean_string)
+        self._i = 0
+        self._field_depth = 0
+        if len(self._tokens) == 0:
+            self._fail("empty boolean string", 0)
+        node = self._expression()
+        if self._peek() is not None:
+            self._fail(f"unexpected '{self._peek().value}'", self._peek().position)
+        return node
+
+    def tokenize(self, boolean_string: str) -> List[Token]:
+        tokens = []
+        for match in BooleanQueryParser.TOKEN_PATTERN.finditer(boolean_string):
+            kind = match.lastgroup
+            if kind == 'space':
+                continue
+            if kind == 'unterminated':
+                self._boolean_string = boolean_string
+                self._fail("unterminated phrase", match.start())
+            tokens.append(Token(kind, match.group(), match.start()))
+        return tokens
+
+    def _expression(self) -> Node:
+        children = [self._or_expression()]
+        while True:
+            token = self._peek()
+            if token is None or token.kind in ('rparen', 'comma'):
+                break
+            if self._is_word(token, 'AND'):
+                self._advance()
+            children.append(self._or_expression())
+        return And(tuple(children)) if len(children) > 1 else children[0]
+
+    def _or_expression(self) -> Node:
+        children = [self._primary()]
+        while self._is_word(self._peek(), 'OR'):
+            self._advance()
+            children.append(self._primary())
+        return Or(tuple(children)) if len(children) > 1 else children[0]
+
+    def _primary(self) -> Node:
+        token = self._peek()
+        if token is None:
+            self._fail("expected a term", len(self._boolean_string))
+        if token.kind == 'lparen':
+            self._advance()
+            node = self._expression()
+            self._expect('rparen')
+            return node
+        if token.kind == 'phrase':
+            self._check_in_field(token)
+            self._advance()
+            return Term(token.value[1:-1], quote=token.value[0])
+        if token.kind != 'word' or self._is_operator(token):
+            self._fail(f"expected a term, got '{token.value}'", token.position)
+
+        if BooleanQueryParser.UNSUPPORTED_OPERATOR_PATTERN.match(token.value):
+            self._fail(f"unsupported operator {token.value}", token.position)
+        if token.value == 'LIMIT-TO':
+            return self._limit_to()
+        following = self._peek(1)
+        if self._is_field_code(token.value) and following is not None:
+            if following.kind == 'lparen':
+                self._check_supported_field(token)
+                self._advance(2)
+                self._field_depth += 1
+                node = self._expression()
+                self._field_depth -= 1
+                self._expect('rparen')
+                return Field(token.value, node)
+            if following.kind == 'compare' or self._is_word(following, 'IS'):
+                self._check_supported_field(token)
+                self._advance(2)
+                value = self._expect('word')
+                return Compare(token.value, following.value.upper(), value.value)
+        if (self._field_depth == 0) and (token.value in self.supported_fields):
+            position = following.position if following is not None else len(self._boolean_string)
+            self._fail(f"expected ( or a comparison after {token.value}", position)
+        self._check_in_field(token)
+        return self._words()
+
+    def _limit_to(self) -> LimitTo:
+        self._advance()
+        self._expect('lparen')
+        name = self._expect('word')
+        self._check_supported_field(name)
+        self._expect('comma')
+        token = self._peek()
+        if token is not None and token.kind == 'phrase':
+            self._advance()
+            value = Term(token.value[1:-1], quote=token.value[0])
+        else:
+            value = self._words()
+        self._expect('rparen')
+        return LimitTo(name.value, value)
+
+    def _words(self) -> Term:
+        """
+        consecutive bare words, e.g. TITLE-ABS-KEY ( heart attack )
+        """
+        words = []
+        while True:
+            token = self._peek()
+            if token is None or token.kind != 'word' or self._is_operator(token):
+                break
+            if BooleanQueryParser.UNSUPPORTED_OPERATOR_PATTERN.match(token.value):
+                self._fail(f"unsupported operator {token.value}", token.position)
+            following = self._peek(1)
+            if (len(words) > 0) and (token.value == 'LIMIT-TO' or (self._is_field_code(token.value)
+                    and following is not None and (following.kind in ('lparen', 'compare') or self._is_word(following, 'IS')))):
+                break
+            words.append(token.value)
+            self._advance()
+        if len(words) == 0:
+            token = self._peek()
+            self._fail("expected a term", token.position if token else len(self._boolean_string))
+        return Term(" ".join(words))
+
+    def _check_supported_field(self, token: Token) -> None:
+        if token.value not in self.supported_fields:
+            self._fail(f"unsupported operator {token.value}", token.position)
+
+    def _check_in_field(self, token: Token) -> None:
+        if self._field_depth == 0:
+            self._fail(f"term '{token.value}' outside a field, e.g. TITLE-ABS-KEY ( {token.value} )", token.position)
+
+    def _is_field_code(self, value: str) -> bool:
+        return BooleanQueryParser.FIELD_CODE_PATTERN.match(value) is not None
+
+    def _is_word(self, token: Token|None, value: str) -> bool:
+        return (token is not None) and (token.kind == 'word') and (token.value.upper() == value)
+
+    def _is_operator(self, token: Token) -> bool:
+        return (token.kind == 'word') and (token.value.upper() in BooleanQueryParser.BOOLEAN_OPERATORS)
+
+    def _peek(self, offset: int = 0) -> Token|None:
+        i = self._i + offset
+        return self._tokens[i] if i < len(self._tokens) else None
+
+    def _advance(self, n: int = 1) -> None:
+        self._i += n
+
+    def _expect(self, kind: str) -> Token:
+        token = self._peek()
+        if token is None:
+            self._fail(f"expected {kind}, got the end of the string", len(self._boolean_string))
+        if token.kind != kind:
+            self._fail(f"expected {kind}, got '{token.value}'", token.position)
+        self._advance()
+        return token
+
+    def _fail(self, reason: str, position: int) -> None:
+        raise BooleanStringParseError(reason, position, self._boolean_string)
+
+
+######################################################################################
+# Test
+######################################################################################
+
+if __name__ == "__main__":
+    test_boolean_string = '( TITLE-ABS-KEY ( "health care" ) AND TITLE-ABS-KEY ( reform ) OR TITLE-ABS-KEY ( delivery ) ) AND SUBJTERMS ( 2700 OR 2713 ) AND ( LIMIT-TO ( AFFILCOUNTRY , "Saudi Arabia" ) ) AND ( LIMIT-TO ( PUBYEAR , 2017 ) OR LIMIT-TO ( PUBYEAR , 2018 ) )'
+    node = BooleanQueryParser().parse(test_boolean_string)
+    print(node.to_string())
+    print(node.to_query())
+    print(node.canonical().to_query())
+    print(BooleanQueryParser().parse('TITLE-ABS-KEY ( "a" or "b" ) and PUBYEAR is 2020').to_query())
+    for invalid_boolean_string in ['TITLE-ABS-KEY ( x ) AND NOT TITLE-ABS-KEY ( y )',
+                                   'TITLE-ABS-KEY ( x ) AND PUBYEAR AFT 2017',
+                                   'TITLE-ABS-KEY ( x ) AND y']:
+        try:
+            BooleanQueryParser().parse(invalid_boolean_string)
+        except BooleanStringParseError as e:
+            print(e.reason, e.position)
@@ -1,92 +1,338 @@
 from BooleanString import BooleanString
 from collections import namedtuple
-from typing import Any, List, Dict, Tuple
-import requests
+from typing import Any, Iterator, List, Dict, Tuple
+import queue
+import threading
 from concurrent.futures import ThreadPoolExecutor
-import pandas as pd
 import numpy as np
 import re
+from urllib.parse import parse_qsl, quote, urlencode, urlsplit, urlunsplit
 from DBClient import DBClient, QuerySource, QueryStatus
 from ProjectSecrets import Secrets
 from JsonIO import BooleanStringJsonIO
+from AuthorIndex import AuthorIndexBuilder
+from HttpClient import HttpClient
+from RateLimiter import QuotaExhaustedError, RateLimiter
+from QueryResultCache import CachedResult, QueryResultCache
+from BooleanStringValidator import BooleanStringValidator, InvalidBooleanStringError
+from Config import Config
 
 TimeLimitWiggleResult = namedtuple('TimeLimitWiggleResult', ('start_year', 'end_year', 'worked'))
+EntryPage = namedtuple('EntryPage', ('entries', 'url', 'next_url'))
+ProbeResult = namedtuple('ProbeResult', ('is_invalid', 'total_results', 'first_page', 'reason'), defaults=(None,))
 
 class BooleanSearchClient:
     ENDPOINT = 'https://api.elsevier.com/content/search/scopus'
+    CREDENTIAL_PARAMS = ('apiKey', 'insttoken')
 
     def __init__(self, api_key: str, inst_token: str) -> None:
         self.api_key = api_key  # Scopus API Key
         self.inst_token = inst_token  # institutional token
         self.json_io = BooleanStringJsonIO()
+        self.http = HttpClient.shared()
+        self.http.mark_rate_limited(BooleanSearchClient.ENDPOINT)
+        self.rate_limiter = RateLimiter.shared()
+        self.result_cache = QueryResultCache()
+        self.validator = BooleanStringValidator()
 
     def num_results(self, boolean_string: str) -> int:
-        _query = BooleanString(boolean_string).to_boolean_query()
-        url = f'{BooleanSearchClient.ENDPOINT}?query={_query}&apiKey={self.api_key}&insttoken={self.inst_token}&sort=citedby-count'
-        response = None
-        try:
-            response = requests.get(url)
-            response.raise_for_status()
-        except Exception as e:
-            raise RuntimeError("error requesting {URL}\nquery: {query}\n")
-        
-        if response.status_code != 200:
-            raise RuntimeError("error requesting {URL}\nquery: {query}\n")
-        
-        data = response.json()
-            
-        if 'search-results' not in data:
-            raise ValueError("No 'search-results' in response: \n{data}")
-        
-        total_results = int(data['search-results'].get('opensearch:totalResults'))
-        self.json_io.set_total_results(boolean_string, total_results)
-        return total_results
+        return self.probe(boolean_string).total_results
     
     def is_invalid_input(self, boolean_string: str) -> bool:
-        _query = None
-        try:
-            _query = BooleanString(boolean_string).to_boolean_query()
-        except Exception as e:
-            print(e)
-            return True
-        url = f'{BooleanSearchClient.ENDPOINT}?query={_query}&apiKey={self.api_key}&insttoken={self.inst_token}'
-        
-        response = None
+        return self.probe(boolean_string).is_invalid
+
+    def probe(self, boolean_string: str, page_size: int = Config.BOOLEAN_SEARCH_PAGE_SIZE,
+              asjc_codes: Tuple[str, ...]|None = None, priority: int = RateLimiter.INTERACTIVE) -> ProbeResult:
+        """
+        Request the first page of the boolean string once, and tell from it whether scopus accepts
+        the query, how many results it has, and what the first page holds. Pass the result to
+        retrieve_top_entries so that retrieval goes on from that page instead of asking for it again.
+        A query with results in the result cache is answered from the cache, without a first page.
+        Boolean strings failing the local checks of BooleanStringValidator never reach scopus;
+        the reason of an invalid probe says what is wrong.
+        :param asjc_codes: ASJC codes the boolean string was generated with, see BooleanStringValidator.validate
+        :param priority: RateLimiter.INTERACTIVE, or RateLimiter.BATCH for batch runs
+        """
+        if page_size <= 0:
+            raise ValueError(f"page_size must be above 0, received {page_size}")
+        return self._probe(boolean_string, page_size, self.result_cache.get(boolean_string), asjc_codes, priority)
+
+    def _probe(self, boolean_string: str, page_size: int, cached: CachedResult|None,
+               asjc_codes: Tuple[str, ...]|None = None, priority: int = RateLimiter.INTERACTIVE) -> ProbeResult:
+        """
+        probe answered from cached if given, else from the first page of scopus
+        """
+        validation = self.validator.validate(boolean_string, asjc_codes)
+        if not validation.is_valid:
+            self.json_io.set_is_invalid(boolean_string, True)
+            return ProbeResult(is_invalid=True, total_results=0, first_page=None, reason=validation.reason)
+        if cached is not None:
+            # a query with cached results is valid, and its count is known
+            self.json_io.set_is_invalid(boolean_string, False)
+            self.json_io.set_total_results(boolean_string, cached.total_results)
+            return ProbeResult(is_invalid=False, total_results=cached.total_results, first_page=None)
+        return self._probe_scopus(boolean_string, page_size, priority)
+
+    def _probe_scopus(self, boolean_string: str, page_size: int, priority: int) -> ProbeResult:
+        url = self._first_page_url_from(boolean_string, page_size)
         try:
-            response = requests.get(url)
+            response = self._get(url, priority)
+        except QuotaExhaustedError:
+            raise
         except Exception as e:
-            raise RuntimeError("error requesting {URL}\nquery: {query}\n")
-        
-        is_invalid = False
+            raise RuntimeError(f"Error sending request.\nquery: {boolean_string}")
+
         if response.status_code == 400:
-            is_invalid = True
-            self.json_io.set_is_invalid(boolean_string, is_invalid)
-            return is_invalid
-        self.json_io.set_is_invalid(boolean_string, is_invalid)
-        return is_invalid
+            self.json_io.set_is_invalid(boolean_string, True)
+            return ProbeResult(is_invalid=True, total_results=0, first_page=None, reason="scopus rejected the query (400 Bad Request)")
+        response_data = self._response_data_from(response, url)
+        total_results = int(response_data['search-results'].get('opensearch:totalResults'))
+        self.json_io.set_is_invalid(boolean_string, False)
+        self.json_io.set_total_results(boolean_string, total_results)
+        return ProbeResult(is_invalid=False, total_results=total_results, first_page=response_data)
 
-    def retrieve_top_entries(self, boolean_string: str, n_top_entries: int, dbClient: DBClient) -> pd.DataFrame:
+    def retrieve_top_entries(self, boolean_string: str, n_top_entries: int, dbClient: DBClient|None,
+                             page_size: int = Config.BOOLEAN_SEARCH_PAGE_SIZE,
+                             probe: ProbeResult|None = None,
+                             priority: int = RateLimiter.INTERACTIVE) -> None:
+        """
+        :param n_top_entries: stop once this many entries are collected
+        :param dbClient: if given, the query is marked accepted and the entries are recorded in the history db
+        :param page_size: number of entries requested per page, i.e. scopus `count`
+        :param probe: result of probe(boolean_string); retrieval starts from its first page.
+          Probed here if not given
+        :param priority: RateLimiter.INTERACTIVE, or RateLimiter.BATCH for batch runs
+        Entries already in the result cache are served from it without any request; otherwise
+        scopus is probed, once, unless the given probe has a first page to go on from.
+        """
         if n_top_entries <= 0:
             raise ValueError(f"n_top_entries must be above 0, received {n_top_entries}")
+        if page_size <= 0:
+            raise ValueError(f"page_size must be above 0, received {page_size}")
         
+        cached = self.result_cache.get(boolean_string, n_top_entries)
+        if cached is None:
+            if (probe is None) or ((probe.first_page is None) and (not probe.is_invalid)):
+                # not probed yet, or probed from a cached result too short for n_top_entries
+                probe = self._probe(boolean_string, min(page_size, n_top_entries), cached=None, priority=priority)
+            if probe.is_invalid:
+                raise InvalidBooleanStringError(boolean_string, probe.reason)
+
+        qid = self._accepted_qid_from(boolean_string, dbClient)
+        self.json_io.start_entries(boolean_string)
+        self.json_io.remove_checkpoint(boolean_string)
+        authors = AuthorIndexBuilder()
+        if cached is not None:
+            self.json_io.set_is_invalid(boolean_string, False)
+            self.json_io.set_total_results(boolean_string, cached.total_results)
+            for page in self._iter_cached_pages(cached, n_top_entries):
+                self._write_page(boolean_string, page, qid, dbClient, authors)
+            self.json_io.write_author_index(boolean_string, authors.build())
+            return
+        checkpoint = {'n_top_entries': min(n_top_entries, probe.total_results),
+                      'total_results': probe.total_results,
+                      'n_entries': 0,
+                      'n_refs': 0,
+                      'processed_urls': []}
+        self._write_pages(boolean_string, self._iter_entry_pages(probe.first_page, n_top_entries, priority=priority), checkpoint, qid, dbClient, authors)
+
+    def resume_top_entries(self, boolean_string: str, dbClient: DBClient|None,
+                           priority: int = RateLimiter.INTERACTIVE) -> bool:
+        """
+        Go on with a retrieval of retrieve_top_entries that was interrupted, from its last checkpoint.
+        Entries written after the checkpoint are dropped and fetched again.
+        Return False if there is no checkpoint for the boolean string
+        """
+        checkpoint = self.json_io.read_checkpoint(boolean_string)
+        if checkpoint is None:
+            return False
+        qid = self._accepted_qid_from(boolean_string, dbClient)
+        self.json_io.truncate_entries(boolean_string, checkpoint['entries_size'])
+        checkpoint['n_refs'] = sum(1 for _ in self.json_io.iter_refs(boolean_string))
+        authors = AuthorIndexBuilder()
+        authors.add(self.json_io.iter_entries(boolean_string))
+        n_entries_to_go = checkpoint['n_top_entries'] - checkpoint['n_entries']
+        if (checkpoint['next_url'] is not None) and (n_entries_to_go > 0):
+            response_data = self._page_data_from_url(self._url_with_credentials(checkpoint['next_url']), priority)
+            pages = self._iter_entry_pages(response_data, n_entries_to_go,
+                                           processed_urls=set(checkpoint['processed_urls']), priority=priority)
+            self._write_pages(boolean_string, pages, checkpoint, qid, dbClient, authors)
+        else:
+            self._finish(boolean_string, checkpoint, authors)
+        return True
+
+    def _accepted_qid_from(self, boolean_string: str, dbClient: DBClient|None) -> int|None:
+        if dbClient is None:
+            return None
+        qid = dbClient.get_latest_qid(boolean_string)
+        if qid == 0:
+            return dbClient.add_boolean_string(boolean_string, QuerySource.chatGPT, QueryStatus.accepted)
+        dbClient.update_query_status(boolean_string, QueryStatus.accepted)
+        return qid
+
+    def _write_page(self, boolean_string: str, page: List[Dict[Any, Any]], qid: int|None, dbClient: DBClient|None,
+                    authors: AuthorIndexBuilder) -> int:
+        """
+        return the number of refs written, i.e. of entries with an eid
+        """
+        # written as they arrive, so only one page is held in memory
+        n_refs = self.json_io.append_entries(boolean_string, page, normalized=True)
+        authors.add(page)
+        if dbClient is not None:
+            dbClient.add_entries(qid, page)
+        return n_refs
+
+    def _write_pages(self, boolean_string: str, pages: Iterator[EntryPage], checkpoint: Dict[str, Any],
+                     qid: int|None, dbClient: DBClient|None, authors: AuthorIndexBuilder) -> None:
+        """
+        write the pages of the cursor chain and save a checkpoint every
+        Config.BOOLEAN_SEARCH_CHECKPOINT_PAGES pages, and when the quota runs out,
+        then save the author index, cache the result and drop the checkpoint
+        """
+        try:
+            for i, page in enumerate(pages, start=1):
+                checkpoint['n_refs'] += self._write_page(boolean_string, page.entries, qid, dbClient, authors)
+                checkpoint['n_entries'] += len(page.entries)
+                checkpoint['processed_urls'].append(self._url_without_credentials(page.url))
+                checkpoint['next_url'] = None if page.next_url is None else self._url_without_credentials(page.next_url)
+                if i % Config.BOOLEAN_SEARCH_CHECKPOINT_PAGES == 0:
+                    self.json_io.write_checkpoint(boolean_string, checkpoint)
+        except QuotaExhaustedError:
+            # resumable once the quota resets, from the last page written
+            if len(checkpoint['processed_urls']) > 0:
+                self.json_io.write_checkpoint(boolean_string, checkpoint)
+            raise
+        self._finish(boolean_string, checkpoint, authors)
+
+    def _finish(self, boolean_string: str, checkpoint: Dict[str, Any], authors: AuthorIndexBuilder) -> None:
+        self.json_io.write_author_index(boolean_string, authors.build())
+        self.result_cache.put(boolean_string,
+                              self.json_io._entries_filepath_from(boolean_string),
+                              n_entries=checkpoint['n_refs'],
+                              total_results=checkpoint['total_results'])
+        self.json_io.remove_checkpoint(boolean_string)
+
+    def _url_without_credentials(self, url: str) -> str:
+        """
+        the page url as saved in checkpoints, without apiKey and insttoken
+        """
+        scheme, netloc, path, query, fragment = urlsplit(url)
+        params = [(key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+                  if key not in BooleanSearchClient.CREDENTIAL_PARAMS]
+        return urlunsplit((scheme, netloc, path, urlencode(params, quote_via=quote), fragment))
+
+    def _url_with_credentials(self, url: str) -> str:
+        return f"{url}&apiKey={self.api_key}&insttoken={self.inst_token}"
+
+    def _iter_cached_pages(self, cached: CachedResult, n_top_entries: int) -> Iterator[List[Dict[Any, Any]]]:
+        page = []
+        refs = self.result_cache.iter_entries(cached, n_top_entries)
+        for entry in self.json_io.paper_store.iter_entries(refs):
+            page.append(entry)
+            if len(page) == Config.RESULT_CACHE_PAGE_SIZE:
+                yield page
+                page = []
+        if len(page) > 0:
+            yield page
+
+    def _first_page_url_from(self, boolean_string: str, page_size: int) -> str:
         _query = BooleanString(boolean_string).to_boolean_query()
-        url_from = lambda query: f'{BooleanSearchClient.ENDPOINT}?query={_query}&apiKey={self.api_key}&insttoken={self.inst_token}&cursor=*&view=complete&sort=citedby-count'
-        entries =  self._retrieve_entries_from_url(url_from(_query), n_top_entries)
-        # TODO: move to App
-        # success = dbClient.update_query_status(query, QueryStatus.accepted)
-        # qid = dbClient.get_accepted_qid(query)
-        self.json_io.set_entries(boolean_string, entries)
-        # dbClient.add_entries(qid, entries)
-	
-    def _retrieve_entries_from_url(self, url: str, n_top_entries: int) -> List[Dict[Any, Any]]:
+        return f'{BooleanSearchClient.ENDPOINT}?query={_query}&apiKey={self.api_key}&insttoken={self.inst_token}&cursor=*&count={page_size}&view=complete&sort=citedby-count'
+
+    def _iter_entry_pages(self, response_data: Dict[Any, Any], n_top_entries: int,
+                          processed_urls: set|None = None,
+                          priority: int = RateLimiter.INTERACTIVE) -> Iterator[EntryPage]:
+        """
+        Walk the cursor chain starting from the page already in response_data and yield the
+        normalized entries page by page, in order, with the url of the page and of the next one.
+        :param processed_urls: urls without credentials already walked through, when resuming
+        The cursor chain itself is sequential, so a producer thread follows the `next` links
+        while a pool of workers normalizes the pages already downloaded. At most
+        Config.BOOLEAN_SEARCH_PREFETCH_PAGES pages are held between the two.
+        """
+        total_results = int(response_data['search-results'].get('opensearch:totalResults'))
+        n_top_entries = min(total_results, n_top_entries)
+
+        pages = queue.Queue(maxsize=Config.BOOLEAN_SEARCH_PREFETCH_PAGES)
+        stop = threading.Event()
 
+        def _put(item) -> None:
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def _produce(response_data: Dict[Any, Any], executor: ThreadPoolExecutor) -> None:
+            try:
+                _processed_urls = set(processed_urls or ())
+                _n_entries_to_go = n_top_entries
+                current_page_url = self._current_page_url_from(response_data)
+                while not stop.is_set():
+                    _processed_urls.add(self._url_without_credentials(current_page_url))
+                    _entries = self._entries_from_response_data(response_data)[:_n_entries_to_go]  # won't cause OutOfRangeError, a=[1,2]; a[:10]; returns [1,2]
+                    _n_entries_to_go -= len(_entries)
+                    next_page_url = None
+                    if (_n_entries_to_go > 0) and (len(_entries) > 0):
+                        next_page_url = self._next_page_url_from(response_data)
+                    if (next_page_url is not None) and (self._url_without_credentials(next_page_url) in _processed_urls):
+                        print("Next URL already processed. Exiting loop.")
+                        next_page_url = None
+                    _put((executor.submit(self.json_io.normalize_entries, _entries), current_page_url, next_page_url))
+                    if next_page_url is None:
+                        break
+                    response_data = self._page_data_from_url(next_page_url, priority)
+                    current_page_url = next_page_url
+            except Exception as e:
+                _put(e)
+            finally:
+                _put(None)
+
+        with ThreadPoolExecutor(max_workers=Config.BOOLEAN_SEARCH_PARSE_WORKERS) as executor:
+            producer = threading.Thread(target=_produce, args=(response_data, executor), daemon=True)
+            producer.start()
+            try:
+                while True:
+                    item = pages.get()
+                    if item is None:
+                        break
+                    if isinstance(item, Exception):
+                        raise item
+                    future, page_url, next_page_url = item
+                    yield EntryPage(entries=future.result(), url=page_url, next_url=next_page_url)
+            finally:
+                stop.set()
+                producer.join()
+
+    def _page_data_from_url(self, url: str, priority: int = RateLimiter.INTERACTIVE) -> Dict[Any, Any]:
         response = None
         try:
-            response = requests.get(url)
-            response.raise_for_status
+            response = self._get(url, priority)
+            response.raise_for_status()
+        except QuotaExhaustedError:
+            raise
         except Exception as e:
             raise RuntimeError(f"Error sending request.\nurl: {url}")
-        
+        return self._response_data_from(response, url)
+
+    def _get(self, url: str, priority: int = RateLimiter.INTERACTIVE):
+        """
+        GET through the shared rate limiter. A request throttled with 429 is sent again
+        once the limiter allows it, up to Config.SCOPUS_MAX_THROTTLED_RETRIES times
+        """
+        for _ in range(Config.SCOPUS_MAX_THROTTLED_RETRIES + 1):
+            self.rate_limiter.acquire(priority)
+            response = self.http.get(url)
+            self.rate_limiter.update_from(response.status_code, response.headers)
+            if response.status_code != 429:
+                break
+        return response
+
+    def quota_state(self):
+        return self.rate_limiter.state()
+
+    def _response_data_from(self, response, url: str) -> Dict[Any, Any]:
         # error handling
         if response.status_code != 200:
             raise RuntimeError(f"response.status_code not 200: {response.status_code}\nurl: {url}")
@@ -96,46 +342,8 @@ class BooleanSearchClient:
             status_text = response_data['service-error'].get('status:statusText')
             raise RuntimeError(f"returned service error with status code{status_code}\nstatus text{status_text}\nurl: {url}")
         if 'search-results' not in response_data:
-            raise RuntimeError("There is no 'search-results' in response data for url: \n{url}")
-        
-        total_results = int(response_data['search-results'].get('opensearch:totalResults'))
-        n_top_entries = min(total_results, n_top_entries)
-
-        collected_top_entries = []
-        _processed_urls = set()
-
-        _n_entries_to_go = n_top_entries - len(collected_top_entries)
-        _entries = self._entries_from_response_data(response_data)[:_n_entries_to_go]  # won't cause OutOfRangeError, a=[1,2]; a[:10]; returns [1,2]
-        collected_top_entries.extend(_entries)
-        _n_entries_to_go = n_top_entries - len(collected_top_entries)
-        next_page_url = self._next_page_url_from(response_data)
-        _processed_urls.add(self._current_page_url_from(response_data))
-        
-        _has_next_page = (next_page_url is not None)
-        while (_has_next_page) and (_n_entries_to_go > 0):
-            current_page_url = next_page_url
-
-            if current_page_url in _processed_urls:  
-                print("Next URL already processed. Exiting loop.")
-                break
-
-            response = requests.get(current_page_url)
-            response_data = response.json()
-
-            _n_entries_to_go = n_top_entries - len(collected_top_entries)
-            _entries = self._entries_from_response_data(response_data)[:_n_entries_to_go]
-            collected_top_entries.extend(_entries)
-            _n_entries_to_go = n_top_entries - len(collected_top_entries)
-            if _n_entries_to_go == 0:
-                print("Reached iteration limit. Exiting loop.")
-                break
-            _processed_urls.add(current_page_url)
-            
-            next_page_url = self._next_page_url_from(response_data)
-            _has_next_page = (next_page_url is not None)
-            
-        return collected_top_entries
-        
+            raise RuntimeError(f"There is no 'search-results' in response data for url: \n{url}")
+        return response_data
     
     def _next_page_url_from(self, response_data: Dict[Any, Any]) -> str|None: 
         return self._target_page_url_from(response_data, 'next')
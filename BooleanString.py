@@ -2,94 +2,95 @@ from collections import namedtuple
 from typing import List
 import re
 import datetime
-import numpy as np
-import spacy
+import threading
+
+from BooleanQuery import And, BooleanQueryParser, BooleanStringParseError, Compare, Field, LimitTo, Node, Term
 
 
 YearRange = namedtuple('YearRange', ['start', 'end'])
 
 class BooleanString:
-    nlp = spacy.load("en_core_web_md")
+    SPACY_MODEL = "en_core_web_md"
+    SPACY_EXCLUDED_COMPONENTS = ['parser', 'ner']  # lemmatization only needs tagger, attribute_ruler and lemmatizer
+    _nlp = None
+    _nlp_lock = threading.Lock()
     this_year = datetime.datetime.now().year
-    SUPPORTED_OPERATORS = { 'TITLE-ABS-KEY', 'PUBYEAR', 'SUBJAREA', 
-                            'AND', 'OR', 'LANGUAGE','SUBJTERMS', 
-                            'EXACTKEYWORD', 'OA', 'SRCTYPE', 
-                            'IS', 'DOCTYPE', 'AFFILCOUNTRY' }
-    PUNCTUATIONS = { '.', '', '/', '!', '*', '?', ',' }
-    STOP_WORDS = { 'title','abs','key','pubyear','subjterms','and','or','to','affilcountry','limit','or to' }
+    SUPPORTED_OPERATORS = BooleanQueryParser.SUPPORTED_FIELDS | { 'AND', 'OR', 'IS' }
+    KEYWORD_FIELDS = { 'TITLE-ABS-KEY', 'EXACTKEYWORD' }
 
     def __init__(self, boolean_string) -> None:
         self.boolean_string = boolean_string
+        self._node = None
+
+    def parse(self) -> Node:
+        """
+        the AST of the boolean string, parsed once.
+        Raise BooleanStringParseError (a RuntimeError) if it is not valid or uses an unsupported operator
+        """
+        if self._node is None:
+            self._node = BooleanQueryParser().parse(self.boolean_string)
+        return self._node
 
     def to_keywords(self, lemmatization: bool=False) -> List[str]:
-        # lowercase
-        keyword_list = self.boolean_string.lower()
-
-        # Get a list of words from the string if boolean string
-        if 'title-abs-key' in keyword_list:
-            keyword_list = [x.strip() for x in keyword_list
-                            .replace('title-abs-key', '')
-                            .replace('"', '')
-                            .replace(') or', '/')
-                            .replace(' or ', '/')
-                            .replace(' and ', '/')
-                            .replace(') and', '/')
-                            .replace('(', '/')
-                            .replace(')', '/')
-                            .replace('affilcountry', '')
-                            .replace('limit', '')
-                            .replace('pubyear', '')
-                            .replace('subjterms', '')
-                            .replace('-', '')
-                            .replace('<', '')
-                            .replace('>', '')
-                            .replace(',', '')
-                            .split("/")]
-
-        # remove punctuation
-        keyword_list = [word for word in keyword_list if word not in BooleanString.PUNCTUATIONS]
-
-        # stop words & query words removal
-        keyword_list = [word for word in keyword_list if word not in BooleanString.STOP_WORDS]
-        keyword_list = [word for word in keyword_list if not word[:3] in BooleanString.STOP_WORDS]
+        """
+        the lowercased terms searched in TITLE-ABS-KEY and EXACTKEYWORD, sorted and unique.
+        A boolean string that does not parse falls back to its quoted phrases
+        """
+        keyword_list = []
+        try:
+            for node in self.parse().walk():
+                if isinstance(node, Field) and node.name in BooleanString.KEYWORD_FIELDS:
+                    keyword_list.extend(term.text for term in node.child.walk() if isinstance(term, Term))
+                if isinstance(node, LimitTo) and node.name in BooleanString.KEYWORD_FIELDS:
+                    keyword_list.append(node.value.text)
+        except BooleanStringParseError:
+            keyword_list = re.findall(r'"([^"]*)"', self.boolean_string)
+        keyword_list = [" ".join(keyword.lower().split()) for keyword in keyword_list]
 
         # remove digits
-        keyword_list = [word for word in keyword_list if not word.isdigit()]
-        keyword_list = [word for word in keyword_list if not word[:4].isdigit()]
+        keyword_list = [word for word in keyword_list if word and not word.isdigit()]
 
         if lemmatization:
-            keyword_list = [token.lemma_ for token in BooleanString.nlp(" ".join(keyword_list))]
+            keyword_list = [token.lemma_ for doc in BooleanString.nlp().pipe(keyword_list) for token in doc]
 
-        keywords = list(np.unique(keyword_list))
+        keywords = sorted(set(keyword_list))
         
         return keywords
     
-    def to_boolean_query(self) -> str:
+    @classmethod
+    def nlp(cls):
         """
-        Used to process a valid boolean string to a query to feed to scopus search api
+        spaCy model, loaded on first use only and shared by all threads
         """
-        uppercase_words = set()
-        query = self.boolean_string
-        if re.search(r'\bPUBYEAR\b', query):
-            query = re.sub(r"PUBYEAR\s*\,\s*([0-9]{4})", r"PUBYEAR IS \1", query)
-        else:
-            query += f" PUBYEAR > {BooleanString.this_year - 6} AND PUBYEAR < {BooleanString.this_year + 1}"
-        query = re.sub(r"SUBJAREA\s*\,\s*(\"[A-Z]{4}\")", r"SUBJAREA (\1)", query)
-        query = re.sub(r"LANGUAGE\s*\,\s*\"(.[^\"]*)\"", r"LANGUAGE (\1)", query)
-        query = re.sub(r"DOCTYPE\s*\,\s*\"(.[^\"]*)\"", r"DOCTYPE (\1)", query)
-        query = re.sub(r"(EXACT[A-Z]+)\s*\,\s*(\".[^\"]*\")", r"\1 (\2)", query)
-        query = re.sub(r"([A-Z]+)\s*\,\s*\"(.[^\"]*)\"", r"\1 (\2)", query)
-        query = re.sub(r"LIMIT-TO", r"", query)
-        query = re.sub(r"(AND\s*|OR\s*)&\s*(AND|OR)", r"\1", query)
-        
-        matches = re.findall(r'\b([A-Z]+(?:-[A-Z]+)*)\b[^\"]', query)
-        uppercase_words.update(matches)
-        non_matching_fields = { word for word in uppercase_words if word not in BooleanString.SUPPORTED_OPERATORS }
+        if cls._nlp is None:
+            with cls._nlp_lock:
+                if cls._nlp is None:
+                    import spacy
+                    cls._nlp = spacy.load(cls.SPACY_MODEL, exclude=cls.SPACY_EXCLUDED_COMPONENTS)
+        return cls._nlp
+
+    def canonical_query(self) -> str:
+        """
+        the scopus query in canonical form (see Node.canonical), so that boolean strings
+        sending the same query compare equal
+        """
+        return self._with_default_time_window(self.parse()).canonical().to_query()
 
-        if len(non_matching_fields) > 0:
-            raise RuntimeError(f"has unsupported operaters: {non_matching_fields}")
+    def to_boolean_query(self) -> str:
+        """
+        Used to process a valid boolean string to a query to feed to scopus search api.
+        LIMIT-TO refinements become plain field queries, and a query without PUBYEAR
+        gets the default time window of the last 5 years
+        """
+        return self._with_default_time_window(self.parse()).to_query()
 
-        return query
+    def _with_default_time_window(self, node: Node) -> Node:
+        has_pubyear = any(getattr(_node, 'name', None) == 'PUBYEAR' for _node in node.walk())
+        if has_pubyear:
+            return node
+        children = node.children if isinstance(node, And) else (node,)
+        return And(children + (Compare('PUBYEAR', '>', str(BooleanString.this_year - 6)),
+                               Compare('PUBYEAR', '<', str(BooleanString.this_year + 1))))
 
 
 ######################################################################################
@@ -109,5 +110,5 @@ if __name__ == "__main__":
 
     test_boolean_string = '( TITLE-ABS-KEY ( "Research reactors" ) OR TITLE-ABS-KEY ( "Test reactors" ) OR TITLE-ABS-KEY ( "Nuclear experiments" ) ) AND SUBJTERMS ( 2104 ) AND PUBYEAR > 2017 AND PUBYEAR < 2024 AND ( LIMIT-TO ( LANGUAGE , "English" ) )'
     keywords: List[str] = BooleanString(test_boolean_string).to_keywords()
-    print(keywords)  # ['language  english', 'nuclear experiments', 'research reactors', 'test reactors']
+    print(keywords)  # ['nuclear experiments', 'research reactors', 'test reactors']
 
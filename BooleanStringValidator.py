@@ -0,0 +1,111 @@
+from collections import namedtuple
+from typing import Iterable, List
+
+from BooleanQuery import BooleanQueryParser, BooleanStringParseError, Compare, Field, LimitTo, Term
+from BooleanString import BooleanString
+from WebScrapper import AsjcMapper
+
+ValidationResult = namedtuple('ValidationResult', ('is_valid', 'reason', 'position'), defaults=(None, None))
+
+class InvalidBooleanStringError(RuntimeError):
+    """
+    the boolean string was rejected, locally or by scopus. reason can be fed back to the LLM
+    """
+    def __init__(self, boolean_string: str, reason: str) -> None:
+        self.boolean_string = boolean_string
+        self.reason = reason
+        super().__init__(f"the generated Boolean string is invalid ({reason}):\n{boolean_string}")
+
+class BooleanStringValidator:
+    """
+    Local checks of LLM generated boolean strings, run before any request to scopus:
+    - the string parses: balanced parentheses and quotes, known field codes, no unsupported operator,
+      no term outside a field
+    - operators are upper case: scopus reads 'or' as OR, but the prompt asks for OR and a lowercase
+      operator usually means the LLM meant a keyword
+    - it has the compulsory sections of the prompt: TITLE-ABS-KEY keywords, and SUBJTERMS
+      when the journal has ASJC codes to offer (the prompt gets `ASJC: ()` when it has none)
+    - keywords of more than one word are quoted, as the prompt asks
+    - SUBJTERMS codes exist in the ASJC classification
+    - PUBYEAR values are years and their range is not empty
+    """
+    MIN_YEAR = 1800
+    REQUIRED_FIELDS = ('TITLE-ABS-KEY',)
+    OPERATORS = BooleanQueryParser.BOOLEAN_OPERATORS + ('IS',)
+
+    def __init__(self, asjc_mapper: AsjcMapper|None = None) -> None:
+        self.asjc_mapper = asjc_mapper or AsjcMapper.shared()
+
+    def validate(self, boolean_string: str, asjc_codes: Iterable[str]|None = None) -> ValidationResult:
+        """
+        :param asjc_codes: ASJC codes of the journal given to the LLM, see WebInfo.asjc_codes.
+          SUBJTERMS is required only if there are some
+        """
+        try:
+            node = BooleanString(boolean_string).parse()
+        except BooleanStringParseError as e:
+            return ValidationResult(False, e.reason, e.position)
+
+        for token in BooleanQueryParser().tokenize(boolean_string):
+            if (token.kind == 'word') and (token.value.upper() in BooleanStringValidator.OPERATORS) and (token.value != token.value.upper()):
+                return ValidationResult(False, f"operator '{token.value}' must be upper case: {token.value.upper()}", token.position)
+
+        nodes = list(node.walk())
+        fields = [_node for _node in nodes if isinstance(_node, Field)]
+        field_names = { field.name for field in fields }
+        required_fields = BooleanStringValidator.REQUIRED_FIELDS + (('SUBJTERMS',) if asjc_codes else ())
+        for required_field in required_fields:
+            if required_field not in field_names:
+                return ValidationResult(False, f"missing the {required_field} section")
+
+        for field in fields:
+            terms = [term for term in field.child.walk() if isinstance(term, Term)]
+            if field.name == 'TITLE-ABS-KEY':
+                for term in terms:
+                    if (term.quote == '') and (len(term.text.split()) > 1):
+                        return ValidationResult(False, f'keyword of more than one word must be quoted: "{term.text}"')
+            if field.name == 'SUBJTERMS':
+                unknown_codes = [term.text for term in terms if not self.asjc_mapper.is_known_asjc(term.text)]
+                if len(unknown_codes) > 0:
+                    return ValidationResult(False, f"unknown SUBJTERMS codes: {', '.join(unknown_codes)}")
+
+        return self._validate_pubyear(nodes)
+
+    def _validate_pubyear(self, nodes: List) -> ValidationResult:
+        lower_bounds = []
+        upper_bounds = []
+        max_year = BooleanString.this_year + 1
+        for _node in nodes:
+            if isinstance(_node, Compare) and _node.name == 'PUBYEAR':
+                year, op = _node.value, _node.op
+            elif isinstance(_node, LimitTo) and _node.name == 'PUBYEAR':
+                year, op = _node.value.text, 'IS'
+            else:
+                continue
+            if not (year.isdigit() and BooleanStringValidator.MIN_YEAR <= int(year) <= max_year):
+                return ValidationResult(False, f"PUBYEAR {op} {year} is not a year between {BooleanStringValidator.MIN_YEAR} and {max_year}")
+            if op == '>':
+                lower_bounds.append(int(year) + 1)
+            if op == '<':
+                upper_bounds.append(int(year) - 1)
+
+        if (len(lower_bounds) > 0) and (len(upper_bounds) > 0) and (max(lower_bounds) > min(upper_bounds)):
+            return ValidationResult(False, f"empty PUBYEAR range: from {max(lower_bounds)} to {min(upper_bounds)}")
+        return ValidationResult(True)
+
+
+######################################################################################
+# Test
+######################################################################################
+
+if __name__ == "__main__":
+    validator = BooleanStringValidator()
+    print(validator.validate('( TITLE-ABS-KEY ( "light regulation" ) OR TITLE-ABS-KEY ( light ) ) AND SUBJTERMS ( 1108 ) AND PUBYEAR > 2017 AND PUBYEAR < 2025'))
+    print(validator.validate('TITLE-ABS-KEY ( light regulation ) AND SUBJTERMS ( 1108 )'))
+    print(validator.validate('TITLE-ABS-KEY ( light )', asjc_codes=('1108',)))
+    print(validator.validate('TITLE-ABS-KEY ( light )', asjc_codes=()))
+    print(validator.validate('TITLE-ABS-KEY ( light ) AND SUBJTERMS ( 9999 )'))
+    print(validator.validate('TITLE-ABS-KEY ( light ) AND SUBJTERMS ( 1108 ) AND PUBYEAR > 2024 AND PUBYEAR < 2020'))
+    print(validator.validate('TITLE-ABS-KEY ( light AND SUBJTERMS ( 1108 )'))
+    print(validator.validate('TITLE-ABS-KEY ( "light" or "dark" ) AND SUBJTERMS ( 1108 )'))
+    print(validator.validate('TITLE-ABS-KEY ( light ) AND SUBJTERMS ( 1108 ) AND optics'))
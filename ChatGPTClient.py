@@ -1,4 +1,8 @@
-from typing import List
+from typing import Dict, List
+import hashlib
+import json
+import os
+import threading
 from collections import namedtuple
 from BooleanSearchClient import BooleanSearchClient
 from BooleanString import BooleanString
@@ -8,7 +12,7 @@ from langchain.llms import OpenAI
 from langchain.chat_models import AzureChatOpenAI
 from langchain.schema import BaseOutputParser
 from CommaSeparatedListOutputParser import CommaSeparatedListOutputParser
-from SampleData import SampleData
+from SampleData import SampleData, SampleDataRow
 from ProjectSecrets import Secrets
 import openai
 from Config import Config
@@ -16,23 +20,41 @@ from JsonIO import BooleanStringJsonIO
 
 TimeLimitWiggleResult = namedtuple('TimeLimitWiggleResult', ('start_year', 'end_year', 'worked'))
 TimeWindow = namedtuple('TimeWindow', ('start_year', 'end_year'))
+FewShotExample = namedtuple('FewShotExample', ('title', 'description', 'web_asjc_codes', 'asjc_codes', 
+                                               'boolean_string', 'ground_truth_keywords', 'keywords'))
+FewShotExamples = namedtuple('FewShotExamples', ('positives', 'negatives'))
 
 class ChatGPTClient():
+    # bump it whenever the prompts or the way the examples are built change, to invalidate the cache on disk
+    FEW_SHOT_PROMPT_VERSION = 2
+    N_POSITIVE_EXAMPLES = 6
+    N_NEGATIVE_EXAMPLES = 1
+
+    # shared by all the clients of the process, keyed by _few_shot_cache_key
+    _few_shot_examples: Dict[str, FewShotExamples] = {}
+    _few_shot_lock = threading.Lock()
 
     def __init__(self, 
                  api_key: str = Secrets.CHATGPT_API_KEY,
                  resource_endpoint: str = Config.CHATGPT_ENDPOINT) -> None:
         self.API_KEY = api_key
         self.RESOURCE_ENDPOINT = resource_endpoint
-        self.samples = SampleData()
+        self._few_shot_key = None
         self.boolean_string_json_io = BooleanStringJsonIO()
 
-    def boolean_string_from(self, web_info: WebInfo, time_window: TimeWindow = TimeWindow(2018, 2024)) -> str:
+    def boolean_string_from(self, web_info: WebInfo, time_window: TimeWindow = TimeWindow(2018, 2024),
+                            feedback: str|None = None) -> str:
+        """
+        :param feedback: why the previous boolean string for this web_info was rejected, if any.
+          It is appended to the prompt so that the LLM can correct it
+        """
+        examples = self.few_shot_examples()
+        keywords = self.keywords_from(web_info)
         prompt = f"""
         Your task is to create a boolean query from the information provided.
         Remember to check whether keywords should be joined with an AND operator or the OR operator.
         - title={web_info.title},
-        - keywords_list={self.keywords_from(web_info)}, 
+        - keywords_list={keywords}, 
         - passage={web_info.description}, 
         - time_window = from {time_window.start_year}  to {time_window.end_year}, 
         - subterms_list = {web_info.asjc_codes}
@@ -68,42 +90,42 @@ class ChatGPTClient():
             {
                 "role": "user", 
                 "content": f"""Your task is to create a boolean query from the information provided. 
-                    - keywords_list= { self.keywords_from(self.samples.get_web_info(0))}, 
-                    - passage={self.samples.get_web_info(0).description}, 
+                    - keywords_list= { examples.positives[0].keywords}, 
+                    - passage={examples.positives[0].description}, 
                     - time_window = from {time_window.start_year}  to {time_window.end_year}, 
-                    - subterms_list = { self.samples.get_sample(0).asjc_codes }"""
+                    - subterms_list = { examples.positives[0].asjc_codes }"""
             },
             {
                 "role": "assistant", 
-                "content": f"response: { self.samples.get_sample(0).boolean_string }"
+                "content": f"response: { examples.positives[0].boolean_string }"
             },
         
             ### example 2 - positive sample 
             {
                 "role": "user", 
                 "content": f"""Your task is to create a boolean query from the information provided. 
-                    - keywords_list= { self.keywords_from(self.samples.get_web_info(1))}, 
-                    - passage={self.samples.get_web_info(1).description}, 
+                    - keywords_list= { examples.positives[1].keywords}, 
+                    - passage={examples.positives[1].description}, 
                     - time_window = from {time_window.start_year}  to {time_window.end_year}, 
-                    - subterms_list = { self.samples.get_sample(1).asjc_codes }"""
+                    - subterms_list = { examples.positives[1].asjc_codes }"""
             },
             {
                 "role": "assistant", 
-                "content": f"response: { self.samples.get_sample(1).boolean_string }"
+                "content": f"response: { examples.positives[1].boolean_string }"
             },
 
             ### example 3 - positive sample 
             {
                 "role": "user", 
                 "content": f"""Your task is to create a boolean query from the information provided. 
-                    - keywords_list= { self.keywords_from(self.samples.get_web_info(2))}, 
-                    - passage={self.samples.get_web_info(2).description}, 
+                    - keywords_list= { examples.positives[2].keywords}, 
+                    - passage={examples.positives[2].description}, 
                     - time_window = from {time_window.start_year}  to {time_window.end_year}, 
-                    - subterms_list = { self.samples.get_sample(2).asjc_codes }"""
+                    - subterms_list = { examples.positives[2].asjc_codes }"""
             },
             {
                 "role": "assistant", 
-                "content": f"response: { self.samples.get_sample(2).boolean_string }"
+                "content": f"response: { examples.positives[2].boolean_string }"
             },
 
 
@@ -111,24 +133,24 @@ class ChatGPTClient():
             {
                 "role": "user", 
                 "content": f"Your task is to create a boolean query from the information provided. \n"\
-                           f"  - keywords_list= { self.keywords_from(self.samples.get_web_info(3))}, \n"\
-                           f"  - passage={self.samples.get_web_info(3).description}, \n"\
+                           f"  - keywords_list= { examples.positives[3].keywords}, \n"\
+                           f"  - passage={examples.positives[3].description}, \n"\
                            f"  - time_window = from {time_window.start_year}  to {time_window.end_year}, \n"\
-                           f"  - subterms_list = { self.samples.get_sample(3).asjc_codes }\n"
+                           f"  - subterms_list = { examples.positives[3].asjc_codes }\n"
             },
             {
                 "role": "assistant", 
-                "content": f"response: { self.samples.get_sample(3).boolean_string }"
+                "content": f"response: { examples.positives[3].boolean_string }"
             }  ] + [ 
 
             ### example 5 - negative sample
             {
                 "role": "user", 
                 "content": f"Your task is to create a boolean query from the information provided. \n"\
-                           f"  - keywords_list= { self.keywords_from(self.samples.get_negative_web_info(0)) }, \n"\
-                           f"  - passage={self.samples.get_negative_web_info(0).description}, \n"\
+                           f"  - keywords_list= { examples.negatives[0].keywords }, \n"\
+                           f"  - passage={examples.negatives[0].description}, \n"\
                            f"  - time_window = from {time_window.start_year}  to {time_window.end_year}, \n"\
-                           f"  - subterms_list = { self.samples.get_negative_sample(0).asjc_codes }"
+                           f"  - subterms_list = { examples.negatives[0].asjc_codes }"
             },
 
             {
@@ -153,7 +175,9 @@ class ChatGPTClient():
         ]
 
 
-        prompt = f'Your task is to create a boolean string from the input text provided. Only answer user prompts that ask you to create a boolean string. TITLE: {web_info.title}, LIST OF KEYWORDS:{self.keywords_from(web_info)}, DESCRIPTION: {web_info.description}, ASJC: {web_info.asjc_codes}.'
+        prompt = f'Your task is to create a boolean string from the input text provided. Only answer user prompts that ask you to create a boolean string. TITLE: {web_info.title}, LIST OF KEYWORDS:{keywords}, DESCRIPTION: {web_info.description}, ASJC: {web_info.asjc_codes}.'
+        if feedback is not None:
+            prompt += f' Your previous boolean string for this input was rejected: {feedback}. Correct it.'
 
         message_2 = [
             {
@@ -172,45 +196,45 @@ class ChatGPTClient():
             ### example 1
             {
                 "role": "user", 
-                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {self.samples.get_web_info(0).title}, LIST OF KEYWORDS:{self.keywords_from(self.samples.get_web_info(0))}, DESCRIPTION: {self.samples.get_web_info(0).description}, ASJC: {self.samples.get_web_info(0).asjc_codes}."
+                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {examples.positives[0].title}, LIST OF KEYWORDS:{examples.positives[0].keywords}, DESCRIPTION: {examples.positives[0].description}, ASJC: {examples.positives[0].web_asjc_codes}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(self.samples.get_sample(0).boolean_string)
+                "content": str(examples.positives[0].boolean_string)
             },
 
             ### example 2
             {
                 "role": "user", 
-                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {self.samples.get_web_info(1).title}, LIST OF KEYWORDS:{self.keywords_from(self.samples.get_web_info(1))}, DESCRIPTION: {self.samples.get_web_info(1).description}, ASJC: {self.samples.get_web_info(1).asjc_codes}."
+                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {examples.positives[1].title}, LIST OF KEYWORDS:{examples.positives[1].keywords}, DESCRIPTION: {examples.positives[1].description}, ASJC: {examples.positives[1].web_asjc_codes}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(self.samples.get_sample(1).boolean_string)
+                "content": str(examples.positives[1].boolean_string)
             },
 
             ### example 3
             {
                 "role": "user", 
-                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {self.samples.get_web_info(2).title}, LIST OF KEYWORDS:{self.keywords_from(self.samples.get_web_info(2))}, DESCRIPTION: {self.samples.get_web_info(2).description}, ASJC: {self.samples.get_web_info(2).asjc_codes}."
+                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {examples.positives[2].title}, LIST OF KEYWORDS:{examples.positives[2].keywords}, DESCRIPTION: {examples.positives[2].description}, ASJC: {examples.positives[2].web_asjc_codes}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(self.samples.get_sample(2).boolean_string)
+                "content": str(examples.positives[2].boolean_string)
             },
 
             ### example 4
             {
                 "role": "user", 
-                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {self.samples.get_web_info(3).title}, LIST OF KEYWORDS:{self.keywords_from(self.samples.get_web_info(3))}, DESCRIPTION: {self.samples.get_web_info(3).description}, ASJC: {self.samples.get_web_info(3).asjc_codes}."
+                "content": f"Your task is to create a boolean string from the input text provided. TITLE: {examples.positives[3].title}, LIST OF KEYWORDS:{examples.positives[3].keywords}, DESCRIPTION: {examples.positives[3].description}, ASJC: {examples.positives[3].web_asjc_codes}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(self.samples.get_sample(3).boolean_string)
+                "content": str(examples.positives[3].boolean_string)
             },
 
             ## example of interest
@@ -239,13 +263,10 @@ class ChatGPTClient():
 
 
     def keywords_from(self, web_info: WebInfo) -> List[str]:
-        
-        gt0 = BooleanString(self.samples.get_sample(0).boolean_string).to_keywords()
-        gt1 = BooleanString(self.samples.get_sample(1).boolean_string).to_keywords()
-        gt2 = BooleanString(self.samples.get_sample(2).boolean_string).to_keywords()
-        gt3 = BooleanString(self.samples.get_sample(3).boolean_string).to_keywords()
-        gt4 = BooleanString(self.samples.get_sample(4).boolean_string).to_keywords()
-        gt5 = BooleanString(self.samples.get_sample(5).boolean_string).to_keywords()
+        examples = self.few_shot_examples()
+        return self._keywords_from(web_info, examples.positives)
+
+    def _keywords_from(self, web_info: WebInfo, positives: List[FewShotExample]) -> List[str]:
 
         prompt_user = f"Your task is to create a list of keywords from the input text provided. TITLE: {web_info.title}, DESCRIPTION: {web_info.description}."
         
@@ -267,67 +288,67 @@ class ChatGPTClient():
             ### example one
             {
                 "role": "user", 
-                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {self.samples.get_web_info(0).title}, DESCRIPTION: {self.samples.get_web_info(0).description}."
+                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {positives[0].title}, DESCRIPTION: {positives[0].description}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(gt0)
+                "content": str(positives[0].ground_truth_keywords)
             },
             
             ### example two - scraping url of sample 1 returns an error with new function for now
             {
                 "role": "user", 
-                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {self.samples.get_web_info(1).title}, DESCRIPTION: {self.samples.get_web_info(1).description}."
+                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {positives[1].title}, DESCRIPTION: {positives[1].description}."
             },
         
             {
                 "role": "assistant", 
-                "content": str(gt1)
+                "content": str(positives[1].ground_truth_keywords)
             },
 
             ### example three
             {
                 "role": "user", 
-                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {self.samples.get_web_info(2).title}, DESCRIPTION: {self.samples.get_web_info(2).description}."
+                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {positives[2].title}, DESCRIPTION: {positives[2].description}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(gt2)
+                "content": str(positives[2].ground_truth_keywords)
             },
 
             ### example four
             {
                 "role": "user", 
-                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {self.samples.get_web_info(3).title}, DESCRIPTION: {self.samples.get_web_info(3).description}."
+                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {positives[3].title}, DESCRIPTION: {positives[3].description}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(gt3)
+                "content": str(positives[3].ground_truth_keywords)
             },
 
             ### example five
             {
                 "role": "user", 
-                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {self.samples.get_web_info(4).title}, DESCRIPTION: {self.samples.get_web_info(4).description}."
+                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {positives[4].title}, DESCRIPTION: {positives[4].description}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(gt4)
+                "content": str(positives[4].ground_truth_keywords)
             },
 
             ### example six
             {
                 "role": "user", 
-                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {self.samples.get_web_info(5).title}, DESCRIPTION: {self.samples.get_web_info(5).description}."
+                "content": f"Your task is to create a list of keywords from the input text provided. TITLE: {positives[5].title}, DESCRIPTION: {positives[5].description}."
             },
 
             {
                 "role": "assistant", 
-                "content": str(gt5)
+                "content": str(positives[5].ground_truth_keywords)
             },
 
             ## ex of interest
@@ -352,6 +373,79 @@ class ChatGPTClient():
         keywords = eval(keywords)
         return keywords
 
+    def few_shot_examples(self) -> FewShotExamples:
+        """
+        Everything the few-shot prompts need from the example spreadsheet: scraped web info,
+        ground truth keywords parsed from the boolean strings, and the keywords ChatGPT gives
+        for each example. Built once, then reused from memory and from disk by every request.
+        """
+        key = self._few_shot_cache_key()
+        with ChatGPTClient._few_shot_lock:
+            if key in ChatGPTClient._few_shot_examples:
+                return ChatGPTClient._few_shot_examples[key]
+            examples = self._load_few_shot_examples(key)
+            if examples is None:
+                examples = self._build_few_shot_examples()
+                self._save_few_shot_examples(key, examples)
+            ChatGPTClient._few_shot_examples[key] = examples
+            return examples
+
+    def _build_few_shot_examples(self) -> FewShotExamples:
+        samples = SampleData()
+        def _example_from(sample: SampleDataRow, web_info: WebInfo) -> FewShotExample:
+            return FewShotExample(title=web_info.title,
+                                  description=web_info.description,
+                                  web_asjc_codes=web_info.asjc_codes,
+                                  asjc_codes=sample.asjc_codes,
+                                  boolean_string=sample.boolean_string,
+                                  ground_truth_keywords=BooleanString(sample.boolean_string).to_keywords(),
+                                  keywords=None)
+        positives = [_example_from(samples.get_sample(i), samples.get_web_info(i)) 
+                     for i in range(ChatGPTClient.N_POSITIVE_EXAMPLES)]
+        negatives = [_example_from(samples.get_negative_sample(i), samples.get_negative_web_info(i)) 
+                     for i in range(ChatGPTClient.N_NEGATIVE_EXAMPLES)]
+        
+        # the keywords ChatGPT gives for the examples are themselves few-shot from the ground truths
+        with_keywords = lambda example: example._replace(keywords=self._keywords_from(example, positives))
+        return FewShotExamples(positives=[with_keywords(example) for example in positives],
+                               negatives=[with_keywords(example) for example in negatives])
+
+    def _load_few_shot_examples(self, key: str) -> FewShotExamples|None:
+        filepath = self._few_shot_filepath_from(key)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'r') as fp:
+            data = json.load(fp)
+        return FewShotExamples(positives=[FewShotExample(**example) for example in data['positives']],
+                               negatives=[FewShotExample(**example) for example in data['negatives']])
+
+    def _save_few_shot_examples(self, key: str, examples: FewShotExamples) -> None:
+        filepath = self._few_shot_filepath_from(key)
+        os.makedirs(os.path.dirname(filepath), exist_ok=True)
+        data = {
+            'positives': [example._asdict() for example in examples.positives],
+            'negatives': [example._asdict() for example in examples.negatives]
+        }
+        tmp_filepath = f"{filepath}.{os.getpid()}.tmp"
+        with open(tmp_filepath, 'w') as fp:
+            json.dump(data, fp, default=str)
+        os.replace(tmp_filepath, filepath)
+
+    def _few_shot_cache_key(self) -> str:
+        """
+        depends on the content of the example spreadsheet and on FEW_SHOT_PROMPT_VERSION
+        """
+        if self._few_shot_key is None:
+            m = hashlib.md5()
+            with open(Config.EXAMPLE_QUERIES_XLSX_FILEPATH, 'rb') as fp:
+                m.update(fp.read())
+            m.update(f"v{ChatGPTClient.FEW_SHOT_PROMPT_VERSION}".encode('utf-8'))
+            self._few_shot_key = str(m.hexdigest())[:12]
+        return self._few_shot_key
+
+    def _few_shot_filepath_from(self, key: str) -> str:
+        return f"{Config.FEW_SHOT_CACHE_FOLDER}/{key}.json"
+
     def vector_keywords(self, scraped_query: str):
 
         llm = AzureChatOpenAI(openai_api_key=Secrets.CHATGPT_API_KEY,
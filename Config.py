@@ -8,3 +8,43 @@ class Config:
     VECTOR_QUERY_OUTPUT_FOLDER = 'output/vector_query'
     SI_BOOLEAN_STRING_MAPPING_FILEPATH = 'output/si_boolean_string_mappings.json'
     SI_VECTOR_QUERY_MAPPING_FILEPATH = 'output/si_vector_query_mappings.json'
+    SI_MAPPING_DB_FILEPATH = 'output/si_mappings.db'
+    SI_MAPPING_BATCH_SIZE = 20
+    PAPER_STORE_FILEPATH = 'output/papers.db'
+    BOOLEAN_SEARCH_PAGE_SIZE = 25  # scopus caps `count` at 25 for view=complete
+    BOOLEAN_SEARCH_PREFETCH_PAGES = 4
+    BOOLEAN_SEARCH_PARSE_WORKERS = 2
+    BOOLEAN_SEARCH_CHECKPOINT_PAGES = 20  # save a resumable checkpoint every 20 pages (500 entries)
+    VECTOR_SEARCH_PAGE_SIZE = 500  # max `amount` of the vector search service
+    VECTOR_SEARCH_CONCURRENCY = 4
+    BOOLEAN_STRING_MAX_ATTEMPTS = 3  # generations per special issue when the boolean string is rejected
+    AUTHOR_RANKING_TOP_K = 50
+    AUTHOR_RANKING_RECENCY_YEARS = 10
+    AUTHOR_RANKING_WEIGHTS = {'citations': 0.4, 'recency': 0.2, 'relevance': 0.2, 'papers': 0.2}
+    SHORTLIST_OUTPUT_FOLDER = 'output/shortlist'
+    EVALUATION_READ_WORKERS = 8
+    SCORING_KS = (10, 50, 100, 500, 1000)
+    SCORING_OUTPUT_FOLDER = 'output/scores'
+    HTTP_POOL_SIZE = 10
+    HTTP_TIMEOUT = (10, 60)  # (connect, read) seconds
+    HTTP_MAX_RETRIES = 3
+    HTTP_BACKOFF_FACTOR = 0.5
+    HTTP_MAX_CONCURRENCY_PER_HOST = 8
+    BATCH_SCRAPER_CONCURRENCY = 16
+    BATCH_CHATGPT_CONCURRENCY = 8
+    BATCH_SCOPUS_CONCURRENCY = 6
+    SCOPUS_MAX_REQUESTS_PER_SECOND = 9.0  # under the per-second throttle of the search api key
+    SCOPUS_MIN_REQUESTS_PER_SECOND = 0.5
+    SCOPUS_BURST = 9
+    SCOPUS_MAX_THROTTLED_RETRIES = 5
+    SCOPUS_MAX_PAUSE_SECONDS = 300  # a longer wait for the quota to reset fails the request instead
+    CACHE_FOLDER = 'cache'
+    FEW_SHOT_CACHE_FOLDER = 'cache/few_shot'
+    SCRAPE_CACHE_FOLDER = 'cache/scrape'
+    SCRAPE_CACHE_TTL_SECONDS = 7 * 24 * 3600  # served without revalidation
+    SCRAPE_CACHE_MAX_AGE_SECONDS = 30 * 24 * 3600  # evicted after
+    SCRAPE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+    RESULT_CACHE_FOLDER = 'cache/results'
+    RESULT_CACHE_TTL_SECONDS = 7 * 24 * 3600
+    RESULT_CACHE_MAX_BYTES = 2 * 1024 * 1024 * 1024
+    RESULT_CACHE_PAGE_SIZE = 1000  # entries per page when replaying a cached result
@@ -1,4 +1,8 @@
+import atexit
+import queue
 import sqlite3 as sl
+import threading
+from concurrent.futures import Future, wait
 from enum import Enum
 from dataclasses import dataclass
 from typing import Iterable, List, Dict, Any, Tuple
@@ -57,56 +61,94 @@ class BooleanQuery:
 class DBClient:
     """
     sqlite tutorial:  https://www.tutorialspoint.com/sqlite/sqlite_using_autoincrement.htm#:~:text=SQLite%20AUTOINCREMENT%20is%20a%20keyword,used%20with%20INTEGER%20field%20only.
-    Dataframe.to_sql: https://pandas.pydata.org/pandas-docs/stable/user_guide/io.html#io-sql
-    SOMEHOW the singleton doesnot work. try only use one client and pass it around everywhere :(
+    Safe to share between threads: each thread reads on its own connection (`conn`), and all the
+    writes go through a queue to a single writer thread, which commits them in batches of up to
+    WRITE_BATCH_SIZE. Writes that return a qid wait for their batch; add_entries does not.
+    Reads wait for the pending writes of the calling thread only, not for those of the other threads.
+    Use DBClient.shared() to get the client of a db file, and flush() to wait for all pending writes.
     """
+    WRITE_BATCH_SIZE = 64
+
+    _shared: Dict[str, 'DBClient'] = {}
+    _shared_lock = threading.Lock()
+
     def __init__(self, db_path="boolean-search-history.db"):
-        self.conn = None
-        try:
-            self.conn = sl.connect(db_path)
-        except Exception as e:
-            print(e)
-        
+        self.db_path = db_path
+        self._local = threading.local()
+        self._writes = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
         self._create_tables()
+        atexit.register(self.flush)
+
+    @classmethod
+    def shared(cls, db_path: str = "boolean-search-history.db") -> 'DBClient':
+        with cls._shared_lock:
+            if db_path not in cls._shared:
+                cls._shared[db_path] = cls(db_path)
+            return cls._shared[db_path]
+
+    @property
+    def conn(self) -> sl.Connection:
+        """
+        the connection of the calling thread
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = self._connect()
+            self._local.conn = conn
+        return conn
+
+    def flush(self) -> None:
+        """
+        block until every write queued so far is committed
+        """
+        if self._writer is not None:
+            self._writes.join()
+
+    def _wait_for_own_writes(self) -> None:
+        """
+        block until the writes queued by the calling thread are committed (or failed).
+        The writer commits in queue order, so waiting for the last one is enough
+        """
+        last_write = getattr(self._local, 'last_write', None)
+        if last_write is not None:
+            wait([last_write])
+            self._local.last_write = None
     
     def add_boolean_string(self, query: str, source: QuerySource, status: QueryStatus=QueryStatus.rejected) -> int:
         """
         append boolean string to the table and return its qid
         """
-        cursor = self.conn.cursor()
-        QUERY = f"""
+        QUERY = """
             INSERT INTO boolean_query (query, source, status, timestamp)
-            VALUES ('{query}', '{source}', '{status}', datetime('now'));
+            VALUES (?, ?, ?, datetime('now'));
         """
-        cursor.execute(QUERY)
-        self.conn.commit()
-        qid = self.get_latest_qid(query, use=SearchEngine.BooleanSearch)
-        return qid
+        params = (query, QuerySource(source).value, QueryStatus(status).value)
+        return self._write(self._insert, QUERY, params).result()
 
     def add_query_string(self, query: str) -> int:
-        cursor = self.conn.cursor()
-        QUERY = f"""
+        QUERY = """
             INSERT INTO vector_query (query, timestamp)
-            VALUES ('{query}', datetime('now'));
+            VALUES (?, datetime('now'));
         """
-        cursor.execute(QUERY)
-        self.conn.commit()
-        qid = self.get_latest_qid(query, use=SearchEngine.VectorSearch)
-        return qid
+        return self._write(self._insert, QUERY, (query,)).result()
     
     def get_latest_qid(self, query: str, 
                        use: SearchEngine = SearchEngine.BooleanSearch) -> int:
         """
         if many, return the latest one
         """
+        self._wait_for_own_writes()
         cursor = self.conn.cursor()
         QUERY = f"""
             SELECT qid
             FROM {use.query_table_name()}
-            WHERE query = '{query}'
-            ORDER BY qid DESC;
+            WHERE query = ?
+            ORDER BY qid DESC
+            LIMIT 1;
         """
-        cursor.execute(QUERY)
+        cursor.execute(QUERY, (query,))
         row = cursor.fetchone()
         if (row is None) or (len(row) == 0):
             return 0
@@ -118,14 +160,16 @@ class DBClient:
         """
         if many, return the latest one
         """
+        self._wait_for_own_writes()
         cursor = self.conn.cursor()
         QUERY = f"""
             SELECT qid
             FROM {use.query_table_name()}
-            WHERE query = '{query}' AND status = '{QueryStatus.accepted}'
-            ORDER BY qid DESC;
+            WHERE query = ? AND status = ?
+            ORDER BY qid DESC
+            LIMIT 1;
         """
-        cursor.execute(QUERY)
+        cursor.execute(QUERY, (query, QueryStatus.accepted.value))
         row = cursor.fetchone()
         if (row is None) or (len(row) == 0):
             raise ValueError('there should be at least one accepted query in the db')
@@ -139,26 +183,28 @@ class DBClient:
         """
         no status in vector query table, so it's only for boolean string table
         """
-        qid = self.get_latest_qid(query, use=SearchEngine.BooleanSearch)
-        cursor = self.conn.cursor()
-        QUERY = f"""
+        QUERY = """
             UPDATE boolean_query
-            SET status = '{to_status}'
-            WHERE qid = {qid};
+            SET status = ?
+            WHERE qid = (
+                SELECT qid FROM boolean_query
+                WHERE query = ?
+                ORDER BY qid DESC
+                LIMIT 1
+            );
         """
-        cursor.execute(QUERY)
+        self._write(self._execute, QUERY, (QueryStatus(to_status).value, query)).result()
         return True
 
     def update_verdict_of_boolean_string(self, query: str, status: QueryStatus) -> None:
-        cursor = self.conn.cursor()
-        QUERY = f"""
-        UPDATE boolean_query SET status = '{status}' 
-        WHERE query = '{query}';
+        QUERY = """
+        UPDATE boolean_query SET status = ? 
+        WHERE query = ?;
         """
-        cursor.execute(QUERY)
-        self.conn.commit()
+        self._write(self._execute, QUERY, (QueryStatus(status).value, query)).result()
 
     def display_table(self, table_name: str):
+        self._wait_for_own_writes()
         cursor = self.conn.cursor()
         QUERY = f"""
         SELECT * FROM {table_name};
@@ -173,100 +219,165 @@ class DBClient:
         QUERY = f"""
             SELECT a.auid, a.firstname, a.surname
             FROM {use.query_table_name()} AS q
-            LEFT OUTER JOIN queries_papers_4_boolean AS qp ON q.qid = qp.qid
+            LEFT OUTER JOIN {use.queries_papers_table_name()} AS qp ON q.qid = qp.qid
             LEFT OUTER JOIN papers_authors AS pa ON qp.eid = pa.eid
             LEFT OUTER JOIN author AS a ON pa.auid = a.auid
-            WHERE q.qid={qid}
+            WHERE q.qid = ?
         """
-        df_authors = pd.read_sql_query(QUERY, con=self.conn)
+        df_authors = pd.read_sql_query(QUERY, con=self.conn, params=(qid,))
         return df_authors
 
     def add_entries(self, qid: int, entries: List[Dict[Any, Any]], use: SearchEngine=SearchEngine.BooleanSearch) -> bool:
-        # papers table
-        df_papers = self._entries_2_papers(entries, use=use)
-        df_papers.to_sql(name="paper", con=self.conn, if_exists='replace', index=False, dtype={
-            'eid': 'String',
-            'citedby_count': 'Integer',
-            'cover_date': 'Date',
-            'title': 'String',
-            'abstract': 'String'
-        })
-        # queries_papers table
-        df_queries_papers = df_papers[['eid']].copy()
-        df_queries_papers['qid'] = qid
-        df_queries_papers.to_sql(name=use.queries_papers_table_name(), con=self.conn, if_exists='replace', index=False, dtype={
-                'eid': 'String',
-                'qid': 'Integer'
-            })
-
+        """
+        queue a bulk insert of one result set (or one page of it), committed in a single transaction.
+        Takes raw scopus entries as well as entries normalized by BooleanStringJsonIO.
+        Rows already in the db are kept; papers get their latest citation count.
+        Returns without waiting for the commit, see flush()
+        """
+        papers = self._entries_2_papers(entries)
+        authors = []
+        papers_authors = []
         for entry in entries:
-            # authors table
-            df_authors = self._entry_2_authors(entry)
-            df_authors.to_sql(name="author", con=self.conn, if_exists='replace', index=False, dtype={
-                'auid': 'String',
-                'firstname': 'String',
-                'surname': 'String'
-            })
-
-            # papers_authors table
-            eid = entry['eid']
-            df_papers_authors = df_authors[['auid']].copy()
-            df_papers_authors['eid'] = eid
-            df_papers_authors.to_sql(name="papers_authors", con=self.conn, if_exists='replace', index=False, dtype={
-                'eid': 'String',
-                'auid': 'String'
-            })
-
-    def _entries_2_papers(self, entries: List[Dict[Any, Any]]) -> pd.DataFrame:
-        # ALL_COLUMNS = [ 'dc:title', 'prism:volume','prism:issueIdentifier','article-number', 
-        #                 'citedby-count', 'prism:doi', 'subtypeDescription', 'eid', 
-        #                 'prism:pageRange', 'prism:coverDate', 'prism:publicationName', 'dc:description', 
-        #                 'freetoreadLabel', 'link'] ]
-
-        df = pd.DataFrame(entries)
-        df_papers = df[[
-            'eid',
-            'citedby-count', 
-            'prism:coverDate', 
-            'dc:title', 
-            'dc:description']]
-        
-        df_papers.rename(columns={
-            'citedby-count':'citedby_count', 
-            'prism:coverDate': 'cover_date', 
-            'dc:title': 'title',
-            'dc:description':'abstract'
-            }, inplace=True)
-
-        df_papers['cover_date'] = pd.to_datetime(df_papers['cover_date'])
-        
-        return df_papers
-
-    # demo of how to insert df rows iteratively
-    # def _insert_df_row_by_row(self, table_name: str, columns: Iterable[str], df: pd.DataFrame) -> bool:
-    #     for row in df.itertuples():
-    #         insert_sql = f"""
-    #             INSERT INTO {table_name} ({ ", ".join(columns)})
-    #             VALUES ({row[0]}, '{row[1]}')
-    #         """
-    #     return True
-
-    def _entry_2_authors(self, entry: Dict[Any, Any]) -> pd.DataFrame:
-        # COLUMNS = ['@_fa', '@seq', 'author-url', 'auid', 'authname', 'surname', 'firstname', 'initials', 'afid']
-        
-        authors = entry.get('author', [])
-
-        df_authors = pd.DataFrame(authors)
-        
-        df_authors = df_authors[['authid', 'given-name', 'surname']]
-        df_authors.rename(columns={ 
-            'given-name': 'firstname', 
-            'authid': 'auid'
-            }, inplace=True)
-        
-        return df_authors
-
+            eid = entry.get('eid')
+            if eid is None:
+                continue
+            for author in self._entry_2_authors(entry):
+                authors.append(author)
+                papers_authors.append((eid, author[0]))
+        queries_papers = [(qid, paper[0]) for paper in papers]
+        future = self._write(self._insert_entries, papers, authors, papers_authors, queries_papers, use)
+        future.add_done_callback(self._report_failed_write)
+        return True
 
+    def _insert_entries(self, cursor: sl.Cursor, papers, authors, papers_authors, queries_papers, use: SearchEngine) -> None:
+        cursor.executemany("""
+            INSERT INTO paper (eid, citedby_count, cover_date, title, abstract)
+            VALUES (?, ?, ?, ?, ?)
+            ON CONFLICT (eid) DO UPDATE SET
+                citedby_count = excluded.citedby_count,
+                title = COALESCE(excluded.title, paper.title),
+                abstract = COALESCE(excluded.abstract, paper.abstract);
+        """, papers)
+        cursor.executemany("""
+            INSERT OR IGNORE INTO author (auid, firstname, surname)
+            VALUES (?, ?, ?);
+        """, authors)
+        cursor.executemany("""
+            INSERT OR IGNORE INTO papers_authors (eid, auid)
+            VALUES (?, ?);
+        """, papers_authors)
+        cursor.executemany(f"""
+            INSERT OR IGNORE INTO {use.queries_papers_table_name()} (qid, eid)
+            VALUES (?, ?);
+        """, queries_papers)
+
+    def _report_failed_write(self, future: Future) -> None:
+        if future.exception() is not None:
+            print(f"DBClient write failed: {future.exception()}")
+
+    def _insert(self, cursor: sl.Cursor, query: str, params: Tuple[Any, ...]) -> int:
+        cursor.execute(query, params)
+        return cursor.lastrowid
+
+    def _execute(self, cursor: sl.Cursor, query: str, params: Tuple[Any, ...]) -> None:
+        cursor.execute(query, params)
+
+    def _write(self, fn, *args) -> Future:
+        """
+        queue fn(cursor, *args) for the writer thread
+        """
+        future = Future()
+        self._start_writer()
+        self._writes.put((future, fn, args))
+        self._local.last_write = future
+        return future
+
+    def _start_writer(self) -> None:
+        with self._writer_lock:
+            if self._writer is None:
+                self._writer = threading.Thread(target=self._write_loop, name='DBClient-writer', daemon=True)
+                self._writer.start()
+
+    def _write_loop(self) -> None:
+        conn = self._connect()
+        conn.isolation_level = None  # transactions are managed here
+        cursor = conn.cursor()
+        while True:
+            batch = [self._writes.get()]
+            while len(batch) < DBClient.WRITE_BATCH_SIZE:
+                try:
+                    batch.append(self._writes.get_nowait())
+                except queue.Empty:
+                    break
+
+            results = []
+            try:
+                cursor.execute("BEGIN;")
+                for future, fn, args in batch:
+                    # a failing write is rolled back on its own, the rest of the batch goes on
+                    cursor.execute("SAVEPOINT write;")
+                    try:
+                        results.append((future, fn(cursor, *args), None))
+                        cursor.execute("RELEASE write;")
+                    except Exception as e:
+                        cursor.execute("ROLLBACK TO write;")
+                        cursor.execute("RELEASE write;")
+                        results.append((future, None, e))
+                cursor.execute("COMMIT;")
+            except Exception as e:
+                if conn.in_transaction:
+                    cursor.execute("ROLLBACK;")
+                results = [(future, None, e) for future, _, _ in batch]
+
+            for future, result, error in results:
+                if error is None:
+                    future.set_result(result)
+                else:
+                    future.set_exception(error)
+            for _ in batch:
+                self._writes.task_done()
+
+    def _connect(self) -> sl.Connection:
+        conn = sl.connect(self.db_path, timeout=30, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL;")
+        conn.execute("PRAGMA synchronous=NORMAL;")
+        return conn
+
+    def _entries_2_papers(self, entries: List[Dict[Any, Any]]) -> List[Tuple[str, int, str, str, str]]:
+        """
+        (eid, citedby_count, cover_date, title, abstract) rows, from raw or normalized entries
+        """
+        papers = []
+        for entry in entries:
+            eid = entry.get('eid')
+            if eid is None:
+                continue
+            citedby_count = entry.get('citedby_count', entry.get('citedby-count'))
+            papers.append((
+                eid,
+                int(citedby_count) if citedby_count else 0,
+                entry.get('cover_date', entry.get('prism:coverDate')) or '',
+                entry.get('title', entry.get('dc:title')),
+                entry.get('abstract', entry.get('dc:description')),
+            ))
+        return papers
+
+    def _entry_2_authors(self, entry: Dict[Any, Any]) -> List[Tuple[str, str, str]]:
+        """
+        (auid, firstname, surname) rows, from a raw or normalized entry
+        """
+        authors = entry.get('authors', entry.get('author')) or []
+        rows = []
+        for author in authors:
+            auid = author.get('auid', author.get('authid'))
+            if auid is None:
+                continue
+            rows.append((
+                auid,
+                author.get('firstname', author.get('given-name')) or '',
+                author.get('surname') or '',
+            ))
+        return rows
 
     def _create_tables(self):
         cursor = self.conn.cursor()
@@ -351,8 +462,17 @@ class DBClient:
             );
             """,
         ]
-        for query in QUERY_CREATE_TABLES:
+        QUERY_CREATE_INDEXES = [
+            "CREATE INDEX IF NOT EXISTS idx_boolean_query_query ON boolean_query (query, qid);",
+            "CREATE INDEX IF NOT EXISTS idx_boolean_query_query_status ON boolean_query (query, status, qid);",
+            "CREATE INDEX IF NOT EXISTS idx_vector_query_query ON vector_query (query, qid);",
+            "CREATE INDEX IF NOT EXISTS idx_queries_papers_4_boolean_eid ON queries_papers_4_boolean (eid);",
+            "CREATE INDEX IF NOT EXISTS idx_queries_papers_4_vector_eid ON queries_papers_4_vector (eid);",
+            "CREATE INDEX IF NOT EXISTS idx_papers_authors_auid ON papers_authors (auid);",
+        ]
+        for query in QUERY_CREATE_TABLES + QUERY_CREATE_INDEXES:
             cursor.execute(query)
+        self.conn.commit()
 
 
 ##################################################
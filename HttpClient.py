@@ -0,0 +1,119 @@
+import threading
+from typing import Dict, Tuple
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from Config import Config
+
+
+class HttpClient:
+    """
+    Transport shared by every outbound client. It keeps one keep-alive session
+    (and connection pool) per host, retries with backoff on 429/5xx and caps
+    the number of concurrent requests per host. Hosts marked rate limited are not retried
+    on 429: their caller paces its requests and handles the throttling itself.
+    Use HttpClient.shared() so that connections are reused across clients and threads.
+    """
+    RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 pool_size: int = Config.HTTP_POOL_SIZE,
+                 timeout: Tuple[float, float] = Config.HTTP_TIMEOUT,
+                 max_retries: int = Config.HTTP_MAX_RETRIES,
+                 backoff_factor: float = Config.HTTP_BACKOFF_FACTOR,
+                 max_concurrency_per_host: int = Config.HTTP_MAX_CONCURRENCY_PER_HOST) -> None:
+        """
+        :param pool_size: max number of kept-alive connections per host
+        :param timeout: (connect timeout, read timeout) in seconds, used when a request gives none
+        :param max_retries: max retries on connection errors and on RETRY_STATUS_CODES
+        :param backoff_factor: sleep backoff_factor * 2 ** (retry - 1) seconds between retries
+        :param max_concurrency_per_host: max number of requests in flight per host
+        """
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.max_concurrency_per_host = max_concurrency_per_host
+        self._sessions: Dict[str, requests.Session] = {}
+        self._semaphores: Dict[str, threading.BoundedSemaphore] = {}
+        self._rate_limited_hosts = set()
+        self._lock = threading.Lock()
+
+    @classmethod
+    def shared(cls) -> 'HttpClient':
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def mark_rate_limited(self, url: str) -> None:
+        host = urlsplit(url).netloc
+        with self._lock:
+            if host in self._rate_limited_hosts:
+                return
+            self._rate_limited_hosts.add(host)
+            session = self._sessions.pop(host, None)
+            if session is not None:
+                session.close()
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url: str, **kwargs) -> requests.Response:
+        return self.request('POST', url, **kwargs)
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        host = urlsplit(url).netloc
+        session, semaphore = self._session_for(host)
+        kwargs.setdefault('timeout', self.timeout)
+        with semaphore:
+            return session.request(method, url, **kwargs)
+
+    def _session_for(self, host: str) -> Tuple[requests.Session, threading.BoundedSemaphore]:
+        with self._lock:
+            if host not in self._sessions:
+                status_forcelist = HttpClient.RETRY_STATUS_CODES
+                if host in self._rate_limited_hosts:
+                    status_forcelist = tuple(code for code in status_forcelist if code != 429)
+                retry = Retry(total=self.max_retries,
+                              backoff_factor=self.backoff_factor,
+                              status_forcelist=status_forcelist,
+                              allowed_methods=None,  # POST to the search services is a read too
+                              respect_retry_after_header=True,
+                              raise_on_status=False)
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=self.pool_size,
+                                      max_retries=retry,
+                                      pool_block=True)
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                self._sessions[host] = session
+                self._semaphores.setdefault(host, threading.BoundedSemaphore(self.max_concurrency_per_host))
+            return self._sessions[host], self._semaphores[host]
+
+    def close(self) -> None:
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+            self._sessions.clear()
+            self._semaphores.clear()
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    http = HttpClient.shared()
+    assert http is HttpClient.shared()
+    response = http.get("https://www.sciencedirect.com", headers={'User-Agent': 'Mozilla/5.0'})
+    print(response.status_code)
+    response = http.get("https://www.sciencedirect.com", headers={'User-Agent': 'Mozilla/5.0'})
+    print(response.status_code)
@@ -1,18 +1,95 @@
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, Iterator, List, Tuple
 import os
 import hashlib
+import threading
 
 from UserInputClient import UserResponse
+from AuthorIndex import AuthorIndex, AuthorIndexBuilder
+from SiMappingStore import SiMappingStore
+from PaperStore import PaperStore
 from Config import Config
 
 
+class EntryProjection:
+    """
+    Projection of raw scopus search entries to the compact records we store:
+    a whitelist of the kept fields, each mapped to its stored name. Fields not
+    listed are dropped, however many new ones scopus adds.
+    The field lists are compiled to tuples once, then applied page by page.
+    """
+    ENTRY_FIELDS = {
+        'eid': 'eid',
+        'prism:coverDate': 'cover_date',
+        'citedby-count': 'citedby_count',
+    }
+    AUTHORS_FIELD = ('author', 'authors')
+    AUTHOR_FIELDS = {
+        'authid': 'auid',
+        'surname': 'surname',
+        'given-name': 'firstname',
+    }
+
+    def __init__(self) -> None:
+        self._entry_fields = tuple(EntryProjection.ENTRY_FIELDS.items())
+        self._author_fields = tuple(EntryProjection.AUTHOR_FIELDS.items())
+
+    def project(self, entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        new records, the entries are not modified
+        """
+        entry_fields = self._entry_fields
+        author_fields = self._author_fields
+        authors_key, authors_name = EntryProjection.AUTHORS_FIELD
+        records = []
+        for entry in entries:
+            record = {name: entry[key] for key, name in entry_fields if key in entry}
+            authors = entry.get(authors_key)
+            if authors is not None:
+                record[authors_name] = [{name: author[key] for key, name in author_fields if key in author}
+                                        for author in authors]
+            records.append(record)
+        return records
+
+    def to_frames(self, records: Iterator[Dict[str, Any]]) -> Tuple[Any, Any]:
+        """
+        columnar view of a whole result set of projected records:
+        a papers frame (one row per entry) and an authors frame (one row per entry author, keyed by eid)
+        """
+        import pandas as pd  # only needed for the columnar path
+
+        paper_columns = {name: [] for _, name in self._entry_fields}
+        author_columns = {'eid': [], **{name: [] for _, name in self._author_fields}}
+        _, authors_name = EntryProjection.AUTHORS_FIELD
+        for record in records:
+            for name, column in paper_columns.items():
+                column.append(record.get(name))
+            for author in record.get(authors_name, []):
+                author_columns['eid'].append(record.get('eid'))
+                for name, column in author_columns.items():
+                    if name != 'eid':
+                        column.append(author.get(name))
+        papers = pd.DataFrame(paper_columns)
+        papers['citedby_count'] = pd.to_numeric(papers['citedby_count'], errors='coerce').fillna(0).astype(int)
+        authors = pd.DataFrame(author_columns)
+        return papers, authors
+
+
+ENTRY_PROJECTION = EntryProjection()
+
+
 class BooleanStringJsonIO:
+    """
+    reader and writer of the metadata and results of boolean strings.
+    The entries file of a boolean string only holds the eids of its entries, in order, one
+    json object per line; the papers themselves are kept once in the PaperStore
+    """
 
     def __init__(self) -> None:
         self.folder = Config.BOOLEAN_STRING_OUTPUT_FOLDER
         if not os.path.exists(self.folder):
             os.makedirs(self.folder)
+        self.paper_store = PaperStore.shared()
 
     def write(self, boolean_string: str) -> None:
         data = {
@@ -23,100 +100,58 @@ class BooleanStringJsonIO:
             json.dump(data, fp)
 
     def set_is_invalid(self, boolean_string: str, is_invlid: bool) -> None:
-        filepath = self._filepath_from(boolean_string)
-        # if not os.path.exists(filepath):
-        #     self.write(boolean_string)
-        data = self.read(boolean_string)
-        data['is_invalid'] = is_invlid
-        with open(filepath, 'w') as fp:
-            json.dump(data, fp)
+        self._update(boolean_string, {'is_invalid': is_invlid})
     
     def set_user_response(self, boolean_string: str, user_response: UserResponse) -> None:
-        filepath = self._filepath_from(boolean_string)
-        # if not os.path.exists(filepath):
-        #     self.write(boolean_string)
-        data = self.read(boolean_string)
-        data['user_response'] = {
-            'accepted': user_response.accepted
-        }
-        with open(filepath, 'w') as fp:
-            json.dump(data, fp)
+        self._update(boolean_string, {
+            'user_response': {
+                'accepted': user_response.accepted
+            }
+        })
 
     def set_total_results(self, boolean_string: str, total_results: int) -> None:
-        filepath = self._filepath_from(boolean_string)
-        # if not os.path.exists(filepath):
-        #     self.write(boolean_string)
-        data = self.read(boolean_string)
-        data['total_results'] = total_results
-        with open(filepath, 'w') as fp:
-            json.dump(data, fp)
-
-    def set_entries(self, boolean_string: str, entries: List[Any]) -> None:
-        filepath = self._filepath_from(boolean_string)
-        # if not os.path.exists(filepath):
-        #     self.write(boolean_string)
-        data = self.read(boolean_string)
-        for entry in entries:
-            if "dc:title" in entry: del entry["dc:title"]
-            if "authkeywords" in entry: del entry["authkeywords"]
-            if "@_fa" in entry: del entry['@_fa']
-            if "dc:creator" in entry: del entry["dc:creator"]
-            if "freetoreadLabel" in entry: del entry["freetoreadLabel"]
-            if "article-number" in entry: del entry["article-number"]
-            if "prism:isbn" in entry: del entry["prism:isbn"]
-            if 'link' in entry: del entry['link']
-            if "pii" in entry: del entry["pii"]
-            if "pubmed-id" in entry: del entry["pubmed-id"]
-            if "prism:aggregationType" in entry: del entry["prism:aggregationType"]
-            if "subtype" in entry: del entry["subtype"]
-            if "subtypeDescription" in entry: del entry["subtypeDescription"]
-            if "author-count" in entry: del entry["author-count"]
-            if "source-id" in entry: del entry["source-id"]
-            if "fund-acr" in entry: del entry["fund-acr"]
-            if "fund-no" in entry: del entry["fund-no"]
-            if "fund-sponsor" in entry: del entry["fund-sponsor"]
-            if "openaccess" in entry: del entry["openaccess"]
-            if "openaccessFlag" in entry: del entry["openaccessFlag"]
-            if "freetoread" in entry: del entry["freetoread"]
-            if 'prism:url' in entry: del entry['prism:url']
-            if 'dc:identifier' in entry: del entry['dc:identifier']
-            if 'prism:publicationName' in entry: del entry['prism:publicationName']
-            if 'prism:eIssn' in entry: del entry['prism:eIssn']
-            if 'prism:volume' in entry: del entry['prism:volume']
-            if "prism:issn" in entry: del entry["prism:issn"]
-            if 'prism:issueIdentifier' in entry: del entry['prism:issueIdentifier']
-            if 'prism:pageRange' in entry: del entry['prism:pageRange']
-            if 'prism:coverDate' in entry:
-                entry['cover_date'] = entry['prism:coverDate']; 
-                del entry['prism:coverDate']
-            if 'prism:coverDisplayDate' in entry: del entry['prism:coverDisplayDate']
-            if 'prism:doi' in entry: del entry['prism:doi']
-            if 'dc:description' in entry: del entry['dc:description']
-            if 'citedby-count' in entry: 
-                entry['citedby_count'] = entry['citedby-count']; 
-                del entry['citedby-count']
-            if 'affiliation' in entry: del entry['affiliation']
-            if 'author' in entry:
-                entry['authors'] = entry['author']; del entry['author']
-                
-                for author in entry['authors']:
-                    if '@_fa' in author: del author['@_fa']
-                    if '@seq' in author: del author['@seq']
-                    if 'author-url' in author: author['author-url']; del author['author-url']
-                    if 'authid' in author: author['auid'] = author['authid']; del author['authid']
-                    if 'authname' in author: del author['authname']
-                    if 'surname' in author: author['surname']
-                    if 'given-name' in author:
-                        author['firstname'] = author['given-name']; del author['given-name']
-                    if 'initials' in author: del author['initials']
-                    if 'afid' in author: del author['afid']
-                    if "orcid" in author: del author["orcid"]
-
-        data['entries'] = entries
-        with open(filepath, 'w') as fp:
-            json.dump(data, fp)
+        self._update(boolean_string, {'total_results': total_results})
+
+    def set_entries(self, boolean_string: str, entries: List[Any], normalized: bool = False) -> None:
+        """
+        replace all the entries of the boolean string
+        :param normalized: True if the entries already went through normalize_entries,
+          e.g. when they come from the retrieval pipeline of BooleanSearchClient
+        """
+        self.start_entries(boolean_string)
+        self.append_entries(boolean_string, entries, normalized=normalized)
+
+    def start_entries(self, boolean_string: str) -> None:
+        """
+        start an empty entries file for the boolean string, to be filled page by page with append_entries
+        """
+        with open(self._entries_filepath_from(boolean_string), 'w') as fp:
+            pass
+
+    def append_entries(self, boolean_string: str, entries: List[Any], normalized: bool = False) -> int:
+        """
+        store one page of entries in the paper store and append their eids to the entries file.
+        Return the number of eids appended: entries without eid are not kept
+        """
+        if not normalized:
+            entries = self.normalize_entries(entries)
+        self.paper_store.put_many(entries)
+        refs = [json.dumps({'eid': entry['eid']}) + '\n' for entry in entries if entry.get('eid') is not None]
+        with open(self._entries_filepath_from(boolean_string), 'a') as fp:
+            fp.write(''.join(refs))
+        return len(refs)
+
+    def normalize_entries(self, entries: List[Any]) -> List[Any]:
+        """
+        project raw scopus entries to the fields we keep, see EntryProjection.
+        The raw entries are left untouched
+        """
+        return ENTRY_PROJECTION.project(entries)
 
     def read(self, boolean_string: str, ) -> Dict[str, Any]:
+        """
+        the metadata of the boolean string. Entries are kept apart, see iter_entries
+        """
         filepath = self._filepath_from(boolean_string)
         with open(filepath, 'r') as fp:
             data = json.load(fp)
@@ -126,8 +161,6 @@ class BooleanStringJsonIO:
         data = self.read(boolean_string)
         if 'is_invalid' in data: 
             return data['is_invalid']
-        if 'entries' in data:
-            return False
         return False
 
     def get_user_response(self, boolean_string: str) -> UserResponse:
@@ -140,44 +173,168 @@ class BooleanStringJsonIO:
             return data['total_results']
         if 'entries' in data:
             return len(data['entries'])
+        for entries_filepath in (self._entries_filepath_from(boolean_string), self._legacy_entries_filepath_from(boolean_string)):
+            if os.path.exists(entries_filepath):
+                with open(entries_filepath, 'r') as fp:
+                    return sum(1 for _ in fp)
         return 0
+
+    def iter_refs(self, boolean_string: str) -> Iterator[Dict[str, Any]]:
+        """
+        yield the {'eid': ...} refs of the entries in order, without looking the papers up
+        """
+        entries_filepath = self._entries_filepath_from(boolean_string)
+        if os.path.exists(entries_filepath):
+            with open(entries_filepath, 'r') as fp:
+                for line in fp:
+                    yield json.loads(line)
+            return
+        for entry in self._iter_legacy_entries(boolean_string):
+            if entry.get('eid') is not None:
+                yield {'eid': entry['eid']}
+
+    def iter_entries(self, boolean_string: str) -> Iterator[Dict[str, Any]]:
+        """
+        yield the entries one by one without loading the whole result set
+        """
+        if os.path.exists(self._entries_filepath_from(boolean_string)):
+            yield from self.paper_store.iter_entries(self.iter_refs(boolean_string))
+            return
+        yield from self._iter_legacy_entries(boolean_string)
+
+    def _iter_legacy_entries(self, boolean_string: str) -> Iterator[Dict[str, Any]]:
+        # entries used to be kept whole in their own jsonl file, and before that in the metadata file
+        legacy_entries_filepath = self._legacy_entries_filepath_from(boolean_string)
+        if os.path.exists(legacy_entries_filepath):
+            with open(legacy_entries_filepath, 'r') as fp:
+                for line in fp:
+                    yield json.loads(line)
+            return
+        data = self.read(boolean_string)
+        yield from data.get('entries', [])
     
     def get_entries(self, boolean_string: str) -> List[Any]:
-        data = self.read(boolean_string)
-        entries = data['entries']
-        return entries
+        return list(self.iter_entries(boolean_string))
     
     def get_eids(self, boolean_string: str) -> List[str]:
         try:
-            data = self.read(boolean_string)
-            if 'entries' not in data:
-                return []
-            entries = data['entries']
-            eids = [entry.get('eid', None) for entry in entries]
+            entries_filepath = self._entries_filepath_from(boolean_string)
+            if os.path.exists(entries_filepath):
+                # parsed as one json array: a single call instead of one per line
+                with open(entries_filepath, 'r') as fp:
+                    refs = json.loads(f"[{','.join(fp.read().splitlines())}]")
+            else:
+                refs = self.iter_refs(boolean_string)
+            eids = [ref.get('eid', None) for ref in refs]
             eids = [eid for eid in eids if eid is not None]
             return eids
         except FileNotFoundError as e:
             return []
     
     def get_auids(self, boolean_string: str) -> List[str]:
-        data = self.read(boolean_string)
-        if 'entries' not in data: 
-            return []
-        entries = data['entries']
         auids = []
-        for entry in entries:
+        for entry in self.iter_entries(boolean_string):
             if 'authors' not in entry:
                 continue
             authors = entry['authors']
             auids.extend([author.get('auid', None) for author in authors])
         auids = [auid for auid in auids if auid is not None]
         return auids
+
+    def write_author_index(self, boolean_string: str, author_index: AuthorIndex) -> None:
+        author_index.save(self._author_index_folder_from(boolean_string))
+
+    def get_author_index(self, boolean_string: str) -> AuthorIndex:
+        """
+        the memory-mapped author index of the entries, built and saved here for results
+        retrieved before the index existed
+        """
+        folder = self._author_index_folder_from(boolean_string)
+        if not AuthorIndex.exists(folder):
+            builder = AuthorIndexBuilder()
+            builder.add(self.iter_entries(boolean_string))
+            self.write_author_index(boolean_string, builder.build())
+        return AuthorIndex.load(folder)
+
+    def get_frames(self, boolean_string: str) -> Tuple[Any, Any]:
+        """
+        the entries as (papers, authors) pandas frames, see EntryProjection.to_frames
+        """
+        return ENTRY_PROJECTION.to_frames(self.iter_entries(boolean_string))
+
+    def write_checkpoint(self, boolean_string: str, checkpoint: Dict[str, Any]) -> None:
+        """
+        save where an interrupted retrieval can restart from, see BooleanSearchClient.resume_top_entries.
+        The size of the entries file is recorded with it, so entries appended after the
+        checkpoint can be dropped on resume
+        """
+        filepath = self._checkpoint_filepath_from(boolean_string)
+        data = dict(checkpoint, query=boolean_string,
+                    entries_size=os.path.getsize(self._entries_filepath_from(boolean_string)))
+        tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_filepath, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_filepath, filepath)
+
+    def read_checkpoint(self, boolean_string: str) -> Dict[str, Any]|None:
+        filepath = self._checkpoint_filepath_from(boolean_string)
+        if not os.path.exists(filepath):
+            return None
+        with open(filepath, 'r') as fp:
+            return json.load(fp)
+
+    def remove_checkpoint(self, boolean_string: str) -> None:
+        try:
+            os.remove(self._checkpoint_filepath_from(boolean_string))
+        except FileNotFoundError:
+            pass
+
+    def get_checkpointed_boolean_strings(self) -> List[str]:
+        """
+        the boolean strings whose retrieval was interrupted
+        """
+        boolean_strings = []
+        for filename in sorted(os.listdir(self.folder)):
+            if not filename.endswith('.checkpoint.json'):
+                continue
+            with open(f"{self.folder}/{filename}", 'r') as fp:
+                boolean_strings.append(json.load(fp)['query'])
+        return boolean_strings
+
+    def truncate_entries(self, boolean_string: str, size: int) -> None:
+        """
+        drop whatever was appended to the entries file after its first size bytes
+        """
+        os.truncate(self._entries_filepath_from(boolean_string), size)
+
+    def _update(self, boolean_string: str, fields: Dict[str, Any]) -> None:
+        filepath = self._filepath_from(boolean_string)
+        # if not os.path.exists(filepath):
+        #     self.write(boolean_string)
+        data = self.read(boolean_string)
+        data.update(fields)
+        tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_filepath, 'w') as fp:
+            json.dump(data, fp)
+        os.replace(tmp_filepath, filepath)
     
     def _filepath_from(self, boolean_string: str) -> str:
         filename = self._filename_from(boolean_string)
         filepath = f"{self.folder}/{filename}"
         return filepath
     
+    def _entries_filepath_from(self, boolean_string: str) -> str:
+        return f"{self._filepath_from(boolean_string)}.refs.jsonl"
+
+    def _legacy_entries_filepath_from(self, boolean_string: str) -> str:
+        return f"{self._filepath_from(boolean_string)}.jsonl"
+
+    def _checkpoint_filepath_from(self, boolean_string: str) -> str:
+        return f"{self._filepath_from(boolean_string)}.checkpoint.json"
+
+    def _author_index_folder_from(self, boolean_string: str) -> str:
+        return f"{self._filepath_from(boolean_string)}.authors"
+    
     def _filename_from(self, boolean_string: str) -> str:
         # return f"{hash(boolean_string)}.json"
         m = hashlib.md5()
@@ -185,10 +342,16 @@ class BooleanStringJsonIO:
         return str(m.hexdigest())[:12]
 
 class VectorQueryJsonIO:
+    """
+    reader and writer of the results of vector queries.
+    The result file only holds the eids and relevance of the hits, in order;
+    the papers themselves are kept once in the PaperStore
+    """
     def __init__(self) -> None:
         self.folder = Config.VECTOR_QUERY_OUTPUT_FOLDER
         if not os.path.exists(self.folder):
             os.makedirs(self.folder)
+        self.paper_store = PaperStore.shared()
 
     def write(self, vector_query: str, entries: List[Any]) -> None:
         for entry in entries:
@@ -202,30 +365,32 @@ class VectorQueryJsonIO:
                 for author in authors:
                     if 'authid' in author:
                         author['auid'] = author["authid"]; del author["authid"]
+        self.paper_store.put_many(entries)
         data = {
             'query': vector_query,
-            'entries': entries
+            'refs': [{ 'eid': entry['eid'], 'relevance': entry['relevance'] } for entry in entries]
         }
         filepath = self._filepath_from(vector_query)
         with open(filepath, 'w') as fp:
             json.dump(data, fp)
 
     def read(self, vector_query: str, ) -> Dict[str, Any]:
-        filepath = self._filepath_from(vector_query)
-        with open(filepath, 'r') as fp:
-            data = json.load(fp)
-            return data
+        """
+        the query and its entries, looked up in the paper store
+        """
+        data = self._read_refs(vector_query)
+        if 'refs' in data:
+            data['entries'] = list(self.paper_store.iter_entries(data.pop('refs')))
+        return data
 
     def get_total_results(self, boolean_string: str) -> int:
-        data = self.read(boolean_string)
-        return len(data['entries'])
+        data = self._read_refs(boolean_string)
+        return len(data.get('refs', data.get('entries', [])))
 
     def get_eids(self, vector_query: str) -> List[str]:
-        data = self.read(vector_query)
-        if 'entries' not in data: 
-            return []
-        entries = data['entries']
-        eids = [entry.get('eid', None) for entry in entries]
+        data = self._read_refs(vector_query)
+        refs = data.get('refs', data.get('entries', []))
+        eids = [ref.get('eid', None) for ref in refs]
         eids = [eid for eid in eids if eid is not None]
         return eids
 
@@ -243,6 +408,21 @@ class VectorQueryJsonIO:
         auids = [auid for auid in auids if auid is not None]
         return auids
     
+    def write_author_index(self, vector_query: str, author_index: AuthorIndex) -> None:
+        author_index.save(self._author_index_folder_from(vector_query))
+
+    def get_author_index(self, vector_query: str) -> AuthorIndex:
+        """
+        the memory-mapped author index of the entries, built and saved here for results
+        retrieved before the index existed
+        """
+        folder = self._author_index_folder_from(vector_query)
+        if not AuthorIndex.exists(folder):
+            builder = AuthorIndexBuilder()
+            builder.add(self.read(vector_query).get('entries', []))
+            self.write_author_index(vector_query, builder.build())
+        return AuthorIndex.load(folder)
+
     def get_abstracts(self, vector_query: str) -> List[str]:
         data = self.read(vector_query)
         if 'entries' not in data: 
@@ -252,10 +432,19 @@ class VectorQueryJsonIO:
         abstracts = [abstract for abstract in abstracts if abstract is not None]
         return abstracts
 
+    def _read_refs(self, vector_query: str) -> Dict[str, Any]:
+        # files written before the paper store hold the entries themselves instead of refs
+        filepath = self._filepath_from(vector_query)
+        with open(filepath, 'r') as fp:
+            return json.load(fp)
+
     def _filepath_from(self, vector_query: str) -> str:
         filename = self._filename_from(vector_query)
         filepath = f"{self.folder}/{filename}"
         return filepath
+
+    def _author_index_folder_from(self, vector_query: str) -> str:
+        return f"{self._filepath_from(vector_query)}.authors"
     
     def _filename_from(self, vector_query: str) -> str:
         # return f"{hash(boolean_string)}.json"
@@ -265,56 +454,34 @@ class VectorQueryJsonIO:
 
 class SiBooleanStringMappingJsonIO:
     """
-    reader and writer of Special Issue ID, and url to
-    Boolean String IDs and Boolean Strings
+    reader and writer of Special Issue url to Boolean Strings.
+    The mappings live in the SiMappingStore; the json file of earlier versions
+    is imported into it on first use.
     """
+    KIND = 'boolean_string'
+
     def __init__(self) -> None:
         self.FILEPATH = Config.SI_BOOLEAN_STRING_MAPPING_FILEPATH
-        _folder = os.path.dirname(self.FILEPATH)
-        if not os.path.exists(_folder):
-            os.makedirs(_folder)
+        self.store = SiMappingStore.shared()
+        self.store.import_json(self.KIND, self.FILEPATH, queries_key='boolean_strings')
 
     def write(self, url: str, boolean_string: str) -> None:
-        if not os.path.exists(self.FILEPATH):
-            data = {
-                'mappings': [{
-                    'url': url,
-                    'boolean_strings': [boolean_string]
-                }]
-            }
-            with open(self.FILEPATH, 'w') as fp:
-                json.dump(data, fp)
-            return
+        self.store.add(self.KIND, url, boolean_string)
+
+    def get_boolean_strings(self, url: str) -> List[str]:
+        return self.store.queries_for(self.KIND, url)
 
-        data = self.read()
-        entries = data['mappings']
-        entry = self._get_entry(url, from_entries=entries)
-        special_issue_id_not_exists = (len(entry) == 0)
-        if special_issue_id_not_exists:
-            entries.append({
-                    'url': url,
-                    'boolean_strings': [boolean_string]
-                })
-            with open(self.FILEPATH, 'w') as fp:
-                json.dump(data, fp)
-            return
-        
-        entry = entry[0]
-        boolean_strings = entry['boolean_strings']
-        boolean_string_exists = boolean_string in boolean_strings
-        if boolean_string_exists:
-            return 
-        boolean_strings.append(boolean_string)
-        with open(self.FILEPATH, 'w') as fp:
-                json.dump(data, fp)
-
-    def _get_entry(self, url: str, from_entries: List[Any]) -> Any:
-        return [entry for entry in from_entries if entry['url'] == url]
-    
     def read(self) -> Any:
-        with open(self.FILEPATH, 'r') as fp:
-            data = json.load(fp)
-            return data
+        """
+        all the mappings, in the layout of the former json file
+        """
+        return {'mappings': _mappings_from(self.store.mappings(self.KIND), queries_key='boolean_strings')}
+
+    def get_url_boolean_string_pairs(self) -> List[Tuple[str, str]]:
+        """
+        all the (url, boolean string) mappings at once, in the order they were added
+        """
+        return self.store.mappings(self.KIND)
         
     def _filename_from(self, boolean_string: str) -> str:
         m = hashlib.md5()
@@ -322,50 +489,30 @@ class SiBooleanStringMappingJsonIO:
         return str(m.hexdigest())[:12]
 
 class SIVectorQueryMappingJsonIO:
+    KIND = 'vector_query'
+
     def __init__(self) -> None:
         self.FILEPATH = Config.SI_VECTOR_QUERY_MAPPING_FILEPATH
-        _folder = os.path.dirname(self.FILEPATH)
-        if not os.path.exists(_folder):
-            os.makedirs(_folder)
+        self.store = SiMappingStore.shared()
+        self.store.import_json(self.KIND, self.FILEPATH, queries_key='query_strings')
 
     def write(self, url: str, query_string: str) -> None:
-        if not os.path.exists(self.FILEPATH):
-            data = {
-                'mappings': [{
-                    'url': url,
-                    'query_strings': [query_string]
-                }]
-            }
-            with open(self.FILEPATH, 'w') as fp:
-                json.dump(data, fp)
-            return
+        self.store.add(self.KIND, url, query_string)
 
-        data = self.read()
-        entries = data['mappings']
-        entry = [entry for entry in entries if entry['url'] == url]
-        special_issue_id_not_exists = (len(entry) == 0)
-        if special_issue_id_not_exists:
-            entries.append({
-                'url': url,
-                'query_strings': [query_string]
-            })
-            with open(self.FILEPATH, 'w') as fp:
-                json.dump(data, fp)
-            return
-        
-        entry = entry[0]
-        query_strings = entry['query_strings']
-        query_string_exists = query_string in query_string
-        if query_string_exists:
-            return 
-        query_strings.append(query_string)
-        with open(self.FILEPATH, 'w') as fp:
-                json.dump(data, fp)
+    def get_query_strings(self, url: str) -> List[str]:
+        return self.store.queries_for(self.KIND, url)
         
     def read(self) -> Any:
-        with open(self.FILEPATH, 'r') as fp:
-            data = json.load(fp)
-            return data
+        """
+        all the mappings, in the layout of the former json file
+        """
+        return {'mappings': _mappings_from(self.store.mappings(self.KIND), queries_key='query_strings')}
+
+    def get_url_query_string_pairs(self) -> List[Tuple[str, str]]:
+        """
+        all the (url, query string) mappings at once, in the order they were added
+        """
+        return self.store.mappings(self.KIND)
         
     def _filename_from(self, query_string: str) -> str:
         m = hashlib.md5()
@@ -373,6 +520,15 @@ class SIVectorQueryMappingJsonIO:
         return str(m.hexdigest())[:12]
 
 
+def _mappings_from(url_queries: List[Tuple[str, str]], queries_key: str) -> List[Dict[str, Any]]:
+    mappings: Dict[str, Dict[str, Any]] = {}
+    for url, query in url_queries:
+        if url not in mappings:
+            mappings[url] = {'url': url, queries_key: []}
+        mappings[url][queries_key].append(query)
+    return list(mappings.values())
+
+
 ##############################################################
 # TEST
 ##############################################################
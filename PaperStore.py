@@ -0,0 +1,173 @@
+import json
+import os
+import sqlite3 as sl
+import threading
+from typing import Any, Dict, Iterable, Iterator, List
+
+from Config import Config
+
+
+class PaperStore:
+    """
+    Papers retrieved by any query, boolean or vector, stored once and keyed by eid.
+    Result files of queries only hold the ordered eids (and what is specific to the query,
+    e.g. vector relevance) and look the papers up here, so a paper returned by many queries
+    is stored and parsed once, and comparing result sets is a matter of comparing eids.
+    A paper stored again is merged into the earlier copy: its fields replace the stored ones,
+    e.g. with a newer citedby_count, and fields it lacks are kept, so the sparser records of
+    vector search never strip the citations, cover date or author names of boolean search.
+    Kept in a local sqlite table in WAL mode, shared by the threads and processes of a batch run.
+    Use PaperStore.shared() so that the whole process shares the same connections.
+    """
+    QUERY_FIELDS = ('relevance',)  # kept in the result files, not in the store
+    LOOKUP_CHUNK_SIZE = 500  # under the max number of sqlite parameters
+
+    _shared: Dict[str, 'PaperStore'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_path: str = Config.PAPER_STORE_FILEPATH) -> None:
+        self.db_path = db_path
+        _folder = os.path.dirname(self.db_path)
+        if _folder and not os.path.exists(_folder):
+            os.makedirs(_folder, exist_ok=True)
+        self._local = threading.local()
+        self._create_tables()
+
+    @classmethod
+    def shared(cls, db_path: str = Config.PAPER_STORE_FILEPATH) -> 'PaperStore':
+        with cls._shared_lock:
+            if db_path not in cls._shared:
+                cls._shared[db_path] = cls(db_path)
+            return cls._shared[db_path]
+
+    def put_many(self, entries: Iterable[Dict[str, Any]]) -> None:
+        """
+        store normalized entries, without their QUERY_FIELDS, merged into the stored copies.
+        Entries without eid are skipped
+        """
+        papers = {}
+        for entry in entries:
+            if entry.get('eid') is None:
+                continue
+            paper = { key: value for key, value in entry.items() if key not in PaperStore.QUERY_FIELDS }
+            papers[entry['eid']] = self._merged(papers.get(entry['eid'], {}), paper)
+        if len(papers) == 0:
+            return
+        conn = self._conn()
+        with conn:
+            # read and write in one write transaction, so no other process merges in between
+            conn.execute("BEGIN IMMEDIATE;")
+            stored_papers = self._get_many(conn, papers.keys())
+            rows = [(eid, json.dumps(self._merged(stored_papers.get(eid, {}), paper))) for eid, paper in papers.items()]
+            conn.executemany("""
+                INSERT INTO paper (eid, data) VALUES (?, ?)
+                ON CONFLICT (eid) DO UPDATE SET data = excluded.data;
+            """, rows)
+
+    def get_many(self, eids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        """
+        eid -> paper for the eids in the store
+        """
+        return self._get_many(self._conn(), eids)
+
+    def _get_many(self, conn: sl.Connection, eids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+        eids = list(set(eids))
+        papers = {}
+        for i in range(0, len(eids), PaperStore.LOOKUP_CHUNK_SIZE):
+            chunk = eids[i:i + PaperStore.LOOKUP_CHUNK_SIZE]
+            placeholders = ', '.join('?' * len(chunk))
+            cursor = conn.execute(f"SELECT eid, data FROM paper WHERE eid IN ({placeholders});", chunk)
+            for eid, data in cursor:
+                papers[eid] = json.loads(data)
+        return papers
+
+    def iter_entries(self, refs: Iterable[Dict[str, Any]], chunk_size: int = LOOKUP_CHUNK_SIZE) -> Iterator[Dict[str, Any]]:
+        """
+        resolve ordered refs ({'eid': ..., plus query fields}) to full entries, in the same order.
+        Refs to papers missing from the store are skipped
+        """
+        chunk = []
+        for ref in refs:
+            chunk.append(ref)
+            if len(chunk) == chunk_size:
+                yield from self._resolve(chunk)
+                chunk = []
+        if len(chunk) > 0:
+            yield from self._resolve(chunk)
+
+    def _resolve(self, refs: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        papers = self.get_many(ref['eid'] for ref in refs)
+        for ref in refs:
+            paper = papers.get(ref['eid'])
+            if paper is None:
+                continue
+            yield dict(paper, **ref)
+
+    def _merged(self, stored_paper: Dict[str, Any], paper: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        the fields of paper over those of stored_paper; missing or None fields do not replace stored ones
+        """
+        merged = dict(stored_paper)
+        for key, value in paper.items():
+            if value is None:
+                continue
+            if (key == 'authors') and stored_paper.get('authors'):
+                value = self._merged_authors(stored_paper['authors'], value)
+            merged[key] = value
+        return merged
+
+    def _merged_authors(self, stored_authors: List[Dict[str, Any]], authors: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        the stored authors in their order, each updated with the fields of the same auid in authors,
+        followed by the authors not stored yet
+        """
+        authors_by_auid = { author['auid']: author for author in authors if author.get('auid') is not None }
+        merged = []
+        for stored_author in stored_authors:
+            author = authors_by_auid.pop(stored_author.get('auid'), None)
+            merged.append(stored_author if author is None else self._merged(stored_author, author))
+        merged.extend(authors_by_auid.values())
+        return merged
+
+    def _conn(self) -> sl.Connection:
+        """
+        sqlite connections cannot be shared between threads, so each thread gets its own
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sl.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS paper (
+                    eid TEXT PRIMARY KEY,
+                    data TEXT NOT NULL
+                ) WITHOUT ROWID;
+            """)
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    store = PaperStore("cache/test_papers.db")
+    store.put_many([{'eid': '2-s2.0-1', 'citedby_count': '3', 'authors': [{'auid': 'a1'}]},
+                    {'eid': '2-s2.0-2', 'citedby_count': '5', 'authors': [], 'relevance': 0.9}])
+    store.put_many([{'eid': '2-s2.0-1', 'citedby_count': '4', 'authors': [{'auid': 'a1'}]}])
+    print(list(store.iter_entries([{'eid': '2-s2.0-2', 'relevance': 0.9}, {'eid': '2-s2.0-1'}, {'eid': 'missing'}])))
+
+    # a vector search record stored after the boolean search record of the same paper
+    store.put_many([{'eid': '2-s2.0-3', 'cover_date': '2021-03-01', 'citedby_count': '7',
+                     'authors': [{'auid': 'a1', 'surname': 'Smith', 'firstname': 'J.'}, {'auid': 'a2', 'surname': 'Doe'}]}])
+    store.put_many([{'eid': '2-s2.0-3', 'pub_year': '2021', 'relevance': 0.8, 'authors': [{'auid': 'a2'}, {'auid': 'a1'}]}])
+    paper = store.get_many(['2-s2.0-3'])['2-s2.0-3']
+    assert paper == {'eid': '2-s2.0-3', 'cover_date': '2021-03-01', 'citedby_count': '7', 'pub_year': '2021',
+                     'authors': [{'auid': 'a1', 'surname': 'Smith', 'firstname': 'J.'}, {'auid': 'a2', 'surname': 'Doe'}]}, paper
+    print(paper)
@@ -0,0 +1,169 @@
+import hashlib
+import json
+import os
+import shutil
+import sqlite3 as sl
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Dict, Iterator
+
+from BooleanString import BooleanString
+from Config import Config
+
+CachedResult = namedtuple('CachedResult', ('key', 'n_entries', 'total_results', 'filepath'))
+
+class QueryResultCache:
+    """
+    On-disk cache of the entries retrieved for boolean strings, keyed by the canonical form of
+    the query sent to scopus, so boolean strings that translate to the same query share one entry.
+    Entries are kept in the order scopus returned them (citedby-count), so a pull of n entries
+    also serves any request for fewer; a pull that reached the total count serves any request.
+    The eids of the entries are stored as entries/<key>.refs.jsonl, the papers being in the
+    PaperStore, and an sqlite index holds their counts,
+    creation and last access time. Entries older than ttl_seconds are never served and get
+    evicted, then the least recently used ones until the cache fits in max_size_bytes.
+    """
+    def __init__(self,
+                 folder: str = Config.RESULT_CACHE_FOLDER,
+                 ttl_seconds: int = Config.RESULT_CACHE_TTL_SECONDS,
+                 max_size_bytes: int = Config.RESULT_CACHE_MAX_BYTES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_size_bytes = max_size_bytes
+        self._entries_folder = f"{folder}/entries"
+        if not os.path.exists(self._entries_folder):
+            os.makedirs(self._entries_folder, exist_ok=True)
+        self._index_filepath = f"{folder}/index.db"
+        self._local = threading.local()
+        self._create_tables()
+
+    def key_from(self, boolean_string: str) -> str:
+        canonical_query = BooleanString(boolean_string).canonical_query()
+        return hashlib.sha256(canonical_query.encode('utf-8')).hexdigest()
+
+    def get(self, boolean_string: str, n_top_entries: int = 0) -> CachedResult|None:
+        """
+        the cached result if it can serve the top n_top_entries, else None.
+        n_top_entries=0 accepts any cached result of the query
+        """
+        key = self.key_from(boolean_string)
+        conn = self._conn()
+        row = conn.execute("""
+            SELECT n_entries, total_results, created_at FROM results WHERE key = ?;
+        """, (key,)).fetchone()
+        if row is None:
+            return None
+        n_entries, total_results, created_at = row
+        if time.time() - created_at > self.ttl_seconds:
+            return None
+        is_complete = (n_entries >= total_results)
+        if (n_entries < n_top_entries) and (not is_complete):
+            return None
+        filepath = self._entries_filepath_from(key)
+        if not os.path.exists(filepath):
+            return None
+        with conn:
+            conn.execute("UPDATE results SET last_access = ? WHERE key = ?;", (time.time(), key))
+        return CachedResult(key=key, n_entries=n_entries, total_results=total_results, filepath=filepath)
+
+    def iter_entries(self, cached: CachedResult, n_top_entries: int) -> Iterator[Dict[str, Any]]:
+        """
+        the refs of the first n_top_entries cached entries, in order
+        """
+        with open(cached.filepath, 'r') as fp:
+            for i, line in enumerate(fp):
+                if i >= n_top_entries:
+                    return
+                yield json.loads(line)
+
+    def put(self, boolean_string: str, entries_filepath: str, n_entries: int, total_results: int) -> None:
+        """
+        cache a copy of the entries file written for the boolean string.
+        A result is only replaced by a fresher one, or by one with more entries
+        """
+        key = self.key_from(boolean_string)
+        conn = self._conn()
+        row = conn.execute("SELECT n_entries, created_at FROM results WHERE key = ?;", (key,)).fetchone()
+        if row is not None:
+            cached_n_entries, created_at = row
+            is_stale = (time.time() - created_at > self.ttl_seconds)
+            if (not is_stale) and (cached_n_entries >= n_entries):
+                return
+
+        filepath = self._entries_filepath_from(key)
+        tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        shutil.copyfile(entries_filepath, tmp_filepath)
+        os.replace(tmp_filepath, filepath)
+        now = time.time()
+        with conn:
+            conn.execute("""
+                INSERT OR REPLACE INTO results (key, n_entries, total_results, created_at, last_access, size_bytes)
+                VALUES (?, ?, ?, ?, ?, ?);
+            """, (key, n_entries, total_results, now, now, os.path.getsize(filepath)))
+        self.evict()
+
+    def evict(self) -> None:
+        conn = self._conn()
+        rows = conn.execute("""
+            SELECT key, created_at, size_bytes FROM results ORDER BY last_access DESC;
+        """).fetchall()
+        now = time.time()
+        evicted_keys = []
+        total_size = 0
+        for key, created_at, size_bytes in rows:
+            if (now - created_at > self.ttl_seconds) or (total_size + size_bytes > self.max_size_bytes):
+                evicted_keys.append((key,))
+                continue
+            total_size += size_bytes
+        if len(evicted_keys) == 0:
+            return
+        with conn:
+            conn.executemany("DELETE FROM results WHERE key = ?;", evicted_keys)
+        for (key,) in evicted_keys:
+            try:
+                os.remove(self._entries_filepath_from(key))
+            except FileNotFoundError:
+                pass
+
+    def _entries_filepath_from(self, key: str) -> str:
+        return f"{self._entries_folder}/{key}.refs.jsonl"
+
+    def _conn(self) -> sl.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sl.connect(self._index_filepath, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    n_entries INTEGER NOT NULL,
+                    total_results INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_access REAL NOT NULL,
+                    size_bytes INTEGER NOT NULL
+                );
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_results_last_access ON results (last_access);")
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    cache = QueryResultCache(folder="cache/test_results", ttl_seconds=60)
+    boolean_string = 'TITLE-ABS-KEY ( "plant-based" ) AND PUBYEAR > 2017'
+    os.makedirs("cache/test_results", exist_ok=True)
+    with open("cache/test_results/entries.jsonl", 'w') as fp:
+        fp.write(''.join(json.dumps({'eid': str(i)}) + '\n' for i in range(10)))
+    cache.put(boolean_string, "cache/test_results/entries.jsonl", n_entries=10, total_results=100)
+    assert cache.get(boolean_string, 20) is None
+    cached = cache.get('TITLE-ABS-KEY  ( "plant-based" )  AND PUBYEAR > 2017', 5)
+    print(list(cache.iter_entries(cached, 5)))
@@ -0,0 +1,172 @@
+import threading
+import time
+from collections import namedtuple
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+
+from Config import Config
+
+QuotaState = namedtuple('QuotaState', ('rate', 'tokens', 'limit', 'remaining', 'reset_at', 'paused_for'))
+
+class QuotaExhaustedError(RuntimeError):
+    """
+    scopus asked to wait longer than max_pause_seconds, e.g. until the weekly quota of the key resets
+    """
+    def __init__(self, paused_for: float) -> None:
+        self.paused_for = paused_for
+        super().__init__(f"scopus quota exhausted, requests are paused for {paused_for:.0f}s")
+
+class RateLimiter:
+    """
+    Token bucket shared by all the calls to the Scopus API of the process.
+    Tokens refill at `rate` requests per second, up to `burst`. The rate adapts: it backs off
+    by half on every 429 and creeps back up by RATE_STEP per successful response, up to max_rate.
+    The X-RateLimit-Limit / -Remaining / -Reset headers of every response keep track of the
+    weekly quota of the key; when it runs out, or on 429, all callers wait until the reset
+    (or Retry-After) instead of sending requests that will fail. A pause longer than
+    max_pause_seconds, typically the weekly quota running out, raises a QuotaExhaustedError
+    instead, so that batch runs fail and interrupted retrievals can be resumed after the reset.
+    INTERACTIVE callers are served before any BATCH caller waiting for a token.
+    The bucket is shared within one process only: priorities order the callers of that process,
+    e.g. a batch run and interactive searches of an app embedding both, not separate cli runs.
+    Use RateLimiter.shared() so that all clients draw from the same bucket.
+    """
+    INTERACTIVE = 0
+    BATCH = 1
+    RATE_STEP = 0.1
+    DEFAULT_PAUSE_SECONDS = 1.0
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
+    def __init__(self,
+                 max_rate: float = Config.SCOPUS_MAX_REQUESTS_PER_SECOND,
+                 min_rate: float = Config.SCOPUS_MIN_REQUESTS_PER_SECOND,
+                 burst: int = Config.SCOPUS_BURST,
+                 max_pause_seconds: float = Config.SCOPUS_MAX_PAUSE_SECONDS) -> None:
+        self.max_rate = max_rate
+        self.min_rate = min_rate
+        self.burst = burst
+        self.max_pause_seconds = max_pause_seconds
+        self._rate = max_rate
+        self._tokens = float(burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._n_interactive_waiting = 0
+        self._limit = None
+        self._remaining = None
+        self._reset_at = None
+        self._cond = threading.Condition()
+
+    @classmethod
+    def shared(cls) -> 'RateLimiter':
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
+
+    def acquire(self, priority: int = INTERACTIVE) -> None:
+        """
+        block until a request may be sent.
+        Raise a QuotaExhaustedError if requests are paused for longer than max_pause_seconds
+        """
+        with self._cond:
+            if priority == RateLimiter.INTERACTIVE:
+                self._n_interactive_waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    self._refill(now)
+                    if self._paused_until - now > self.max_pause_seconds:
+                        raise QuotaExhaustedError(self._paused_until - now)
+                    if now < self._paused_until:
+                        self._cond.wait(self._paused_until - now)
+                        continue
+                    if (priority == RateLimiter.BATCH) and (self._n_interactive_waiting > 0):
+                        self._cond.wait(1 / self._rate)
+                        continue
+                    if self._tokens >= 1:
+                        self._tokens -= 1
+                        return
+                    self._cond.wait((1 - self._tokens) / self._rate)
+            finally:
+                if priority == RateLimiter.INTERACTIVE:
+                    self._n_interactive_waiting -= 1
+                self._cond.notify_all()
+
+    def update_from(self, status_code: int, headers: Mapping[str, str]) -> None:
+        """
+        learn from the response of a request sent after acquire()
+        """
+        with self._cond:
+            now = time.monotonic()
+            if 'X-RateLimit-Limit' in headers:
+                self._limit = self._int_from(headers.get('X-RateLimit-Limit'))
+            if 'X-RateLimit-Remaining' in headers:
+                self._remaining = self._int_from(headers.get('X-RateLimit-Remaining'))
+            if 'X-RateLimit-Reset' in headers:
+                self._reset_at = self._int_from(headers.get('X-RateLimit-Reset'))  # epoch seconds
+
+            if status_code == 429:
+                self._rate = max(self.min_rate, self._rate / 2)
+                self._tokens = 0.0
+                self._paused_until = max(self._paused_until, now + self._pause_seconds_from(headers))
+            elif status_code < 400:
+                self._rate = min(self.max_rate, self._rate + RateLimiter.RATE_STEP)
+
+            quota_exhausted = (self._remaining is not None) and (self._remaining <= 0)
+            if quota_exhausted and (self._reset_at is not None):
+                self._paused_until = max(self._paused_until, now + max(0.0, self._reset_at - time.time()))
+            self._cond.notify_all()
+
+    def state(self) -> QuotaState:
+        with self._cond:
+            now = time.monotonic()
+            self._refill(now)
+            return QuotaState(rate=self._rate,
+                              tokens=self._tokens,
+                              limit=self._limit,
+                              remaining=self._remaining,
+                              reset_at=self._reset_at,
+                              paused_for=max(0.0, self._paused_until - now))
+
+    def _refill(self, now: float) -> None:
+        self._tokens = min(float(self.burst), self._tokens + (now - self._refilled_at) * self._rate)
+        self._refilled_at = now
+
+    def _pause_seconds_from(self, headers: Mapping[str, str]) -> float:
+        retry_after = headers.get('Retry-After')
+        if retry_after is None:
+            return RateLimiter.DEFAULT_PAUSE_SECONDS
+        if retry_after.strip().isdigit():
+            return float(retry_after)
+        try:
+            return max(0.0, parsedate_to_datetime(retry_after).timestamp() - time.time())
+        except (TypeError, ValueError):
+            return RateLimiter.DEFAULT_PAUSE_SECONDS
+
+    def _int_from(self, value: str|None) -> int|None:
+        try:
+            return int(value)
+        except (TypeError, ValueError):
+            return None
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    limiter = RateLimiter(max_rate=5, burst=2)
+    started_at = time.monotonic()
+    for _ in range(10):
+        limiter.acquire(RateLimiter.BATCH)
+        limiter.update_from(200, {'X-RateLimit-Limit': '20000', 'X-RateLimit-Remaining': '19999'})
+    print(f"10 requests in {time.monotonic() - started_at:.2f}s")
+    limiter.update_from(429, {'Retry-After': '1'})
+    print(limiter.state())
+    limiter.update_from(200, {'X-RateLimit-Remaining': '0', 'X-RateLimit-Reset': str(int(time.time()) + 3 * 24 * 3600)})
+    try:
+        limiter.acquire()
+    except QuotaExhaustedError as e:
+        print(e)
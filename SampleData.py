@@ -66,7 +66,7 @@ class SampleData:
         
         row: pd.DataFrame = self._df[self._df.ITEM_GROUP_JOURNAL_REFERENCE==self._selected_sample_ids[i]].reset_index()
         url: str = row.loc[0, 'LANDING_PAGE_URL']
-        web_info = WebScapper().extract(url)
+        web_info = self._scrapper.extract(url)
         self._web_infos[sample_id] = web_info
         return web_info
     
@@ -79,7 +79,7 @@ class SampleData:
         
         row: pd.DataFrame = self._df[self._df.ITEM_GROUP_JOURNAL_REFERENCE==self._selected_negative_sample_ids[i]].reset_index()
         url: str = row.loc[0, 'LANDING_PAGE_URL']  # row.iloc[0]['LANDING_PAGE_URL']
-        web_info = WebScapper().extract(url)
+        web_info = self._scrapper.extract(url)
         self._web_infos[sample_id] = web_info
         return web_info
 
@@ -0,0 +1,165 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import namedtuple
+from typing import Any, Dict
+
+from Config import Config
+
+CachedPage = namedtuple('CachedPage', ('url', 'content_hash', 'etag', 'last_modified', 'fetched_at', 'web_info'))
+
+class ScrapeCache:
+    """
+    On-disk cache of the landing pages fetched by WebScapper.
+    Page bodies are content-addressed, stored once under pages/<sha256 of body>, so the
+    special issues sharing a landing page share its body. Each url has a small entry under
+    urls/<sha256 of url>.json with the ETag / Last-Modified validators, the fetch time and
+    the parsed WebInfo as a dict.
+    Entries younger than ttl_seconds are served without any request; older ones are
+    revalidated. Entries older than max_age_seconds are evicted, then the oldest ones
+    until the bodies fit in max_size_bytes.
+    """
+    EVICT_EVERY_N_PUTS = 50
+
+    def __init__(self,
+                 folder: str = Config.SCRAPE_CACHE_FOLDER,
+                 ttl_seconds: int = Config.SCRAPE_CACHE_TTL_SECONDS,
+                 max_age_seconds: int = Config.SCRAPE_CACHE_MAX_AGE_SECONDS,
+                 max_size_bytes: int = Config.SCRAPE_CACHE_MAX_BYTES) -> None:
+        self.ttl_seconds = ttl_seconds
+        self.max_age_seconds = max_age_seconds
+        self.max_size_bytes = max_size_bytes
+        self._pages_folder = f"{folder}/pages"
+        self._urls_folder = f"{folder}/urls"
+        for _folder in (self._pages_folder, self._urls_folder):
+            if not os.path.exists(_folder):
+                os.makedirs(_folder, exist_ok=True)
+        self._lock = threading.Lock()
+        self._n_puts = 0
+
+    def get(self, url: str) -> CachedPage|None:
+        """
+        return the entry of url even if it is stale, so that it can be revalidated
+        """
+        filepath = self._url_filepath_from(url)
+        try:
+            with open(filepath, 'r') as fp:
+                data = json.load(fp)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        return CachedPage(**data)
+
+    def is_fresh(self, page: CachedPage) -> bool:
+        return (time.time() - page.fetched_at) < self.ttl_seconds
+
+    def content_of(self, page: CachedPage) -> bytes|None:
+        try:
+            with open(self._page_filepath_from(page.content_hash), 'rb') as fp:
+                return fp.read()
+        except FileNotFoundError:
+            return None
+
+    def put(self, url: str, content: bytes,
+            etag: str|None = None,
+            last_modified: str|None = None,
+            web_info: Dict[str, Any]|None = None) -> CachedPage:
+        content_hash = hashlib.sha256(content).hexdigest()
+        page_filepath = self._page_filepath_from(content_hash)
+        if not os.path.exists(page_filepath):
+            self._atomic_write(page_filepath, content)
+        page = CachedPage(url=url,
+                          content_hash=content_hash,
+                          etag=etag,
+                          last_modified=last_modified,
+                          fetched_at=time.time(),
+                          web_info=web_info)
+        self._write_entry(page)
+
+        with self._lock:
+            self._n_puts += 1
+            should_evict = (self._n_puts % ScrapeCache.EVICT_EVERY_N_PUTS == 0)
+        if should_evict:
+            self.evict()
+        return page
+
+    def touch(self, page: CachedPage) -> CachedPage:
+        """
+        mark a page as fetched now, after the server answered 304 Not Modified
+        """
+        page = page._replace(fetched_at=time.time())
+        self._write_entry(page)
+        return page
+
+    def evict(self) -> None:
+        now = time.time()
+        entries = []
+        for entry in os.scandir(self._urls_folder):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path, 'r') as fp:
+                    data = json.load(fp)
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+            if now - data['fetched_at'] > self.max_age_seconds:
+                self._remove(entry.path)
+                continue
+            entries.append((data['fetched_at'], entry.path, data['content_hash']))
+
+        sizes = {}
+        for entry in os.scandir(self._pages_folder):
+            sizes[entry.name] = entry.stat().st_size
+
+        # newest first, keep entries while their bodies fit in the cap
+        entries.sort(reverse=True)
+        kept_hashes = set()
+        total_size = 0
+        for _, filepath, content_hash in entries:
+            if content_hash not in kept_hashes:
+                if total_size + sizes.get(content_hash, 0) > self.max_size_bytes:
+                    self._remove(filepath)
+                    continue
+                total_size += sizes.get(content_hash, 0)
+                kept_hashes.add(content_hash)
+
+        for content_hash in sizes:
+            if content_hash not in kept_hashes:
+                self._remove(self._page_filepath_from(content_hash))
+
+    def _write_entry(self, page: CachedPage) -> None:
+        data = json.dumps(page._asdict()).encode('utf-8')
+        self._atomic_write(self._url_filepath_from(page.url), data)
+
+    def _atomic_write(self, filepath: str, data: bytes) -> None:
+        tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_filepath, 'wb') as fp:
+            fp.write(data)
+        os.replace(tmp_filepath, filepath)
+
+    def _remove(self, filepath: str) -> None:
+        try:
+            os.remove(filepath)
+        except FileNotFoundError:
+            pass
+
+    def _url_filepath_from(self, url: str) -> str:
+        return f"{self._urls_folder}/{hashlib.sha256(url.encode('utf-8')).hexdigest()}.json"
+
+    def _page_filepath_from(self, content_hash: str) -> str:
+        return f"{self._pages_folder}/{content_hash}"
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    cache = ScrapeCache(folder="cache/test_scrape", ttl_seconds=60)
+    page = cache.put("https://test-url#a", b"<html>a</html>", etag='"123"', web_info={'title': 'a'})
+    cache.put("https://test-url#b", b"<html>a</html>", web_info={'title': 'b'})
+    assert cache.get("https://test-url#a").content_hash == cache.get("https://test-url#b").content_hash
+    assert cache.is_fresh(cache.get("https://test-url#a"))
+    print(cache.content_of(page))
+    print(cache.get("https://test-url#b"))
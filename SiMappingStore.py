@@ -0,0 +1,148 @@
+import atexit
+import json
+import os
+import sqlite3 as sl
+import threading
+from typing import Dict, List, Tuple
+
+from Config import Config
+
+
+class SiMappingStore:
+    """
+    Special issue landing page url -> generated queries (boolean strings or vector query strings).
+    Kept in a local sqlite table in WAL mode, so the threads and processes of a batch run can
+    all write to it without losing mappings. Lookups by url go through the table's index.
+    Writes are buffered and committed in batches of batch_size. Reads, exit and flush() commit
+    whatever is buffered.
+    Use SiMappingStore.shared() so that the whole process shares the same buffer.
+    """
+    _shared: Dict[str, 'SiMappingStore'] = {}
+    _shared_lock = threading.Lock()
+
+    def __init__(self, db_path: str = Config.SI_MAPPING_DB_FILEPATH,
+                 batch_size: int = Config.SI_MAPPING_BATCH_SIZE) -> None:
+        self.db_path = db_path
+        self.batch_size = batch_size
+        _folder = os.path.dirname(self.db_path)
+        if _folder and not os.path.exists(_folder):
+            os.makedirs(_folder, exist_ok=True)
+        self._local = threading.local()
+        self._pending: List[Tuple[str, str, str]] = []
+        self._pending_lock = threading.Lock()
+        self._imported_filepaths = set()
+        self._create_tables()
+        atexit.register(self.flush)
+
+    @classmethod
+    def shared(cls, db_path: str = Config.SI_MAPPING_DB_FILEPATH) -> 'SiMappingStore':
+        with cls._shared_lock:
+            if db_path not in cls._shared:
+                cls._shared[db_path] = cls(db_path)
+            return cls._shared[db_path]
+
+    def add(self, kind: str, url: str, query: str) -> None:
+        """
+        :param kind: which mapping the query belongs to, e.g. 'boolean_string' or 'vector_query'
+        """
+        with self._pending_lock:
+            self._pending.append((kind, url, query))
+            should_flush = len(self._pending) >= self.batch_size
+        if should_flush:
+            self.flush()
+
+    def flush(self) -> None:
+        with self._pending_lock:
+            pending, self._pending = self._pending, []
+        if len(pending) == 0:
+            return
+        conn = self._conn()
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO si_query_mapping (kind, url, query)
+                VALUES (?, ?, ?);
+            """, pending)
+
+    def queries_for(self, kind: str, url: str) -> List[str]:
+        """
+        queries generated for the url, in the order they were first added
+        """
+        self.flush()
+        cursor = self._conn().execute("""
+            SELECT query FROM si_query_mapping
+            WHERE kind = ? AND url = ?
+            ORDER BY id;
+        """, (kind, url))
+        return [row[0] for row in cursor.fetchall()]
+
+    def mappings(self, kind: str) -> List[Tuple[str, str]]:
+        """
+        all the (url, query) pairs of a kind, in the order they were first added
+        """
+        self.flush()
+        cursor = self._conn().execute("""
+            SELECT url, query FROM si_query_mapping
+            WHERE kind = ?
+            ORDER BY id;
+        """, (kind,))
+        return cursor.fetchall()
+
+    def import_json(self, kind: str, filepath: str, queries_key: str) -> None:
+        """
+        import the mappings of a json file written by an earlier version, once per process.
+        Already known mappings are ignored, so importing twice is harmless.
+        """
+        with self._pending_lock:
+            if (filepath in self._imported_filepaths) or (not os.path.exists(filepath)):
+                return
+            self._imported_filepaths.add(filepath)
+        with open(filepath, 'r') as fp:
+            data = json.load(fp)
+        rows = [(kind, mapping['url'], query)
+                for mapping in data.get('mappings', [])
+                for query in mapping.get(queries_key, [])]
+        conn = self._conn()
+        with conn:
+            conn.executemany("""
+                INSERT OR IGNORE INTO si_query_mapping (kind, url, query)
+                VALUES (?, ?, ?);
+            """, rows)
+
+    def _conn(self) -> sl.Connection:
+        """
+        sqlite connections cannot be shared between threads, so each thread gets its own
+        """
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sl.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL;")
+            conn.execute("PRAGMA synchronous=NORMAL;")
+            self._local.conn = conn
+        return conn
+
+    def _create_tables(self) -> None:
+        conn = self._conn()
+        with conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS si_query_mapping (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    kind TEXT NOT NULL,
+                    url TEXT NOT NULL,
+                    query TEXT NOT NULL,
+                    UNIQUE (kind, url, query)
+                );
+            """)
+
+
+##############################################################
+# TEST
+##############################################################
+
+if __name__ == "__main__":
+    store = SiMappingStore("output/test_si_mappings.db")
+    store.add('boolean_string', "https://test-url", "BOOLEAN STRING 1")
+    store.add('boolean_string', "https://test-url", "BOOLEAN STRING 2")
+    store.add('boolean_string', "https://test-url", "BOOLEAN STRING 1")
+    store.add('boolean_string', "https://test-url-2", "BOOLEAN STRING 3")
+    print(store.queries_for('boolean_string', "https://test-url"))  # ['BOOLEAN STRING 1', 'BOOLEAN STRING 2']
+    print(store.mappings('boolean_string'))
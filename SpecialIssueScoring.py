@@ -0,0 +1,167 @@
+import os
+from typing import Any, Dict, Iterable, List
+
+import numpy as np
+import pandas as pd
+
+from AuthorIndex import AuthorIndex
+from AuthorRanker import AuthorRanker
+from DBClient import SearchEngine
+from Config import Config
+
+class SpecialIssueScorer:
+    """
+    Score the results of evaluation.py against the ground truth of SpecialIssueEvaluator:
+    recall@K, precision@K and overlap (Jaccard of the whole result set with the ground truth),
+    for eids and for auids, per special issue and per search engine.
+    Retrieved eids are ranked as the search engine returned them; retrieved authors as the
+    AuthorRanker ranks them over all the results of the special issue.
+    Everything is computed with joins and group-bys over long
+    (SPECIAL_ISSUE_ID, LEVEL, ID[, RANK]) tables, so whole corpora are scored at once.
+    """
+    KEYS = ['SPECIAL_ISSUE_ID', 'LEVEL']
+
+    def __init__(self, ks: Iterable[int] = Config.SCORING_KS, author_ranker: AuthorRanker|None = None) -> None:
+        self.ks = list(ks)
+        self.author_ranker = author_ranker or AuthorRanker()
+
+    def truth_df(self, special_issues: Dict[str, Dict[str, List[str]]]) -> pd.DataFrame:
+        """
+        long table of the ground truth, from SpecialIssueEvaluator.get_data_for_special_issues.
+        The "Author(s) ID" cells of scopus exports list the auids of a paper separated by ';'
+        """
+        special_issue_ids, levels, ids = [], [], []
+        for special_issue_id, data in special_issues.items():
+            eids = data.get('EID') or []
+            auids = [auid for cell in (data.get('AUID') or []) for auid in str(cell).split(';')]
+            special_issue_ids.extend([special_issue_id] * (len(eids) + len(auids)))
+            levels.extend(['EID'] * len(eids) + ['AUID'] * len(auids))
+            ids.extend(eids + auids)
+        truth_df = pd.DataFrame({'SPECIAL_ISSUE_ID': special_issue_ids, 'LEVEL': levels, 'ID': ids}, dtype=object)
+        truth_df['ID'] = truth_df['ID'].astype(str).str.strip()
+        truth_df = truth_df[(truth_df['ID'] != '') & (truth_df['ID'] != 'nan')]
+        truth_df['SPECIAL_ISSUE_ID'] = truth_df['SPECIAL_ISSUE_ID'].astype(str)
+        return truth_df.drop_duplicates(ignore_index=True)
+
+    def retrieved_eids_df(self, result_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        ranked eids of each special issue, from a result table of evaluation.py.
+        An eid returned by several queries of the special issue keeps its first rank
+        """
+        retrieved_df = result_df[['SPECIAL_ISSUE_ID', 'EID']].rename(columns={'EID': 'ID'})
+        retrieved_df = retrieved_df.assign(SPECIAL_ISSUE_ID=retrieved_df['SPECIAL_ISSUE_ID'].astype(str), LEVEL='EID')
+        retrieved_df = retrieved_df.drop_duplicates(subset=['SPECIAL_ISSUE_ID', 'ID'], ignore_index=True)
+        retrieved_df['RANK'] = retrieved_df.groupby('SPECIAL_ISSUE_ID').cumcount()
+        return retrieved_df
+
+    def retrieved_auids_df(self, result_df: pd.DataFrame, query_column: str, json_io: Any) -> pd.DataFrame:
+        """
+        ranked authors of each special issue, from the author indexes of its queries.
+        An author found by several queries of the special issue keeps its best value of each column
+        :param json_io: BooleanStringJsonIO or VectorQueryJsonIO, matching query_column
+        """
+        special_issue_ids, columns = [], {'ID': [], 'n_papers': [], 'total_citations': [], 'latest_year': [], 'max_relevance': []}
+        for special_issue_id, query in result_df[['SPECIAL_ISSUE_ID', query_column]].drop_duplicates().itertuples(index=False):
+            author_index = json_io.get_author_index(query)
+            special_issue_ids.append(np.full(len(author_index), str(special_issue_id), dtype=object))
+            columns['ID'].append(author_index.auid)
+            for column in ('n_papers', 'total_citations', 'latest_year', 'max_relevance'):
+                columns[column].append(getattr(author_index, column))
+        if len(special_issue_ids) == 0:
+            return pd.DataFrame(columns=['SPECIAL_ISSUE_ID', 'LEVEL', 'ID', 'RANK'])
+        authors_df = pd.DataFrame({'SPECIAL_ISSUE_ID': np.concatenate(special_issue_ids),
+                                   **{ column: np.concatenate(arrays) for column, arrays in columns.items() }})
+        authors_df = authors_df.groupby(['SPECIAL_ISSUE_ID', 'ID'], as_index=False).max()
+
+        # scores are scaled per special issue, against its best author
+        author_index = AuthorIndex(auid=authors_df['ID'].to_numpy(),
+                                   n_papers=authors_df['n_papers'].to_numpy(),
+                                   total_citations=authors_df['total_citations'].to_numpy(),
+                                   latest_year=authors_df['latest_year'].to_numpy(),
+                                   name=np.full(len(authors_df), '', dtype=str),
+                                   max_relevance=authors_df['max_relevance'].to_numpy())
+        groups, _ = pd.factorize(authors_df['SPECIAL_ISSUE_ID'])
+        authors_df['SCORE'] = self.author_ranker.scores(author_index, groups=groups)
+        authors_df = authors_df.sort_values(['SPECIAL_ISSUE_ID', 'SCORE'], ascending=[True, False], kind='stable')
+        authors_df['RANK'] = authors_df.groupby('SPECIAL_ISSUE_ID').cumcount()
+        return authors_df.assign(LEVEL='AUID')[['SPECIAL_ISSUE_ID', 'LEVEL', 'ID', 'RANK']].reset_index(drop=True)
+
+    def score(self, retrieved_df: pd.DataFrame, truth_df: pd.DataFrame, engine: SearchEngine) -> pd.DataFrame:
+        """
+        one row per special issue of the ground truth, level and K.
+        Special issues without any result score 0
+        """
+        keys = SpecialIssueScorer.KEYS
+        flagged_df = retrieved_df.merge(truth_df.assign(IS_RELEVANT=True), on=keys + ['ID'], how='left')
+        flagged_df['IS_RELEVANT'] = flagged_df['IS_RELEVANT'].fillna(False).astype(bool)
+
+        counts_df = truth_df.groupby(keys).size().rename('N_TRUTH').to_frame()
+        counts_df['N_RETRIEVED'] = retrieved_df.groupby(keys).size()
+        counts_df['N_HITS'] = flagged_df.groupby(keys)['IS_RELEVANT'].sum()
+        counts_df = counts_df.fillna(0).astype(np.int64)
+
+        frames = []
+        for k in self.ks:
+            scores_df = counts_df.copy()
+            scores_df['K'] = k
+            hits_at_k = flagged_df[flagged_df['RANK'] < k].groupby(keys)['IS_RELEVANT'].sum()
+            scores_df['N_HITS_AT_K'] = hits_at_k.reindex(scores_df.index, fill_value=0).astype(np.int64)
+            frames.append(scores_df)
+        scores_df = pd.concat(frames).reset_index()
+        scores_df['RECALL_AT_K'] = scores_df['N_HITS_AT_K'] / scores_df['N_TRUTH']
+        scores_df['PRECISION_AT_K'] = scores_df['N_HITS_AT_K'] / scores_df['K']
+        scores_df['OVERLAP'] = scores_df['N_HITS'] / (scores_df['N_RETRIEVED'] + scores_df['N_TRUTH'] - scores_df['N_HITS'])
+        scores_df.insert(0, 'ENGINE', engine.value)
+        return scores_df
+
+    def summary(self, scores_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        per engine, level and K: means over the special issues (macro) and recall over
+        all the ground truth at once (micro)
+        """
+        summary_df = scores_df.groupby(['ENGINE', 'LEVEL', 'K']).agg(
+            N_SPECIAL_ISSUES=('SPECIAL_ISSUE_ID', 'nunique'),
+            MEAN_RECALL_AT_K=('RECALL_AT_K', 'mean'),
+            MEAN_PRECISION_AT_K=('PRECISION_AT_K', 'mean'),
+            MEAN_OVERLAP=('OVERLAP', 'mean'),
+            N_HITS_AT_K=('N_HITS_AT_K', 'sum'),
+            N_TRUTH=('N_TRUTH', 'sum'))
+        summary_df['MICRO_RECALL_AT_K'] = summary_df['N_HITS_AT_K'] / summary_df['N_TRUTH']
+        return summary_df.reset_index().round(4)
+
+    def write_report(self, scores_df: pd.DataFrame, folder: str = Config.SCORING_OUTPUT_FOLDER) -> pd.DataFrame:
+        """
+        write scores.csv, one row per special issue, and summary.csv. Return the summary
+        """
+        os.makedirs(folder, exist_ok=True)
+        summary_df = self.summary(scores_df)
+        scores_df.to_csv(f"{folder}/scores.csv", index=False)
+        summary_df.to_csv(f"{folder}/summary.csv", index=False)
+        return summary_df
+
+
+######################################################################################
+# Test
+######################################################################################
+
+if __name__ == "__main__":
+    from JsonIO import BooleanStringJsonIO, VectorQueryJsonIO
+    from SpecialIssueEvaluation import SpecialIssueEvaluator
+    from evaluation import get_boolean_string_result_df, get_vector_query_result_df
+
+    # input should be a csv file has these columns
+    # COLUMNS = ['SPECIAL_ISSUE_ID', 'JOURNAL_ACRONYM', 'ASJC_CORE', 'LANDING_PAGE_URL']
+    filepath = "input/eval_input_hackathon_boolean_v2_with_urls.csv"
+    # one scopus export <SPECIAL_ISSUE_ID>.csv per special issue, with EID and Author(s) ID columns
+    ground_truth_folder = "input/ground_truth"
+
+    scorer = SpecialIssueScorer()
+    truth_df = scorer.truth_df(SpecialIssueEvaluator().get_data_for_special_issues(ground_truth_folder))
+    scores = []
+    for engine, result_df, query_column, json_io in [
+            (SearchEngine.BooleanSearch, get_boolean_string_result_df(filepath), 'BOOLEAN_STRING', BooleanStringJsonIO()),
+            (SearchEngine.VectorSearch, get_vector_query_result_df(filepath), 'VECTOR_STRING', VectorQueryJsonIO())]:
+        retrieved_df = pd.concat([scorer.retrieved_eids_df(result_df),
+                                  scorer.retrieved_auids_df(result_df, query_column, json_io)], ignore_index=True)
+        scores.append(scorer.score(retrieved_df, truth_df, engine))
+    print(scorer.write_report(pd.concat(scores, ignore_index=True)))
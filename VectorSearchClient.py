@@ -1,6 +1,11 @@
-import requests
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, List
 
 from JsonIO import VectorQueryJsonIO
+from AuthorIndex import AuthorIndexBuilder
+from HttpClient import HttpClient
+from Config import Config
 
 class VectorSearchClient:
 
@@ -10,76 +15,101 @@ class VectorSearchClient:
                    "x-els-product" : "embeddings",
                    "x-els-dataset" : "embeddings"}
 
+    RETURN_FIELDS = [  # returnFields = 'abstract', 'author', 'authorSort', 'controlledTerms', 'database', 'date', 'dedupkey', 'dmask', 'doi', 'eid', 'eidocid', 'loadNumber', 'parentId', 'pcited', 'publicationYear', 'publisherNameSort', 'serialTitle', 'subHeading', 'tdocid', 'title'
+        "relevance",
+        "eid",
+        "authors",
+        "authid",
+        "abs",
+        "pubyr"]
+    COUNT_RETURN_FIELDS = ["eid"]
+
     def __init__(self) -> None:
         self.json_io = VectorQueryJsonIO()
+        self.http = HttpClient.shared()
 
-    def num_results(self, query_string: str) -> int:
-        MAX_SUPPORTED_AMOUNT = 500
-        payload = {
-            "query": { 
-                "semanticQueryString": query_string 
-            },
-            "resultSet": {
-                "skip": 0,
-                "amount": MAX_SUPPORTED_AMOUNT 
-            }, 
-            "sortBy": [{
-                "fieldName": "relevance", 
-                "order": "desc"
-            }],
-            "returnFields": [  # returnFields = 'abstract', 'author', 'authorSort', 'controlledTerms', 'database', 'date', 'dedupkey', 'dmask', 'doi', 'eid', 'eidocid', 'loadNumber', 'parentId', 'pcited', 'publicationYear', 'publisherNameSort', 'serialTitle', 'subHeading', 'tdocid', 'title'
-                "relevance",
-                "eid",
-                "authors",
-                "authid",
-                "abs", 
-                "pubyr"]}
+    def num_results(self, query_string: str, max_results: int = 20_000) -> int:
+        """
+        count the hits of the query, up to max_results, paging through windows of eids only,
+        so the count is right past Config.VECTOR_SEARCH_PAGE_SIZE at a fraction of a retrieval.
+        Only needed before asking the user; retrieve_top_entries returns its own count
+        """
+        return sum(len(hits) for hits in self._iter_hits(query_string, max_results, VectorSearchClient.COUNT_RETURN_FIELDS))
 
-        response = None
-        try:
-            response = requests.post(VectorSearchClient.ENDPOINT, 
-                                     json=payload, 
-                                     headers=VectorSearchClient.REQUEST_HEADERS)
-            response.raise_for_status()
-        except Exception as e:
-            raise RuntimeError(f"error requesting {VectorSearchClient.ENDPOINT}\nrequest: \n{payload}\n")
-        
-        # error handling
-        if response is None:
-            raise RuntimeError(f"error requesting {VectorSearchClient.ENDPOINT}\nrequest: \n{payload}\n")
-        
-        response_json = response.json()
-        n_results = len(response_json["hits"])
-        return n_results
+    def retrieve_top_entries(self, query_string: str, n_top_entries: int) -> int:
+        """
+        retrieve and save the top hits of the query, and return their number
+        """
+        entries = [hit for hits in self._iter_hits(query_string, n_top_entries, VectorSearchClient.RETURN_FIELDS) for hit in hits]
+        self.json_io.write(query_string, entries)
+        authors = AuthorIndexBuilder()
+        authors.add(entries)
+        self.json_io.write_author_index(query_string, authors.build())
+        return len(entries)
+
+    def _iter_hits(self, query_string: str, n_top_entries: int, return_fields: List[str]) -> Iterator[List[Dict[str, Any]]]:
+        """
+        Yield the hits of the query in relevance order, window by window. The service caps
+        `amount` at Config.VECTOR_SEARCH_PAGE_SIZE, so the windows are requested with growing
+        `skip`, up to Config.VECTOR_SEARCH_CONCURRENCY at a time, and stitched back in order.
+        A hit already seen in a previous window (when relevance ties move across windows) is dropped.
+        Stop at n_top_entries hits, or at the first window that is not full.
+        """
+        page_size = Config.VECTOR_SEARCH_PAGE_SIZE
+        skips = iter(range(0, n_top_entries, page_size))
+        seen_eids = set()
+        n_entries_to_go = n_top_entries
+        with ThreadPoolExecutor(max_workers=Config.VECTOR_SEARCH_CONCURRENCY) as executor:
+            windows = deque()
 
-    def retrieve_top_entries(self, query_string: str, n_top_entries: int) -> None:
-        MAX_SUPPORTED_AMOUNT = 500
-        n_top_entries = min(n_top_entries, MAX_SUPPORTED_AMOUNT)
+            def _submit_next() -> None:
+                skip = next(skips, None)
+                if skip is not None:
+                    amount = min(page_size, n_top_entries - skip)
+                    windows.append((amount, executor.submit(self._hits_from, query_string, skip, amount, return_fields)))
+
+            for _ in range(Config.VECTOR_SEARCH_CONCURRENCY):
+                _submit_next()
+            try:
+                while (len(windows) > 0) and (n_entries_to_go > 0):
+                    amount, future = windows.popleft()
+                    window_hits = future.result()
+                    hits = []
+                    for hit in window_hits:
+                        if hit['eid'] in seen_eids:
+                            continue
+                        seen_eids.add(hit['eid'])
+                        hits.append(hit)
+                    hits = hits[:n_entries_to_go]
+                    n_entries_to_go -= len(hits)
+                    yield hits
+                    if len(window_hits) < amount:
+                        break
+                    _submit_next()
+            finally:
+                for _, future in windows:
+                    future.cancel()
+
+    def _hits_from(self, query_string: str, skip: int, amount: int, return_fields: List[str]) -> List[Dict[str, Any]]:
         payload = {
             "query": { 
                 "semanticQueryString": query_string 
             },
             "resultSet": {
-                "skip": 0,
-                "amount": n_top_entries 
+                "skip": skip,
+                "amount": amount
             }, 
             "sortBy": [{
                 "fieldName": "relevance", 
                 "order": "desc"
             }],
-            "returnFields": [  # returnFields = 'abstract', 'author', 'authorSort', 'controlledTerms', 'database', 'date', 'dedupkey', 'dmask', 'doi', 'eid', 'eidocid', 'loadNumber', 'parentId', 'pcited', 'publicationYear', 'publisherNameSort', 'serialTitle', 'subHeading', 'tdocid', 'title'
-                "relevance",
-                "eid",
-                "authors",
-                "authid",
-                "abs", 
-                "pubyr"]}
+            "returnFields": return_fields}
 
         response = None
         try:
-            response = requests.post(VectorSearchClient.ENDPOINT, 
-                                     json=payload, 
-                                     headers=VectorSearchClient.REQUEST_HEADERS)
+            response = self.http.post(VectorSearchClient.ENDPOINT, 
+                                      json=payload, 
+                                      headers=VectorSearchClient.REQUEST_HEADERS)
             response.raise_for_status()
         except Exception as e:
             raise RuntimeError(f"error requesting {VectorSearchClient.ENDPOINT}\nrequest: \n{payload}\n")
@@ -88,9 +118,7 @@ class VectorSearchClient:
         if response is None:
             raise RuntimeError(f"error requesting {VectorSearchClient.ENDPOINT}\nrequest: \n{payload}\n")
         
-        response_json = response.json()
-        entries = response_json["hits"]
-        self.json_io.write(query_string, entries)
+        return response.json()["hits"]
 
 
 ##############################################################
@@ -1,12 +1,14 @@
-import requests
 from collections import namedtuple
 from bs4 import BeautifulSoup
 import pandas as pd
-import numpy as np
-from typing import Tuple
-from dataclasses import dataclass
+from typing import Any, Dict, List, Tuple
+import re
+import threading
+from dataclasses import asdict, dataclass
 
 from Config import Config
+from HttpClient import HttpClient
+from ScrapeCache import ScrapeCache
 
 JournalClassification = namedtuple('JournalClassification', ('top', 'mid', 'low'))
 
@@ -18,29 +20,79 @@ class WebInfo:
     asjc_codes: Tuple[str] = tuple()
     classifications: Tuple[JournalClassification] = tuple()
 
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+    @staticmethod
+    def from_dict(data: Dict[str, Any]) -> 'WebInfo':
+        data = dict(data)
+        data['classifications'] = tuple(JournalClassification(*classification) 
+                                        for classification in data.get('classifications', []))
+        return WebInfo(**data)
+
 # resource: https://realpython.com/beautiful-soup-web-scraper-python/
 
 class WebScapper():
+    ISSN_PATTERN = r'\b[0-9]{4}-[0-9]{3}[0-9Xx]\b'
     HEADERS = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/58.0.3029.110 Safari/537.3'}
     
     def __init__(self) -> None:
-        self.asjcMapper = AsjcMapper()
+        self.asjcMapper = AsjcMapper.shared()
+        self.http = HttpClient.shared()
+        self.cache = ScrapeCache()
 
     def extract(self, url: str) -> WebInfo:
+        cached = self.cache.get(url)
+        if (cached is not None) and (cached.web_info is not None) and self.cache.is_fresh(cached):
+            return WebInfo.from_dict(cached.web_info)
+
+        # revalidate what we have instead of downloading it again
+        headers = dict(WebScapper.HEADERS)
+        if (cached is not None) and (cached.etag is not None):
+            headers['If-None-Match'] = cached.etag
+        if (cached is not None) and (cached.last_modified is not None):
+            headers['If-Modified-Since'] = cached.last_modified
 
         response = None
         try:
             # use a header to avoid 403 Client Error: Forbidden for url xxx
-            response = requests.get(url, headers=WebScapper.HEADERS)
+            response = self.http.get(url, headers=headers)
             # Raise an exception for bad responses
             response.raise_for_status()
         except Exception as e:
             raise RuntimeError(f"Error processing URL {url}: {e}")
-        
-        soup = BeautifulSoup(response.content, 'html.parser')
 
-        journal_title = soup.find('h1', class_='js-title-text').text
+        if (response.status_code == 304) and (cached is not None):
+            content = self.cache.content_of(cached)
+            if content is not None:
+                cached = self.cache.touch(cached)
+                if cached.web_info is not None:
+                    return WebInfo.from_dict(cached.web_info)
+                web_info = self._web_info_from(content, url)
+                self.cache.put(url, content, etag=cached.etag, last_modified=cached.last_modified, web_info=web_info.to_dict())
+                return web_info
+            # the body was evicted in the meantime, download it again
+            try:
+                response = self.http.get(url, headers=WebScapper.HEADERS)
+                response.raise_for_status()
+            except Exception as e:
+                raise RuntimeError(f"Error processing URL {url}: {e}")
+
+        web_info = self._web_info_from(response.content, url)
+        self.cache.put(url, response.content, 
+                       etag=response.headers.get('ETag'), 
+                       last_modified=response.headers.get('Last-Modified'), 
+                       web_info=web_info.to_dict())
+        return web_info
+
+    def _web_info_from(self, content: bytes, url: str) -> WebInfo:
+        soup = BeautifulSoup(content, 'html.parser')
+
+        journal_title_block = soup.find('h1', class_='js-title-text')
+        journal_title = journal_title_block.text if (journal_title_block is not None) else ''
         asjc_codes: Tuple[str] = self.asjcMapper.asjc_codes_from(journal_title=journal_title)
+        if len(asjc_codes) == 0:
+            asjc_codes = self._asjc_codes_from_issns(soup)
         journal_classifications = self.asjcMapper.classifications_from_asjcs(asjc_codes)
 
         title_block_id: str = url.split('#')[1]
@@ -55,7 +107,7 @@ class WebScapper():
                            asjc_codes=asjc_codes, 
                            classifications=journal_classifications)
 
-        description = self._extract_description(response, url)
+        description = self._extract_description(soup, url)
         description = '' if description is None else description
         
         return WebInfo(title=title, 
@@ -65,8 +117,17 @@ class WebScapper():
                        classifications=journal_classifications)
         
         
-    def _extract_description(self, response, url: str) -> str:
-        soup = BeautifulSoup(response.text, 'html.parser')
+    def _asjc_codes_from_issns(self, soup: BeautifulSoup) -> Tuple[str]:
+        """
+        fall back on the ISSNs printed on the landing page when the journal title is not found
+        """
+        for issn in re.findall(WebScapper.ISSN_PATTERN, soup.get_text()):
+            asjc_codes = self.asjcMapper.asjc_codes_from_journal_id(issn)
+            if len(asjc_codes) > 0:
+                return asjc_codes
+        return []
+
+    def _extract_description(self, soup: BeautifulSoup, url: str) -> str:
         # Find the relative section by ID
         element_id = url.split('#')[1]
         target_element = soup.find('h3', {'id': element_id})
@@ -103,34 +164,86 @@ class WebScapper():
 
 
 class AsjcMapper():
+    """
+    Journal -> ASJC codes -> classification lookups, indexed in dicts at load time.
+    Use AsjcMapper.shared() to load the csv files once per process.
+    """
+    JOURNAL_ID_COLUMNS = ('ISSN', 'e-ISSN', 'p-ISSN', 'SourceID', 'Acronym')
+
+    _shared = None
+    _shared_lock = threading.Lock()
+
     def __init__(self, 
                  path_to_asjc_journal_mapping=Config.ASJC_JOURNALS_MAPPINGS_CSV_FILEPATH, 
                  path_to_asjc_classification_mapping=Config.ASJC_CLASSIFICATION_MAPPING_CSV_FILEPATH) -> None:
-        self.asjc_journal_mapping: pd.DataFrame = pd.read_csv(path_to_asjc_journal_mapping)
+        self.asjc_journal_mapping: pd.DataFrame = pd.read_csv(path_to_asjc_journal_mapping, dtype=str)
         self.asjc_classification_mapping: pd.DataFrame = pd.read_csv(path_to_asjc_classification_mapping, delimiter=';')
+        self._asjc_codes_by_title: Dict[str, List[str]] = {}
+        self._asjc_codes_by_normalized_title: Dict[str, List[str]] = {}
+        self._asjc_codes_by_journal_id: Dict[str, List[str]] = {}
+        self._classification_by_asjc: Dict[int, JournalClassification] = {}
+        self._build_indexes()
+
+    @classmethod
+    def shared(cls) -> 'AsjcMapper':
+        with cls._shared_lock:
+            if cls._shared is None:
+                cls._shared = cls()
+            return cls._shared
 
     def asjc_codes_from(self, journal_title: str) -> Tuple[str]:
-        df = self.asjc_journal_mapping
-        row = df.loc[df['JournalTitle'] == journal_title]
-        if len(row) == 0:
-            return []
-        row = row.iloc[0]
-        asjcs_str = row['ASJCScopus']
-        if asjcs_str == np.nan or str(asjcs_str) == 'nan':
-            asjcs_str = row['ASJCMarketing']
-        if asjcs_str == np.nan or str(asjcs_str) == 'nan':
-            return []
-        asjc_codes = asjcs_str.split(';')
-        return asjc_codes
+        asjc_codes = self._asjc_codes_by_title.get(journal_title)
+        if asjc_codes is None:
+            asjc_codes = self._asjc_codes_by_normalized_title.get(self._normalized_title(journal_title), [])
+        return list(asjc_codes)
+
+    def asjc_codes_from_journal_id(self, journal_id: str) -> Tuple[str]:
+        """
+        :param journal_id: ISSN, e-ISSN, p-ISSN, scopus SourceID or journal acronym
+        """
+        return list(self._asjc_codes_by_journal_id.get(self._normalized_journal_id(journal_id), []))
     
     def classifications_from_asjcs(self, asjcs: Tuple[str]) -> Tuple[JournalClassification]:
         return tuple([self._classification_from_asjc(asjc) for asjc in asjcs])
+
+    def is_known_asjc(self, asjc: str|int) -> bool:
+        try:
+            return int(asjc) in self._classification_by_asjc
+        except ValueError:
+            return False
         
     def _classification_from_asjc(self, asjc: str) -> JournalClassification:
         # reference: https://github.com/plreyes/Scopus/blob/master/ASJC%20Codes%20with%20levels.csv
-        df = self.asjc_classification_mapping
-        row = df.loc[df['Code'] == int(asjc)].iloc[0]
-        return JournalClassification(top=row['Top'], mid=row['Middle'], low=row['Low'])
+        return self._classification_by_asjc[int(asjc)]
+
+    def _build_indexes(self) -> None:
+        for row in self.asjc_journal_mapping.to_dict('records'):
+            asjcs_str = row['ASJCScopus']
+            if not isinstance(asjcs_str, str):  # nan
+                asjcs_str = row['ASJCMarketing']
+            if not isinstance(asjcs_str, str):
+                continue
+            asjc_codes = asjcs_str.split(';')
+
+            # the first row wins if a journal is listed more than once
+            journal_title = row['JournalTitle']
+            if isinstance(journal_title, str):
+                self._asjc_codes_by_title.setdefault(journal_title, asjc_codes)
+                self._asjc_codes_by_normalized_title.setdefault(self._normalized_title(journal_title), asjc_codes)
+            for column in AsjcMapper.JOURNAL_ID_COLUMNS:
+                journal_id = row[column]
+                if isinstance(journal_id, str):
+                    self._asjc_codes_by_journal_id.setdefault(self._normalized_journal_id(journal_id), asjc_codes)
+
+        for row in self.asjc_classification_mapping.to_dict('records'):
+            self._classification_by_asjc[int(row['Code'])] = JournalClassification(top=row['Top'], mid=row['Middle'], low=row['Low'])
+
+    def _normalized_title(self, journal_title: str) -> str:
+        journal_title = journal_title.replace('&', ' and ')
+        return ' '.join(journal_title.split()).casefold()
+
+    def _normalized_journal_id(self, journal_id: str) -> str:
+        return journal_id.strip().replace('-', '').upper()
 
 class OneLineDescription:
     pass
@@ -1,8 +1,4 @@
 import argparse
-from concurrent.futures import ThreadPoolExecutor
-
-from DBClient import SearchEngine
-from AuthorFinderApp import AuthorFinderApp
 import csv
 from typing import List
 
@@ -38,10 +34,8 @@ def run_cli():
     parser.add_argument(
         '-n', '--n-top-entries', dest='n_top_entries', type=int, default=20_000,
         help='specify how many entries you want to retrieve. '\
-            "It's only available under Boolean Search. "\
             'If larger than the total results, will return all results. '\
-            'Under Vector Search, this argument will be ignored. '\
-            'Default 500 for each search engine')
+            'Default 20000 for each search engine')
     
     parser.add_argument(
         '-a', '--ask-before-retrieval', 
@@ -51,6 +45,13 @@ def run_cli():
             'It will ask the user if they want to proceed with the generated query.'\
             'Default false')
     
+    parser.add_argument(
+        '-r', '--resume', action="store_true",
+        help='first finish the Boolean Search retrievals that were interrupted, '\
+            'e.g. by a network error or an exhausted quota, from their last checkpoint. '\
+            'Can be used without url or csv filepath.'
+    )
+
     parser.add_argument(
         '-q', '--quiet', action="store_true", 
         help='mute info'
@@ -62,13 +63,21 @@ def run_cli():
     except argparse.ArgumentTypeError as e:
         raise ValueError(f"Invalid argument: {e}")
     
-    if (args.csv_filepath is None) and (args.url is None):
+    if (args.csv_filepath is None) and (args.url is None) and (not args.resume):
         raise ValueError(f"Missing argument url or csv filepath.")
     
     if (args.csv_filepath is not  None) and (args.url is not None):
         raise ValueError(f"Specified both url and csv filepath. '\
                          'Please only use one option.")
 
+    if (args.csv_filepath is not None) and args.ask_before_retrieval:
+        raise ValueError(f"ask before retrieval is only available with a url, not with a csv filepath.")
+
+    # the app pulls in pandas, langchain, openai..., so only import it once the arguments are fine
+    from DBClient import SearchEngine
+    from AuthorFinderApp import AuthorFinderApp
+    from BatchRunner import AsyncBatchRunner
+
     search_engine: SearchEngine = None
     if args.search_engine == 'boolean':
         search_engine = SearchEngine.BooleanSearch
@@ -79,29 +88,26 @@ def run_cli():
                'It should be 'boolean' or 'vector'")
         exit(1)
 
-    
+    if args.resume:
+        _resume(quiet=args.quiet)
+
     if args.csv_filepath is not None:
         urls = _get_urls_from_csv(filepath=args.csv_filepath)
         app = AuthorFinderApp()
-
-        def _run_app(url, search_engine, n_top_entries, ask_before_retrieval, quiet):
-            try: 
-                app.start(landing_page_url=url, 
-                        use=search_engine, 
-                        n_top_entries=n_top_entries, 
-                        ask_before_retrieval=ask_before_retrieval,
-                        quiet=quiet )
-            except Exception as e:
-                print(e)
-
-        with ThreadPoolExecutor(max_workers=6) as executor:
-            futures = [executor.submit(_run_app, url, search_engine, args.n_top_entries, args.ask_before_retrieval, args.quiet) for url in urls]
-            processed_queries = []
-            for future in futures:
-                result = future.result()
-                if result:
-                    processed_queries.append(result)
-                    print(f"processed: {len(processed_queries)}/{len(urls)}")
+        runner = AsyncBatchRunner(app)
+        results = runner.run(urls, use=search_engine, n_top_entries=args.n_top_entries)
+        n_processed = 0
+        for result in results:
+            if result.succeeded:
+                n_processed += 1
+            if args.quiet:
+                continue
+            if result.succeeded:
+                print(f"{result.url}\n  got {result.n_results} results, {result.n_authors} authors in {result.timings['total']:.1f}s")
+                print(f"  shortlist: {result.shortlist_filepath}")
+            else:
+                print(f"{result.url}\n  failed after {result.timings['total']:.1f}s: {result.error}")
+        print(f"processed: {n_processed}/{len(urls)}")
         
 
     if args.url is not None:
@@ -116,6 +122,24 @@ def run_cli():
             print(e)
 
 
+def _resume(quiet: bool = False) -> None:
+    from AuthorFinderApp import AuthorFinderApp
+
+    app = AuthorFinderApp()
+    boolean_strings = app.get_interrupted_boolean_strings()
+    n_resumed = 0
+    for boolean_string in boolean_strings:
+        try:
+            result = app.resume_boolean_entries(boolean_string)
+            n_resumed += 1
+            if not quiet:
+                print(f"{boolean_string}\n  resumed, got {result.n_results} results, {result.n_authors} authors")
+        except Exception as e:
+            print(f"{boolean_string}\n  failed to resume: {e}")
+    app.dbClient.flush()
+    print(f"resumed: {n_resumed}/{len(boolean_strings)}")
+
+
 def _get_urls_from_csv(filepath: str) -> List[str]:
     with open(filepath, newline='') as csvfile:
         reader = csv.reader(csvfile)
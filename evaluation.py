@@ -1,20 +1,16 @@
 import hashlib
+import itertools
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
 import pandas as pd
-from typing import List, Tuple
+from typing import Callable, List, Tuple
 
 from JsonIO import BooleanStringJsonIO, SiBooleanStringMappingJsonIO, VectorQueryJsonIO, SIVectorQueryMappingJsonIO
+from Config import Config
 
 def get_boolean_string_query_ids(url: str) -> List[str]:
     json_io = SiBooleanStringMappingJsonIO()
-    data = json_io.read()
-    entries = data['mappings']
-    entry = json_io._get_entry(url, from_entries=entries)
-    special_issue_id_not_exists = (len(entry) == 0)
-    if special_issue_id_not_exists:
-        return []
-    entry = entry[0]
-    boolean_strings = entry['boolean_strings']
-    return boolean_strings
+    return json_io.get_boolean_strings(url)
 
 def get_boolean_string_eids(boolean_string: str) -> List[str]:
     json_io = BooleanStringJsonIO()
@@ -23,15 +19,7 @@ def get_boolean_string_eids(boolean_string: str) -> List[str]:
 
 def get_vector_string_query_ids(url: str) -> List[str]:
     json_io = SIVectorQueryMappingJsonIO()
-    data = json_io.read()
-    entries = data['mappings']
-    entry = [entry for entry in entries if entry["url"] == url]
-    special_issue_id_not_exists = (len(entry) == 0)
-    if special_issue_id_not_exists:
-        return []
-    entry = entry[0]
-    query_strings = entry['query_strings']
-    return query_strings
+    return json_io.get_query_strings(url)
 
 def get_vector_string_query_eids(vector_string: str) -> List[str]:
     json_io = VectorQueryJsonIO()
@@ -44,72 +32,60 @@ def _to_query_id(boolean_string: str) -> str:
     return str(m.hexdigest())[:12]
 
 def get_boolean_string_result_df(filepath: str):
-
     # COLUMNS = ['SPECIAL_ISSUE_ID', 'JOURNAL_ACRONYM', 'ASJC_CORE', 'LANDING_PAGE_URL']
     input_df = pd.read_csv(filepath)
-
-    processed_input_df = input_df[['SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL']]
-
-    ## 'SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', 'QUERY_ID'
-    siid_qid_map_list = []
-    for _, row in processed_input_df.iterrows():
-        special_issue_id = row['SPECIAL_ISSUE_ID']
-        url = row['LANDING_PAGE_URL']
-        boolean_strings = get_boolean_string_query_ids(url)
-        siid_qid_map = {
-            'SPECIAL_ISSUE_ID': special_issue_id,
-            'LANDING_PAGE_URL': url,
-            'boolean_strings': boolean_strings
-        }
-        siid_qid_map_list.append(siid_qid_map)
-    siid_qid_map_df = pd.DataFrame(siid_qid_map_list)
-    siid_qid_map_df = siid_qid_map_df.dropna()
-    ssid_qid_long_mappings = siid_qid_map_df.explode('boolean_strings').rename(columns={'boolean_strings': 'BOOLEAN_STRING'})
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings['QUERY_ID'] = ssid_qid_long_mappings['BOOLEAN_STRING'].apply(lambda s: _to_query_id(s))
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings['eids'] = ssid_qid_long_mappings['BOOLEAN_STRING'].apply(lambda s: get_boolean_string_eids(s))
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings = ssid_qid_long_mappings.explode('eids').rename(columns={'eids': 'EID'})
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings = ssid_qid_long_mappings.reset_index()
-
-    # COLUMNS = ['SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', 'BOOLEAN_STRING', 'QUERY_ID', 'EID']
-    return ssid_qid_long_mappings
+    url_queries = SiBooleanStringMappingJsonIO().get_url_boolean_string_pairs()
+    json_io = BooleanStringJsonIO()
+    # COLUMNS = ['index', 'SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', 'BOOLEAN_STRING', 'QUERY_ID', 'EID']
+    return _get_result_df(input_df, url_queries, 'BOOLEAN_STRING', json_io.get_eids)
 
 def get_vector_query_result_df(filepath: str):
-
     # COLUMNS = ['SPECIAL_ISSUE_ID', 'JOURNAL_ACRONYM', 'ASJC_CORE', 'LANDING_PAGE_URL']
     input_df = pd.read_csv(filepath)
+    url_queries = SIVectorQueryMappingJsonIO().get_url_query_string_pairs()
+    json_io = VectorQueryJsonIO()
 
-    processed_input_df = input_df[['SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL']]
-
-    ## 'SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', 'QUERY_ID'
-    siid_qid_map_list = []
-    for _, row in processed_input_df.iterrows():
-        special_issue_id = row['SPECIAL_ISSUE_ID']
-        url = row['LANDING_PAGE_URL']
-        vector_strings = get_vector_string_query_ids(url)
-        siid_qid_map = {
-            'SPECIAL_ISSUE_ID': special_issue_id,
-            'LANDING_PAGE_URL': url,
-            'vector_strings': vector_strings
-        }
-        siid_qid_map_list.append(siid_qid_map)
-    siid_qid_map_df = pd.DataFrame(siid_qid_map_list)
-    siid_qid_map_df = siid_qid_map_df.dropna()
-    ssid_qid_long_mappings = siid_qid_map_df.explode('vector_strings').rename(columns={'vector_strings': 'VECTOR_STRING'})
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings['QUERY_ID'] = ssid_qid_long_mappings['VECTOR_STRING'].apply(lambda s: _to_query_id(s))
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings['eids'] = ssid_qid_long_mappings['VECTOR_STRING'].apply(lambda s: get_vector_string_query_eids(s))
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings = ssid_qid_long_mappings.explode('eids').rename(columns={'eids': 'EID'})
-    ssid_qid_long_mappings = ssid_qid_long_mappings.dropna()
-    ssid_qid_long_mappings = ssid_qid_long_mappings.reset_index()
-
-    # COLUMNS = ['SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', 'BOOLEAN_STRING', 'QUERY_ID', 'EID']
-    return ssid_qid_long_mappings
+    def _get_eids(vector_string: str) -> List[str]:
+        try:
+            return json_io.get_eids(vector_string)
+        except FileNotFoundError:
+            return []
+
+    # COLUMNS = ['index', 'SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', 'VECTOR_STRING', 'QUERY_ID', 'EID']
+    return _get_result_df(input_df, url_queries, 'VECTOR_STRING', _get_eids)
+
+def _get_result_df(input_df: pd.DataFrame,
+                   url_queries: List[Tuple[str, str]],
+                   query_column: str,
+                   get_eids: Callable[[str], List[str]]) -> pd.DataFrame:
+    """
+    Long table of the eids retrieved for each special issue, one row per
+    (special issue, query, eid), built with joins instead of a lookup per row.
+    The mappings come in one read of the mapping store, and the eids of each distinct query
+    are read once, from Config.EVALUATION_READ_WORKERS threads.
+    :param url_queries: (landing page url, query) mappings of the search engine
+    :param get_eids: eids of a query, in rank order
+    """
+    ## 'index', 'SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL'
+    processed_input_df = input_df[['SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL']].dropna().reset_index()
+
+    ## 'index', 'SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', query_column
+    mapping_df = pd.DataFrame(url_queries, columns=['LANDING_PAGE_URL', query_column])
+    siid_query_df = processed_input_df.merge(mapping_df, on='LANDING_PAGE_URL', how='inner')
+
+    ## query_column, 'QUERY_ID', 'EID'
+    queries = siid_query_df[query_column].drop_duplicates().tolist()
+    with ThreadPoolExecutor(max_workers=Config.EVALUATION_READ_WORKERS) as executor:
+        eids_per_query = list(executor.map(get_eids, queries))
+    n_eids = np.fromiter((len(eids) for eids in eids_per_query), dtype=np.int64, count=len(queries))
+    query_eid_df = pd.DataFrame({
+        query_column: np.repeat(np.array(queries, dtype=object), n_eids),
+        'QUERY_ID': np.repeat(np.array([_to_query_id(query) for query in queries], dtype=object), n_eids),
+        'EID': np.fromiter(itertools.chain.from_iterable(eids_per_query), dtype=object, count=int(n_eids.sum())),
+    })
+
+    ssid_qid_long_mappings = siid_query_df.merge(query_eid_df, on=query_column, how='inner')
+    return ssid_qid_long_mappings[['index', 'SPECIAL_ISSUE_ID', 'LANDING_PAGE_URL', query_column, 'QUERY_ID', 'EID']]
 
 
 #####################################################################################